@@ -0,0 +1,199 @@
+"""
+
+Created on: 10/16/2026
+
+This module contains the batch processing of a whole acquisition directory. Run files are discovered under a directory
+tree and each of them is read, filtered, annotated and isotope corrected in a pool of worker processes.
+"""
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from .file_directory_parser import (concat_chunks, discover_run_files, get_intensity_columns, process_file_in_chunks,
+                                    sniff_dtype_schema)
+from .isotopic_corrections import isotopic_correction
+from .molecules_parser import MassPairIndex
+
+# The outcome of processing one run file: 'result' is the processed DataFrame, or None when 'error' (a traceback
+# string) is set.
+BatchResult = namedtuple('BatchResult', ['file_path', 'result', 'error'])
+
+# The state of a worker process, set once per process by _initialize_worker()
+_worker_state = dict()
+
+
+class SharedMassPairLibrary(object):
+    """
+    The precursor masses, fragment masses and names of a MassPairIndex, stored in one block of shared memory. Worker
+    processes attach to the block and rebuild the index on top of it, instead of receiving a pickled copy of the library
+    with every task. Only the 'lipid_name', 'precursor' and 'fragment' columns of the library are shared.
+    The block layout is: precursor (float64 x M), fragment (float64 x M), name codes (int64 x M), name offsets
+    (int64 x U + 1) and the UTF-8 bytes of the U distinct names.
+    """
+
+    def __init__(self, mass_pair_index=None):
+        """
+        :param mass_pair_index: The MassPairIndex to share.
+        """
+        if mass_pair_index is None:
+            raise ValueError("The 'mass_pair_index' parameter must be specified!")
+        library = mass_pair_index.library
+        codes, uniques = pd.factorize(library['lipid_name'])
+        encoded = [str(name).encode('utf-8') for name in uniques]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(name) for name in encoded])
+        n_pairs = len(library)
+        self._shared = shared_memory.SharedMemory(create=True, size=max(8 * (3 * n_pairs + len(offsets)) + int(offsets[-1]), 1))
+        precursor, fragment, shared_codes, shared_offsets, name_bytes = _get_views(self._shared.buf, n_pairs,
+                                                                                   len(encoded), int(offsets[-1]))
+        precursor[:] = library['precursor'].to_numpy(dtype=np.float64)
+        fragment[:] = library['fragment'].to_numpy(dtype=np.float64)
+        shared_codes[:] = codes
+        shared_offsets[:] = offsets
+        name_bytes[:] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        # everything a worker needs to attach to the block
+        self.spec = (self._shared.name, n_pairs, len(encoded), int(offsets[-1]))
+
+    def close(self):
+        """
+        This method releases and removes the shared memory block. Workers must not use it afterwards.
+        :return: None
+        """
+        self._shared.close()
+        self._shared.unlink()
+
+    @staticmethod
+    def attach(spec=None):
+        """
+        This method attaches to a shared library block and rebuilds a MassPairIndex whose masses are backed by it.
+        :param spec: The 'spec' of a SharedMassPairLibrary.
+        :return: A (SharedMemory, MassPairIndex) tuple. The SharedMemory must be kept alive while the index is used.
+        """
+        if spec is None:
+            raise ValueError("The 'spec' parameter must be specified!")
+        name, n_pairs, n_names, n_bytes = spec
+        shared = shared_memory.SharedMemory(name=name)
+        precursor, fragment, codes, offsets, name_bytes = _get_views(shared.buf, n_pairs, n_names, n_bytes)
+        raw = name_bytes.tobytes()
+        names = [raw[start:stop].decode('utf-8') for start, stop in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+        library = pd.DataFrame({'lipid_name': pd.Categorical.from_codes(codes, categories=names),
+                                'precursor': precursor, 'fragment': fragment}, copy=False)
+        return shared, MassPairIndex.from_sorted_library(library)
+
+
+class BatchRunner(object):
+    """
+    A runner that processes every run file of an acquisition directory in a pool of worker processes. Each file is read
+    chunk by chunk and filtered with a FilterPipeline, its mass pairs are named with a MassPairIndex, and its intensities
+    are isotope corrected. The library is shared with the workers through shared memory, results are yielded in
+    completion order, and an error in one file does not stop the processing of the others.
+    """
+
+    def __init__(self, mass_pair_index=None, pipeline=None, sample_columns=None, annotate_kwargs=None,
+                 correction_kwargs=None, correct_isotopes=True, max_workers=None, chunk_size=100000):
+        """
+        :param mass_pair_index: The MassPairIndex used to name the mass pairs of every file.
+        :param pipeline: An optional FilterPipeline applied to every chunk of every file.
+        :param sample_columns: A list of column names that contain the intensities of each sample. The default is None,
+        which means the intensity columns of the dtype schema sniffed from each file (see
+        file_directory_parser.get_intensity_columns()), so integer columns such as 'scan' are not corrected.
+        :param annotate_kwargs: A dictionary of keyword arguments for MassPairIndex.assign_names(), ex: tolerances.
+        :param correction_kwargs: A dictionary of keyword arguments for isotopic_corrections.isotopic_correction().
+        :param correct_isotopes: Whether the isotopic correction is performed.
+        :param max_workers: The number of worker processes. The default is None for the number of CPUs.
+        :param chunk_size: See file_directory_parser.read_data_in_chunks().
+        """
+        if mass_pair_index is None:
+            raise ValueError("The 'mass_pair_index' parameter must be specified!")
+        self.mass_pair_index = mass_pair_index
+        self.max_workers = max_workers
+        self._settings = {'pipeline': pipeline,
+                          'sample_columns': sample_columns,
+                          'annotate_kwargs': dict(annotate_kwargs or {}),
+                          'correction_kwargs': dict(correction_kwargs or {}),
+                          'correct_isotopes': correct_isotopes,
+                          'chunk_size': chunk_size}
+
+    def run(self, dir_path=None, file_paths=None, progress=None):
+        """
+        This method processes run files and yields their results as soon as each of them is done.
+        :param dir_path: The absolute path to an acquisition directory, its run files are discovered recursively.
+        :param file_paths: A list of absolute file paths, used instead of 'dir_path'.
+        :param progress: An optional function called after each file with (n_done, n_total, BatchResult) arguments.
+        :return: A generator of BatchResult, in completion order.
+        """
+        if dir_path is None and file_paths is None:
+            raise ValueError("Either 'dir_path' or 'file_paths' parameter must be specified!")
+        if file_paths is None:
+            file_paths = discover_run_files(dir_path)
+        shared_library = SharedMassPairLibrary(self.mass_pair_index)
+        executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_initialize_worker,
+                                       initargs=(shared_library.spec, self._settings))
+        futures = dict()
+        try:
+            futures = {executor.submit(_process_file, file_path): file_path for file_path in file_paths}
+            for n_done, future in enumerate(as_completed(futures), 1):
+                try:
+                    result = future.result()
+                except Exception:
+                    # the worker itself failed (ex: it was killed), not only the processing of the file
+                    result = BatchResult(futures[future], None, traceback.format_exc())
+                if progress is not None:
+                    progress(n_done, len(futures), result)
+                yield result
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+            shared_library.close()
+
+
+#--------------------------------------------------- helper methods----------------------------------------------//
+
+def _get_views(buffer, n_pairs, n_names, n_bytes):
+    """
+    A helper method for 'SharedMassPairLibrary', it returns numpy views of the arrays stored in a shared memory buffer.
+    """
+    int64_count = 3 * n_pairs + n_names + 1
+    numbers = np.frombuffer(buffer, dtype=np.int64, count=int64_count)
+    precursor = numbers[:n_pairs].view(np.float64)
+    fragment = numbers[n_pairs:2 * n_pairs].view(np.float64)
+    codes = numbers[2 * n_pairs:3 * n_pairs]
+    offsets = numbers[3 * n_pairs:]
+    name_bytes = np.frombuffer(buffer, dtype=np.uint8, count=n_bytes, offset=8 * int64_count)
+    return precursor, fragment, codes, offsets, name_bytes
+
+
+def _initialize_worker(spec, settings):
+    """
+    A helper method for 'BatchRunner', it attaches a worker process to the shared library once.
+    """
+    shared, mass_pair_index = SharedMassPairLibrary.attach(spec)
+    _worker_state.update(settings)
+    _worker_state['shared'] = shared
+    _worker_state['mass_pair_index'] = mass_pair_index
+
+
+def _process_file(file_path):
+    """
+    A helper method for 'BatchRunner', it reads, filters, annotates and isotope corrects one run file in a worker.
+    :return: A BatchResult.
+    """
+    try:
+        pipeline = _worker_state['pipeline']
+        function = pipeline.apply if pipeline is not None else (lambda chunk: chunk)
+        dataframe = concat_chunks(process_file_in_chunks(file_path, function, chunk_size=_worker_state['chunk_size']))
+        named = _worker_state['mass_pair_index'].assign_names(dataframe, **_worker_state['annotate_kwargs'])
+        if _worker_state['correct_isotopes']:
+            sample_columns = _worker_state['sample_columns']
+            if sample_columns is None:
+                sample_columns = [column for column in get_intensity_columns(sniff_dtype_schema(file_path))
+                                  if column in named]
+            named = isotopic_correction(named, sample_columns=sample_columns, **_worker_state['correction_kwargs'])
+        return BatchResult(file_path, named, None)
+    except Exception:
+        return BatchResult(file_path, None, traceback.format_exc())
@@ -0,0 +1,227 @@
+"""
+
+Created on: 10/16/2026
+
+This module contains a common interface to load the lipid intensities into a database server of each lab's choosing.
+Any DB-API 2 driver module can be used (ex: sqlite3, pymysql, MySQLdb, psycopg2); SQLite is convenient for local use.
+"""
+import queue
+import re
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# The dialect of the upsert statement of every known driver module
+DRIVER_DIALECTS = {'sqlite3': 'sqlite', 'pysqlite2': 'sqlite',
+                   'psycopg2': 'postgresql', 'psycopg': 'postgresql', 'pg8000': 'postgresql',
+                   'MySQLdb': 'mysql', 'pymysql': 'mysql', 'mysql': 'mysql', 'mariadb': 'mysql'}
+_IDENTIFIER_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+class ConnectionPool(object):
+    """
+    A thread-safe pool of database connections. Connections are opened on demand, up to 'max_size' of them, and reused
+    afterwards; when all of them are in use, acquire() waits for one to be released. A connection is only used by one
+    thread at a time, but may be used by different threads over its life: sqlite3 connections are therefore opened
+    with check_same_thread=False, unless 'check_same_thread' is given.
+        pool = ConnectionPool(sqlite3, max_size=2, database='results.db')
+        with pool.connection() as connection:
+            ...
+    """
+
+    def __init__(self, driver=None, max_size=4, **connect_kwargs):
+        """
+        :param driver: A DB-API 2 driver module, ex: sqlite3 or pymysql.
+        :param max_size: The maximum number of open connections.
+        :param connect_kwargs: The keyword arguments of driver.connect(), ex: database, host, user, password.
+        """
+        if driver is None:
+            raise ValueError("The 'driver' parameter must be specified!")
+        if max_size < 1:
+            raise ValueError("The 'max_size' parameter must be at least 1!")
+        self.driver = driver
+        self.max_size = max_size
+        self.connect_kwargs = connect_kwargs
+        if driver.__name__.split('.')[0] in ('sqlite3', 'pysqlite2'):
+            # sqlite3 refuses by default connections created in another thread, which pooled connections are
+            self.connect_kwargs.setdefault('check_same_thread', False)
+        self.paramstyle = getattr(driver, 'paramstyle', 'qmark')
+        self.dialect = DRIVER_DIALECTS.get(driver.__name__.split('.')[0])
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._n_open = 0
+
+    def acquire(self, timeout=None):
+        """
+        This method returns an idle connection, opening a new one if the pool is not full.
+        :param timeout: The number of seconds to wait for a connection when the pool is full, None to wait forever.
+        :return: A DB-API 2 connection, to be given back with release().
+        """
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_open = self._n_open < self.max_size
+            if can_open:
+                self._n_open = self._n_open + 1
+        if can_open:
+            try:
+                return self.driver.connect(**self.connect_kwargs)
+            except Exception:
+                with self._lock:
+                    self._n_open = self._n_open - 1
+                raise
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError('No database connection was released within %s seconds' % timeout)
+
+    def release(self, connection=None):
+        """
+        This method gives a connection back to the pool.
+        :param connection: A connection returned by acquire().
+        :return: None
+        """
+        if connection is None:
+            raise ValueError("The 'connection' parameter must be specified!")
+        self._idle.put(connection)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        A context manager that acquires a connection and releases it on exit. An open transaction is rolled back when
+        an exception is raised.
+        :param timeout: See acquire().
+        """
+        connection = self.acquire(timeout=timeout)
+        try:
+            yield connection
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            self.release(connection)
+
+    def close(self):
+        """
+        This method closes every idle connection of the pool.
+        :return: None
+        """
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            connection.close()
+            with self._lock:
+                self._n_open = self._n_open - 1
+
+
+class IntensityLoader(object):
+    """
+    A loader of lipid intensities into a table keyed by (lipid name, sample). The wide DataFrames produced by the API,
+    with one column per sample, are melted into (lipid_name, sample, intensity) rows, and written in batches with
+    executemany() inside one transaction per load. Rows already in the table are updated (upsert), so loading the
+    results of a run again replaces its values instead of failing or duplicating them.
+    """
+
+    def __init__(self, pool=None, table='lipid_intensities', batch_size=50000, dialect=None):
+        """
+        :param pool: A ConnectionPool.
+        :param table: The name of the table.
+        :param batch_size: The number of rows sent with each executemany() call.
+        :param dialect: One of 'sqlite', 'postgresql' or 'mysql'. The default is None, which means the dialect of the
+        driver of the pool.
+        """
+        if pool is None:
+            raise ValueError("The 'pool' parameter must be specified!")
+        if not _IDENTIFIER_PATTERN.match(table):
+            raise ValueError('Invalid table name: %s' % table)
+        self.pool = pool
+        self.table = table
+        self.batch_size = batch_size
+        self.dialect = dialect or pool.dialect
+        if self.dialect not in ('sqlite', 'postgresql', 'mysql'):
+            raise ValueError("Unknown database dialect: %s, please specify the 'dialect' parameter!" % self.dialect)
+
+    def create_table(self, name_length=255):
+        """
+        This method creates the table if it does not exist.
+        :param name_length: The maximum length of lipid and sample names.
+        :return: This loader.
+        """
+        statement = ('CREATE TABLE IF NOT EXISTS %s (lipid_name VARCHAR(%d) NOT NULL, sample VARCHAR(%d) NOT NULL, '
+                     'intensity DOUBLE PRECISION, PRIMARY KEY (lipid_name, sample))' % (self.table, name_length,
+                                                                                        name_length))
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(statement)
+            cursor.close()
+            connection.commit()
+        return self
+
+    def load(self, dataframe=None, sample_columns=None, name_column='lipid_name'):
+        """
+        This method upserts the intensities of a DataFrame. Rows without a lipid name and missing intensities are not
+        loaded, and the intensities of rows sharing a lipid name (ex: several fragments of a lipid) are summed.
+        Either every row is loaded or, on error, none of them.
+        :param dataframe: A pandas.DataFrame of named lipids and their intensities, ex: the output of isotopic_correction().
+        :param sample_columns: A list of column names that contain the intensities of each sample.
+        :param name_column: A string column name where the lipid names can be found.
+        :return: The number of (lipid name, sample) rows written.
+        """
+        if dataframe is None or sample_columns is None:
+            raise ValueError("Both 'dataframe' and 'sample_columns' parameters must be specified!")
+        names, samples, intensities = _melt_intensities(dataframe, sample_columns, name_column)
+        statement = self._upsert_statement()
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            for start in range(0, len(names), self.batch_size):
+                stop = start + self.batch_size
+                cursor.executemany(statement, list(zip(names[start:stop], samples[start:stop],
+                                                       intensities[start:stop])))
+            cursor.close()
+            connection.commit()
+        return len(names)
+
+    def _upsert_statement(self):
+        placeholders = _get_placeholders(self.pool.paramstyle, 3)
+        insert = 'INSERT INTO %s (lipid_name, sample, intensity) VALUES (%s)' % (self.table, placeholders)
+        if self.dialect == 'mysql':
+            return insert + ' ON DUPLICATE KEY UPDATE intensity = VALUES(intensity)'
+        return insert + ' ON CONFLICT (lipid_name, sample) DO UPDATE SET intensity = excluded.intensity'
+
+
+#--------------------------------------------------- helper methods----------------------------------------------//
+
+def _get_placeholders(paramstyle, n_parameters):
+    """
+    A helper method for 'IntensityLoader', it returns the comma separated placeholders of positional parameters.
+    """
+    if paramstyle == 'qmark':
+        return ', '.join(['?'] * n_parameters)
+    if paramstyle in ('format', 'pyformat'):
+        return ', '.join(['%s'] * n_parameters)
+    if paramstyle == 'numeric':
+        return ', '.join(':%d' % (position + 1) for position in range(n_parameters))
+    raise ValueError('Unsupported driver paramstyle: %s' % paramstyle)
+
+
+def _melt_intensities(dataframe, sample_columns, name_column):
+    """
+    A helper method for 'IntensityLoader', it returns the lipid names, sample names and intensities of every non missing
+    intensity as three lists of Python objects, with the intensities summed per lipid name.
+    """
+    names = dataframe[name_column]
+    named = pd.notnull(names).to_numpy()
+    codes, uniques = pd.factorize(names[named])
+    # min_count=1 keeps a lipid missing in a sample where all its intensities are missing
+    summed = pd.DataFrame(dataframe[sample_columns].to_numpy(dtype=np.float64)[named]).groupby(codes).sum(min_count=1)
+    values = summed.to_numpy()
+    rows, columns = np.nonzero(pd.notnull(values))
+    return (np.asarray(uniques, dtype=object)[summed.index.to_numpy()[rows]].astype(str).tolist(),
+            np.asarray([str(column) for column in sample_columns], dtype=object)[columns].tolist(),
+            values[rows, columns].tolist())
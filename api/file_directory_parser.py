@@ -5,9 +5,19 @@ Author: Cat Tran
 Description: In general, this module contains the functions that help reading/parsing/listing files and directories.
 
 """
+import itertools
 import os
 
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Default column names of the mass and identifier columns of an instrument export
+MASS_COLUMNS = ('precursor', 'fragment', 'neutral_loss')
+ID_COLUMNS = ('lipid_name', 'name', 'formula')
+# The number of rows read to find the text columns of a file, when no dtype schema is given
+SNIFF_ROWS = 1000
+
 
 def read_data_from_file(file_path):
     """
@@ -19,21 +29,186 @@ def read_data_from_file(file_path):
     """
     dataframe = None
     if file_path.endswith('.csv'):
-        dataframe = pd.read_csv()
-    elif file_path.endswith('xlsx'):
-        dataframe = pd.read_excel()
+        dataframe = pd.read_csv(file_path)
+    elif file_path.endswith('.xlsx'):
+        dataframe = pd.read_excel(file_path)
     else:
         raise IOError('File extension not supported')
     return dataframe
 
+def build_dtype_schema(columns=None, mass_columns=MASS_COLUMNS, id_columns=ID_COLUMNS, intensity_dtype=np.float32,
+                       sample=None):
+    """
+    This function builds an explicit dtype schema for the columns of an instrument export: mass columns are read as
+    float64 to keep their precision, identifier columns and other text columns (ex: polarity, adduct) as categories,
+    integer columns (ex: scan) as nullable integers ('Int64'), and all other columns (the sample intensities) as
+    'intensity_dtype', which halves the memory of the intensity block by default.
+    :param columns: A list of the column names of the export. The default is None, which means the columns of 'sample'.
+    :param mass_columns: Column names that contain masses. Names not in 'columns' are ignored.
+    :param id_columns: Column names that contain identifiers (names, formulas...). Names not in 'columns' are ignored.
+    :param intensity_dtype: The dtype of the remaining numeric columns.
+    :param sample: An optional pandas.DataFrame of the first rows of the export. Its columns that are not numeric are
+    read as categories, its integer columns as 'Int64', and its columns without any value are left out of the schema,
+    so pandas infers their dtype from the data. Without a sample, every column that is neither a mass nor an identifier
+    column is an intensity column.
+    :return: A dictionary of column names and their dtypes, which can be passed to pandas.read_csv().
+    """
+    if columns is None:
+        if sample is None:
+            raise ValueError("Either 'columns' or 'sample' parameter must be specified!")
+        columns = list(sample.columns)
+    schema = dict()
+    for column in columns:
+        if column in mass_columns:
+            schema[column] = np.float64
+        elif column in id_columns:
+            schema[column] = 'category'
+        elif sample is not None and column in sample:
+            if sample[column].isna().all():
+                continue
+            if not pd.api.types.is_numeric_dtype(sample[column]) or pd.api.types.is_bool_dtype(sample[column]):
+                schema[column] = 'category'
+            elif pd.api.types.is_integer_dtype(sample[column]):
+                schema[column] = 'Int64'
+            else:
+                schema[column] = intensity_dtype
+        else:
+            schema[column] = intensity_dtype
+    return schema
+
+
+def sniff_dtype_schema(file_path, mass_columns=MASS_COLUMNS, id_columns=ID_COLUMNS):
+    """
+    This function builds the dtype schema of a file (excel or csv) from its first SNIFF_ROWS rows, the schema
+    read_data_in_chunks() starts with when no schema is given.
+    :param file_path: The absolute path string to file
+    :param mass_columns: See build_dtype_schema().
+    :param id_columns: See build_dtype_schema().
+    :return: A dictionary of column names and their dtypes, see build_dtype_schema().
+    :raise: raises exception when file extension is not *.csv or *.xlsx
+    """
+    if file_path.endswith('.csv'):
+        sample = pd.read_csv(file_path, nrows=SNIFF_ROWS)
+    elif file_path.endswith('.xlsx'):
+        sample = pd.read_excel(file_path, nrows=SNIFF_ROWS)
+    else:
+        raise IOError('File extension not supported')
+    return build_dtype_schema(mass_columns=mass_columns, id_columns=id_columns, sample=sample)
+
+
+def get_intensity_columns(dtype_schema=None, intensity_dtype=np.float32):
+    """
+    This function returns the intensity (sample) columns of a dtype schema built by build_dtype_schema(), that is the
+    columns given 'intensity_dtype'. Mass, identifier, text and integer columns (ex: scan) are left out.
+    :param dtype_schema: A dictionary of column names and their dtypes.
+    :param intensity_dtype: The dtype the schema gives to the intensity columns.
+    :return: A list of column names, in schema order.
+    """
+    if dtype_schema is None:
+        raise ValueError("The 'dtype_schema' parameter must be specified!")
+    return [column for column, dtype in dtype_schema.items()
+            if not isinstance(dtype, str) and np.dtype(dtype) == np.dtype(intensity_dtype)]
+
+
+def read_data_in_chunks(file_path, chunk_size=100000, dtype_schema=None, mass_columns=MASS_COLUMNS, id_columns=ID_COLUMNS):
+    """
+    This function reads a file (excel or csv) lazily and yields pandas.DataFrame() chunks of at most 'chunk_size' rows,
+    so files larger than memory can be processed with bounded memory. File extension must be either *.csv or *.xlsx!
+    :param file_path: The absolute path string to file
+    :param chunk_size: The maximum number of rows of each chunk.
+    :param dtype_schema: A dictionary of column names and their dtypes. The default is None, in which case the schema is
+    built from the first SNIFF_ROWS rows of the file with sniff_dtype_schema(). When a later chunk does not fit that
+    sniffed schema (ex: text in a column that was numeric in the first rows), the columns that do not fit are widened
+    (to float64, or to categories for text) and the rest of the file is read with the widened schema.
+    :param mass_columns: See build_dtype_schema(). Only used when 'dtype_schema' is None.
+    :param id_columns: See build_dtype_schema(). Only used when 'dtype_schema' is None.
+    :return: A generator of pandas.DataFrame objects.
+    :raise: raises exception when file extension is not one of these above
+    """
+    if file_path.endswith('.csv'):
+        sniffed = dtype_schema is None
+        if sniffed:
+            dtype_schema = sniff_dtype_schema(file_path, mass_columns=mass_columns, id_columns=id_columns)
+        rows_read = 0
+        while True:
+            # after a schema change, the reader starts again at the first row that was not yielded yet
+            start = rows_read
+            reader = pd.read_csv(file_path, dtype=dtype_schema, chunksize=chunk_size, skiprows=range(1, start + 1))
+            try:
+                for chunk in reader:
+                    if start:
+                        chunk.index = chunk.index + start
+                    rows_read = rows_read + len(chunk)
+                    yield chunk
+                return
+            except (ValueError, TypeError):
+                if not sniffed:
+                    raise
+                sample = pd.read_csv(file_path, skiprows=range(1, rows_read + 1), nrows=chunk_size)
+                widened = _widen_dtype_schema(dtype_schema, build_dtype_schema(mass_columns=mass_columns,
+                                                                               id_columns=id_columns, sample=sample))
+                if widened == dtype_schema:
+                    raise
+                dtype_schema = widened
+            finally:
+                reader.close()
+    elif file_path.endswith('.xlsx'):
+        for chunk in _read_xlsx_in_chunks(file_path, chunk_size, dtype_schema, mass_columns, id_columns):
+            yield chunk
+    else:
+        raise IOError('File extension not supported')
+
+
+def process_file_in_chunks(file_path, function=None, chunk_size=100000, dtype_schema=None):
+    """
+    This function reads a file chunk by chunk and yields the result of 'function' for each chunk. Since every filter of
+    api/filters.py only looks at the values of a row to decide whether that row is kept, filtering chunk by chunk gives
+    the same rows as filtering the whole file at once. Ex:
+        pipeline = FilterPipeline().neutral_loss().average_and_max(columns=samples)
+        filtered = concat_chunks(process_file_in_chunks(file_path, pipeline.apply))
+    :param file_path: The absolute path string to file
+    :param function: A function that accepts a pandas.DataFrame chunk and returns a pandas.DataFrame.
+    :param chunk_size: See read_data_in_chunks().
+    :param dtype_schema: See read_data_in_chunks().
+    :return: A generator of pandas.DataFrame objects.
+    """
+    if function is None:
+        raise ValueError("The 'function' parameter must be specified!")
+    for chunk in read_data_in_chunks(file_path, chunk_size=chunk_size, dtype_schema=dtype_schema):
+        yield function(chunk)
+
+
+def concat_chunks(chunks=None):
+    """
+    This function concatenates DataFrame chunks into one pandas.DataFrame(). Categorical columns are concatenated with
+    the union of the categories of every chunk, so they stay categorical instead of falling back to object columns.
+    :param chunks: An iterable of pandas.DataFrame objects that have the same columns.
+    :return: A new pandas.DataFrame.
+    """
+    if chunks is None:
+        raise ValueError("The 'chunks' parameter must be specified!")
+    chunks = list(chunks)
+    if len(chunks) == 0:
+        return pd.DataFrame()
+    categorical_columns = [column for column, dtype in chunks[0].dtypes.items() if isinstance(dtype, pd.CategoricalDtype)]
+    if categorical_columns:
+        for column in categorical_columns:
+            # chunks where the column is all missing have no categories, and their categories dtype (object) may not
+            # match the one of the other chunks (ex: str), so they are left out of the union
+            categoricals = [chunk[column] for chunk in chunks if len(chunk[column].cat.categories)]
+            categories = union_categoricals(categoricals).categories if categoricals else chunks[0][column].cat.categories
+            chunks = [chunk.assign(**{column: chunk[column].cat.set_categories(categories)}) for chunk in chunks]
+    return pd.concat(chunks)
+
+
 def list_files_in_directory(dir_path):
     """
     This function lists all files that live in a given directory
     :param dir_path: The absolute path to a directory
     :return: a list of file names
     """
-    file_names = os.walk(dir_path)[2]
-    return  file_names
+    file_names = next(os.walk(dir_path), (dir_path, [], []))[2]
+    return file_names
 
 def list_directories_in_directory(dir_path):
     """
@@ -41,6 +216,73 @@ def list_directories_in_directory(dir_path):
     :param dir_path: the parent directory
     :return: a list of sub directories
     """
-    sub_directory_names = os.walk(dir_path)[1]
+    sub_directory_names = next(os.walk(dir_path), (dir_path, [], []))[1]
     return sub_directory_names
 
+
+def discover_run_files(dir_path, extensions=('.csv', '.xlsx')):
+    """
+    This function lists all run files that live in a given directory and all of its sub directories.
+    :param dir_path: The absolute path to a directory
+    :param extensions: A tuple of file extensions of run files.
+    :return: A sorted list of absolute file paths
+    """
+    file_paths = []
+    for root, _, file_names in os.walk(dir_path):
+        file_paths.extend(os.path.join(root, file_name) for file_name in file_names if file_name.endswith(extensions))
+    return sorted(file_paths)
+
+
+#--------------------------------------------------- helper methods----------------------------------------------//
+
+def _read_xlsx_in_chunks(file_path, chunk_size, dtype_schema, mass_columns, id_columns):
+    """
+    A helper method for 'read_data_in_chunks()', it streams the rows of the first sheet of a xlsx file with openpyxl in
+    read-only mode, instead of loading the whole workbook.
+    """
+    import openpyxl
+
+    sniffed = dtype_schema is None
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = list(next(rows, ()))
+        buffered = []
+        row_number = 0
+        for row in itertools.chain(rows, [None]):
+            if row is not None:
+                buffered.append(row)
+            if len(buffered) == chunk_size or (row is None and buffered):
+                chunk = pd.DataFrame.from_records(buffered, columns=header,
+                                                  index=pd.RangeIndex(row_number, row_number + len(buffered)))
+                chunk_schema = build_dtype_schema(mass_columns=mass_columns, id_columns=id_columns, sample=chunk)
+                if dtype_schema is None:
+                    # the schema is built from the first chunk, which holds at least as many rows as a sample
+                    dtype_schema = chunk_schema
+                elif sniffed:
+                    # widen the columns of the sniffed schema that this chunk does not fit in
+                    dtype_schema = _widen_dtype_schema(dtype_schema, chunk_schema)
+                yield chunk.astype(dtype_schema)
+                row_number = row_number + len(buffered)
+                buffered = []
+    finally:
+        workbook.close()
+
+
+def _widen_dtype_schema(dtype_schema, sample_schema):
+    """
+    A helper method for 'read_data_in_chunks()', it returns a copy of a schema in which the columns whose dtype differs
+    from the schema of a later sample are widened: to categories when either dtype is a category, to float64 otherwise.
+    Columns that the sample has no value for, or that the schema leaves to pandas, are unchanged.
+    """
+    widened = dict(dtype_schema)
+    for column, dtype in sample_schema.items():
+        if column not in widened or pd.api.types.pandas_dtype(widened[column]) == pd.api.types.pandas_dtype(dtype):
+            continue
+        if 'category' in (widened[column], dtype):
+            widened[column] = 'category'
+        elif not (pd.api.types.is_float_dtype(pd.api.types.pandas_dtype(widened[column]))
+                  and pd.api.types.is_integer_dtype(pd.api.types.pandas_dtype(dtype))):
+            # integers fit in the float columns of the schema
+            widened[column] = np.float64
+    return widened
@@ -5,7 +5,9 @@ Created on: 09/27/2017
 
 A collections of common filters that are commonly used in lipidomics research.
 """
-import pandas as pd
+from functools import partial
+
+import numpy as np
 
 
 def set_baseline_to_value(dataframe=None, columns=None, rows=None, threshold=100, set_value=None):
@@ -13,7 +15,7 @@ def set_baseline_to_value(dataframe=None, columns=None, rows=None, threshold=100
     This function will take a DataFrame and check to see which value is under a threshold. If a value is under a threshold,
     it will set that value equal to set_value parameter. The columns, and rows in which values are checked can be specified.
     :param dataframe: The pandas DataFrame that hold values that we want to set a baseline.
-    :param columns: Columns that contains values to be checked.
+    :param columns: Columns that contains values to be checked. The default is None for all numeric columns.
     :param rows: Rows that contains values to be checked
     :param threshold: The threshold under which values will be set to set_value
     :param set_value: The value to set to for values that is under or equal to threshold.
@@ -22,9 +24,9 @@ def set_baseline_to_value(dataframe=None, columns=None, rows=None, threshold=100
     # Raise error when there's no dataframe
     if dataframe is None:
         raise ValueError("A dataframe parameter is required")
-    # use all dataframe columns if no columns parameter specified
+    # use all numeric columns if no columns parameter specified
     if columns is None:
-        columns = list(dataframe)
+        columns = list(dataframe.select_dtypes(include=[np.number]).columns)
     # use all rows if no rows parameter specified, currently all rows are considered
     if rows is None:
         pass
@@ -33,7 +35,7 @@ def set_baseline_to_value(dataframe=None, columns=None, rows=None, threshold=100
         set_value = threshold
 
     new_df = dataframe.copy()
-    new_df = new_df.where(new_df >= threshold, set_value, raise_on_error=False)
+    new_df[columns] = new_df[columns].where(new_df[columns] >= threshold, set_value)
     return new_df
 
 
@@ -49,8 +51,8 @@ def neutral_loss_filter(dataframe=None, nl_column='neutral_loss', threshold=0):
     if dataframe is None:
         raise ValueError("The 'dataframe' parameter containing a neutral loss column must be specified!")
 
-    new_df = dataframe.copy()   # make a copy to avoid modifying the original Dataframe
-    new_df = new_df[new_df[nl_column] >= threshold] # will potentially throw column not found or key-error error
+    # boolean indexing returns a new Dataframe, the original Dataframe is not modified
+    new_df = dataframe[dataframe[nl_column] >= threshold] # will potentially throw column not found or key-error error
     return new_df
 
 
@@ -68,12 +70,12 @@ def low_average_filter(dataframe=None, columns=None, threshold=100):
     if dataframe is None:
         raise ValueError("The 'dataframe' parameter containing numeric values must be specified!")
 
-    new_df = dataframe.copy()
     # If the default value of columns is None, all columns are considered
     if columns is None:
-        new_df = new_df.loc[new_df.mean(axis=1) >= threshold]
+        new_df = dataframe.loc[dataframe.mean(axis=1) >= threshold]
     else:
-        new_df = new_df.loc[new_df[columns].mean(axis=1) >= threshold]
+        column_groups = ColumnGroups(groups=[columns])
+        new_df = dataframe.loc[column_groups.means(column_groups.block(dataframe))[:, 0] >= threshold]
     return new_df
 
 
@@ -94,12 +96,13 @@ def average_and_max_filter(dataframe=None, columns=None, avg_threshold=100, max_
     if dataframe is None:
         raise ValueError("The 'dataframe' parameter containing numeric value to be filtered must be specified!")
 
-    new_df = dataframe.copy()
     # if columns is not specified, all columns in the dataframe are considered
     if columns is None:
-        new_df = new_df.loc[(new_df.mean(axis=1) >= avg_threshold) | (new_df.max(axis=1) >= max_threshold)]
+        new_df = dataframe.loc[(dataframe.mean(axis=1) >= avg_threshold) | (dataframe.max(axis=1) >= max_threshold)]
     else:
-        new_df = new_df.loc[(new_df[columns].mean(axis=1) >= avg_threshold) | (new_df[columns].max(axis=1) >= max_threshold)]
+        column_groups = ColumnGroups(groups=[columns])
+        values = column_groups.block(dataframe)
+        new_df = dataframe.loc[(column_groups.means(values)[:, 0] >= avg_threshold) | (column_groups.maxes(values)[:, 0] >= max_threshold)]
     return new_df
 
 
@@ -116,9 +119,9 @@ def low_average_group_filter(dataframe=None, groups=None, threshold=100):
     # This wrapper actually requires a group of column names
     if dataframe is None or groups is None:
         raise ValueError("The 'group' parameter must be specified!")
-    new_df = dataframe.copy()
-    temp = new_df.apply(lambda row: groups_average_boolean(row=row, groups=groups, threshold=threshold), axis=1)
-    return new_df.loc[temp]
+    column_groups = ColumnGroups(groups=groups)
+    kept = (column_groups.means(column_groups.block(dataframe)) >= threshold).any(axis=1)
+    return dataframe.loc[kept]
 
 
 def average_and_max_group_filter(dataframe=None, group=None, avg_threshold=100, max_threshold=300):
@@ -139,7 +142,7 @@ def child_peaks_filter(dataframe=None, child_peaks=[(1, 10)], neu_loss_col='neut
     """
     This method will filter out any rows that have neutral loss value falls between the 'child_peaks' parameter pair. As
     result, it will only return a new dataframe that contains only rows with neutral loss values that do not fall between
-    child_peaks parameter pair/s. The original dataframe is un-modified.
+    child_peaks parameter pair/s. The original row order is kept, and the original dataframe is un-modified.
     :param dataframe: An original dataframe that need child peaks filtered.
     :param child_peaks: A list of tuples that contains the range within which neutral loss values are filtered out.
     :param neu_loss_col: A string column name where the neutral loss values can be found.
@@ -147,12 +150,9 @@ def child_peaks_filter(dataframe=None, child_peaks=[(1, 10)], neu_loss_col='neut
     """
     if dataframe is None:
         raise ValueError("The 'dataframe' parameter must be specified!")
-    new_df = dataframe.copy()
-    # perform child peak filter for each of the (min,max) child peaks in the 'child_peaks' parameters
-    for pair in child_peaks:
-        # filter, and concatenate rows that have neutral loss above the max and rows that have neutral loss below the min
-        new_df = pd.concat([new_df[new_df[neu_loss_col] > max(pair)], new_df[new_df[neu_loss_col] < min(pair)]])
-    return  new_df
+    # merge the (min,max) child peaks into one interval set, and test every neutral loss value against it at once
+    new_df = IntervalSet(child_peaks).exclude(dataframe=dataframe, column=neu_loss_col)
+    return new_df
 
 
 
@@ -171,11 +171,371 @@ def group_quantile_filter(dataframe=None, group=None, quantile=0.3, threshold=10
         raise ValueError("Both 'dataframe' and 'groups' parameters must be specified!")
     if (quantile < 0 or quantile > 1):
         raise ValueError("The 'quantile' parameter must be within the range of [0, 1] (quantile = 0 or 1 is acceptable)!")
-    new_df = dataframe.copy()
-    new_df = new_df.loc[ (new_df[group] >= threshold).apply(lambda row: (row==True).sum()/len(row) >= quantile, axis=1) ]
+    column_groups = ColumnGroups(groups=[group])
+    new_df = dataframe.loc[column_groups.fractions_at_or_above(column_groups.block(dataframe), threshold)[:, 0] >= quantile]
     return new_df
 
 
+class IntervalSet(object):
+    """
+    A sorted set of non-overlapping closed mass intervals. The (min, max) pairs it is built from are merged once, so a
+    whole column of values is tested against every interval with a single numpy.searchsorted() pass. The same set can be
+    used as an inclusion or an exclusion window, on the neutral loss, precursor or fragment mass columns.
+    """
+
+    def __init__(self, intervals=None):
+        """
+        :param intervals: A list of (min, max) tuples. The order of the 2 values of a tuple does not matter, and
+        overlapping or touching intervals are merged.
+        """
+        if intervals is None:
+            raise ValueError("The 'intervals' parameter must be specified!")
+        bounds = np.array([(min(pair), max(pair)) for pair in intervals], dtype=np.float64).reshape(-1, 2)
+        bounds = bounds[np.argsort(bounds[:, 0], kind='stable')]
+        # an interval starts a new merged interval when it begins after the end of every interval before it
+        running_ends = np.maximum.accumulate(bounds[:, 1])
+        new_interval = np.ones(len(bounds), dtype=bool)
+        new_interval[1:] = bounds[1:, 0] > running_ends[:-1]
+        firsts = np.flatnonzero(new_interval)
+        self.starts = bounds[firsts, 0]
+        self.ends = np.maximum.reduceat(bounds[:, 1], firsts) if len(firsts) else bounds[:0, 1]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return iter(zip(self.starts.tolist(), self.ends.tolist()))
+
+    def contains(self, values=None):
+        """
+        This method tests which values fall within one of the intervals (bounds included).
+        :param values: A numpy array or pandas Series of numeric values.
+        :return: A numpy boolean array. Missing values are never contained.
+        """
+        if values is None:
+            raise ValueError("The 'values' parameter must be specified!")
+        values = np.asarray(values, dtype=np.float64)
+        # position of the last interval that starts at or before each value
+        positions = np.searchsorted(self.starts, values, side='right') - 1
+        if len(self.ends) == 0:
+            return np.zeros(values.shape, dtype=bool)
+        return (positions >= 0) & (values <= self.ends[np.maximum(positions, 0)])
+
+    def include(self, dataframe=None, column=None):
+        """
+        This method returns a new dataframe that only contains the rows whose value in 'column' falls within one of the
+        intervals. The original row order is kept, and the original dataframe is un-modified.
+        :param dataframe: A pandas Dataframe.
+        :param column: A string column name, ex: 'precursor' or 'fragment'.
+        :return: A new dataframe.
+        """
+        if dataframe is None or column is None:
+            raise ValueError("Both 'dataframe' and 'column' parameters must be specified!")
+        return dataframe.loc[self.contains(dataframe[column])]
+
+    def exclude(self, dataframe=None, column=None):
+        """
+        This method returns a new dataframe that only contains the rows whose value in 'column' does not fall within any
+        of the intervals. Rows with a missing value are dropped as well, since they cannot be tested. The original row
+        order is kept, and the original dataframe is un-modified.
+        :param dataframe: A pandas Dataframe.
+        :param column: A string column name, ex: 'neutral_loss', 'precursor' or 'fragment'.
+        :return: A new dataframe.
+        """
+        if dataframe is None or column is None:
+            raise ValueError("Both 'dataframe' and 'column' parameters must be specified!")
+        values = dataframe[column]
+        return dataframe.loc[values.notnull().values & ~self.contains(values)]
+
+
+class ColumnGroups(object):
+    """
+    A grouped reduction layer for the group based filters. Each group of columns is mapped to an array of positions in a
+    contiguous numpy block of intensities, and the groups are laid out next to each other so the mean, the max and the
+    fraction of values above a threshold of a group are computed for all rows with a single numpy reduction over a slice
+    of the block, instead of running a Python function for each row. Missing values are skipped like pandas does.
+    """
+
+    def __init__(self, groups=None, columns=None):
+        """
+        :param groups: A list of lists of group columns.
+        :param columns: A list of the columns of the numeric block the reductions will run on, in block order. The
+        default is None, which means the block holds the columns of all groups, in group order.
+        """
+        if groups is None:
+            raise ValueError("The 'groups' parameter must be specified!")
+        groups = [list(group) for group in groups]
+        if len(groups) == 0 or any(len(group) == 0 for group in groups):
+            raise ValueError("The 'groups' parameter must contain at least 1 group, and groups cannot be empty!")
+        if columns is None:
+            columns = []
+            for group in groups:
+                columns.extend(column for column in group if column not in columns)
+        self.groups = groups
+        self.columns = list(columns)
+        positions = {column: position for position, column in enumerate(self.columns)}
+        self._positions = np.array([positions[column] for group in groups for column in group], dtype=np.intp)
+        self._sizes = np.array([len(group) for group in groups], dtype=np.intp)
+        self._offsets = np.cumsum(self._sizes) - self._sizes
+        # when the groups already follow the block order, the block is reduced without gathering its columns
+        self._in_block_order = np.array_equal(self._positions, np.arange(len(self.columns)))
+
+    def block(self, dataframe=None):
+        """
+        This method reads the columns of the groups of a dataframe into a contiguous numeric block.
+        :param dataframe: A pandas Dataframe that contains the group columns.
+        :return: A 2D numpy float64 array, its columns are ordered like 'columns'.
+        """
+        if dataframe is None:
+            raise ValueError("The 'dataframe' parameter must be specified!")
+        return dataframe[self.columns].to_numpy(dtype=np.float64)
+
+    def means(self, values=None):
+        """
+        :param values: A 2D numpy array laid out like the 'columns' of this object.
+        :return: A (n_rows, n_groups) numpy array of group means.
+        """
+        grouped = self._gather(values)
+        missing = np.isnan(grouped)
+        sums = self._reduce(np.add, np.where(missing, 0, grouped))
+        counts = self._reduce(np.add, ~missing)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return sums / counts
+
+    def maxes(self, values=None):
+        """
+        :param values: A 2D numpy array laid out like the 'columns' of this object.
+        :return: A (n_rows, n_groups) numpy array of group maxes.
+        """
+        return self._reduce(np.fmax, self._gather(values))
+
+    def fractions_at_or_above(self, values=None, threshold=100):
+        """
+        :param values: A 2D numpy array laid out like the 'columns' of this object.
+        :param threshold: The threshold values are compared against.
+        :return: A (n_rows, n_groups) numpy array, the fraction of the cells of each group that are greater or equal to
+        the threshold. Missing values count as below the threshold.
+        """
+        above = self._gather(values) >= threshold
+        return self._reduce(np.add, above) / self._sizes
+
+    def moments(self, values=None):
+        """
+        :param values: A 2D numpy array laid out like the 'columns' of this object.
+        :return: A (counts, means, variances) tuple of (n_rows, n_groups) numpy arrays: the number of non missing values,
+        the mean and the sample variance (ddof=1) of each group. Groups with less than 2 values have a NaN variance.
+        """
+        grouped = self._gather(values)
+        missing = np.isnan(grouped)
+        counts = self._reduce(np.add, ~missing)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = self._reduce(np.add, np.where(missing, 0, grouped)) / counts
+            deviations = np.where(missing, 0, grouped - np.repeat(means, self._sizes, axis=1))
+            variances = self._reduce(np.add, deviations * deviations) / (counts - 1)
+        variances[counts < 2] = np.nan
+        return counts, means, variances
+
+    def _gather(self, values):
+        if values is None:
+            raise ValueError("The 'values' parameter must be specified!")
+        values = np.asarray(values, dtype=np.float64)
+        if self._in_block_order:
+            return values
+        return values[:, self._positions]
+
+    def _reduce(self, ufunc, grouped):
+        # one reduction over the contiguous slice of each group, for all rows at once
+        reduced = np.empty((grouped.shape[0], len(self.groups)), dtype=np.float64)
+        for index, (offset, size) in enumerate(zip(self._offsets, self._sizes)):
+            reduced[:, index] = ufunc.reduce(grouped[:, offset:offset + size], axis=1, dtype=np.float64)
+        return reduced
+
+
+class FilterPipeline(object):
+    """
+    A chainable and lazy version of the filters of this module. Each filter method only records the filter and returns
+    this pipeline, so filters can be chained:
+        FilterPipeline().set_baseline(columns=samples).neutral_loss().average_and_max(columns=samples).apply(dataframe)
+    When apply() is called, the numeric columns used by the filters are read once into a numpy block, value transforms
+    (such as set_baseline()) are applied to that block, the row tests of all filters are combined into a single boolean
+    mask, and one new DataFrame is materialized. Since every row test only depends on the values of its own row, the
+    result is the same as calling the filter functions one after another, without copying the DataFrame for each of
+    them: transformed columns keep their dtype, and a block of float32 columns is kept in float32. The original DataFrame
+    is unmodified.
+    """
+
+    def __init__(self):
+        # a list of (columns, is_transform, function) tuples, in the order they were added. Functions are partials of
+        # module level functions, so pipelines can be pickled and sent to worker processes
+        self._steps = []
+
+    def __len__(self):
+        return len(self._steps)
+
+    def set_baseline(self, columns=None, threshold=100, set_value=None):
+        """
+        See set_baseline_to_value().
+        :param columns: Columns that contains values to be checked. The default is None for all numeric columns.
+        :param threshold: The threshold under which values will be set to set_value.
+        :param set_value: The value to set to for values that is under threshold. The default is the threshold.
+        :return: This pipeline.
+        """
+        if set_value is None:
+            set_value = threshold
+        self._steps.append((columns, True, partial(_baseline_transform, threshold=threshold, set_value=set_value)))
+        return self
+
+    def neutral_loss(self, nl_column='neutral_loss', threshold=0):
+        """
+        See neutral_loss_filter().
+        :return: This pipeline.
+        """
+        self._steps.append(([nl_column], False, partial(_at_or_above_test, threshold=threshold)))
+        return self
+
+    def low_average(self, columns=None, threshold=100):
+        """
+        See low_average_filter().
+        :return: This pipeline.
+        """
+        self._steps.append((columns, False, partial(_average_and_max_test, avg_threshold=threshold, max_threshold=np.inf)))
+        return self
+
+    def average_and_max(self, columns=None, avg_threshold=100, max_threshold=300):
+        """
+        See average_and_max_filter().
+        :return: This pipeline.
+        """
+        self._steps.append((columns, False,
+                            partial(_average_and_max_test, avg_threshold=avg_threshold, max_threshold=max_threshold)))
+        return self
+
+    def low_average_group(self, groups=None, threshold=100):
+        """
+        See low_average_group_filter().
+        :return: This pipeline.
+        """
+        if groups is None:
+            raise ValueError("The 'group' parameter must be specified!")
+        column_groups = ColumnGroups(groups=groups)
+        self._steps.append((column_groups.columns, False,
+                            partial(_groups_average_test, column_groups=column_groups, threshold=threshold)))
+        return self
+
+    def average_and_max_group(self, group=None, avg_threshold=100, max_threshold=300):
+        """
+        See average_and_max_group_filter().
+        :return: This pipeline.
+        """
+        if group is None:
+            raise ValueError("The 'group' parameter must be specified!")
+        return self.average_and_max(columns=group, avg_threshold=avg_threshold, max_threshold=max_threshold)
+
+    def child_peaks(self, child_peaks=[(1, 10)], neu_loss_col='neutral_loss'):
+        """
+        See child_peaks_filter().
+        :return: This pipeline.
+        """
+        return self.outside(column=neu_loss_col, intervals=child_peaks)
+
+    def within(self, column=None, intervals=None):
+        """
+        Only keeps the rows whose value in 'column' falls within one of the intervals. See IntervalSet.include().
+        :param column: A string column name, ex: 'precursor' or 'fragment'.
+        :param intervals: An IntervalSet, or a list of (min, max) tuples.
+        :return: This pipeline.
+        """
+        if column is None or intervals is None:
+            raise ValueError("Both 'column' and 'intervals' parameters must be specified!")
+        interval_set = intervals if isinstance(intervals, IntervalSet) else IntervalSet(intervals)
+        self._steps.append(([column], False, partial(_interval_test, interval_set=interval_set, inside=True)))
+        return self
+
+    def outside(self, column=None, intervals=None):
+        """
+        Filters out the rows whose value in 'column' falls within one of the intervals. See IntervalSet.exclude().
+        :param column: A string column name, ex: 'neutral_loss', 'precursor' or 'fragment'.
+        :param intervals: An IntervalSet, or a list of (min, max) tuples.
+        :return: This pipeline.
+        """
+        if column is None or intervals is None:
+            raise ValueError("Both 'column' and 'intervals' parameters must be specified!")
+        interval_set = intervals if isinstance(intervals, IntervalSet) else IntervalSet(intervals)
+        self._steps.append(([column], False, partial(_interval_test, interval_set=interval_set, inside=False)))
+        return self
+
+    def group_quantile(self, group=None, quantile=0.3, threshold=100):
+        """
+        See group_quantile_filter().
+        :return: This pipeline.
+        """
+        if group is None:
+            raise ValueError("The 'group' parameter must be specified!")
+        if (quantile < 0 or quantile > 1):
+            raise ValueError("The 'quantile' parameter must be within the range of [0, 1] (quantile = 0 or 1 is acceptable)!")
+        column_groups = ColumnGroups(groups=[group])
+        self._steps.append((column_groups.columns, False,
+                            partial(_group_quantile_test, column_groups=column_groups, threshold=threshold, quantile=quantile)))
+        return self
+
+    def mask(self, dataframe=None):
+        """
+        This method evaluates the recorded filters and returns which rows of the dataframe are kept.
+        :param dataframe: A pandas Dataframe to be filtered.
+        :return: A numpy boolean array, True for the rows that pass every filter.
+        """
+        return self._evaluate(dataframe)[0]
+
+    def apply(self, dataframe=None):
+        """
+        This method applies all the recorded filters to a dataframe and materializes the result once.
+        :param dataframe: A pandas Dataframe to be filtered.
+        :return: A new pandas Dataframe.
+        """
+        kept, block, block_columns, transformed = self._evaluate(dataframe)
+        new_df = dataframe.take(np.flatnonzero(kept))
+        if transformed:
+            kept_block = block[kept]
+            for column in transformed:
+                new_df[column] = _restore_dtype(kept_block[:, block_columns.index(column)], dataframe[column].dtype)
+        return new_df
+
+    def cache_token(self):
+        """
+        :return: What the result of this pipeline depends on, its recorded filters, to key its methods in a
+        stage_cache.StageCache.
+        """
+        return self._steps
+
+    def _evaluate(self, dataframe):
+        if dataframe is None:
+            raise ValueError("The 'dataframe' parameter must be specified!")
+        numeric_columns = list(dataframe.select_dtypes(include=[np.number]).columns)
+        steps = [(numeric_columns if columns is None else list(columns), is_transform, function)
+                 for columns, is_transform, function in self._steps]
+        # read every column used by the filters once, into one numeric block
+        block_columns = []
+        for columns, _, _ in steps:
+            block_columns.extend(column for column in columns if column not in block_columns)
+        set_values = [function.keywords['set_value'] for _, is_transform, function in steps if is_transform]
+        block_dtype = _get_block_dtype(dataframe.dtypes[block_columns].tolist(), set_values)
+        block = dataframe[block_columns].to_numpy(dtype=block_dtype, copy=bool(set_values))
+        positions = {column: position for position, column in enumerate(block_columns)}
+
+        kept = np.ones(len(dataframe), dtype=bool)
+        transformed = []
+        for columns, is_transform, function in steps:
+            indices = [positions[column] for column in columns]
+            if is_transform:
+                values = block[:, indices]
+                function(values)
+                block[:, indices] = values
+                transformed.extend(column for column in columns if column not in transformed)
+            else:
+                kept &= function(block[:, indices], columns=columns)
+        return kept, block, block_columns, transformed
+
+
 #--------------------------------------------------- helper methods----------------------------------------------//
 
 def groups_average_boolean(row=None, groups=None, threshold=100):
@@ -189,4 +549,76 @@ def groups_average_boolean(row=None, groups=None, threshold=100):
         kept = row[group].mean() >= threshold
         if kept:
             return kept
-    return kept
\ No newline at end of file
+    return kept
+
+
+def _baseline_transform(values, threshold, set_value):
+    """
+    A helper method for 'FilterPipeline.set_baseline()', it sets the values under the threshold in place.
+    """
+    values[~(values >= threshold)] = set_value
+
+
+def _get_block_dtype(dtypes, set_values):
+    """
+    A helper method for 'FilterPipeline', it returns the dtype of the numeric block of columns: float32 when every column
+    and every baseline value fits in float32 exactly (so float32 runs are not doubled in memory), float64 otherwise.
+    """
+    if all(isinstance(dtype, np.dtype) and dtype.kind in 'biuf' for dtype in dtypes):
+        block_dtype = np.result_type(np.float32, *dtypes)
+        if block_dtype == np.float32 and all(np.float32(value) == value for value in set_values):
+            return block_dtype
+    return np.dtype(np.float64)
+
+
+def _restore_dtype(values, dtype):
+    """
+    A helper method for 'FilterPipeline.apply()', it casts the transformed values of a column back to the column's
+    original dtype, as DataFrame.where() does in set_baseline_to_value(), unless the values do not fit in it exactly.
+    """
+    if not isinstance(dtype, np.dtype) or dtype == values.dtype or dtype.kind not in 'biuf':
+        return values
+    if dtype.kind != 'f' and np.isnan(values).any():
+        return values
+    restored = values.astype(dtype)
+    if np.array_equal(restored, values, equal_nan=True):
+        return restored
+    return values
+
+
+def _at_or_above_test(values, columns, threshold):
+    """
+    A helper method for 'FilterPipeline.neutral_loss()'
+    """
+    return values[:, 0] >= threshold
+
+
+def _average_and_max_test(values, columns, avg_threshold, max_threshold):
+    """
+    A helper method for 'FilterPipeline.low_average()' and 'FilterPipeline.average_and_max()'
+    """
+    column_groups = ColumnGroups(groups=[columns])
+    return (column_groups.means(values)[:, 0] >= avg_threshold) | (column_groups.maxes(values)[:, 0] >= max_threshold)
+
+
+def _groups_average_test(values, columns, column_groups, threshold):
+    """
+    A helper method for 'FilterPipeline.low_average_group()'
+    """
+    return (column_groups.means(values) >= threshold).any(axis=1)
+
+
+def _group_quantile_test(values, columns, column_groups, threshold, quantile):
+    """
+    A helper method for 'FilterPipeline.group_quantile()'
+    """
+    return column_groups.fractions_at_or_above(values, threshold)[:, 0] >= quantile
+
+
+def _interval_test(values, columns, interval_set, inside):
+    """
+    A helper method for 'FilterPipeline.within()' and 'FilterPipeline.outside()'
+    """
+    if inside:
+        return interval_set.contains(values[:, 0])
+    return ~np.isnan(values[:, 0]) & ~interval_set.contains(values[:, 0])
@@ -0,0 +1,301 @@
+"""
+
+Created on: 10/16/2026
+
+This module contains an opt-in instrumentation layer for the API. While it is enabled, every public function of the API
+modules records its wall time, peak memory, rows and columns in and out, and the number of DataFrame copies it made;
+the trace can then be exported as JSON or as a Chrome trace (chrome://tracing, Perfetto).
+"""
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+from . import (batch_processing, database, file_directory_parser, filters, isotopic_corrections, molecules_parser,
+               normalization, run_cache, stage_cache, statistics)
+
+DEFAULT_MODULES = (batch_processing, database, file_directory_parser, filters, isotopic_corrections, molecules_parser,
+                   normalization, run_cache, stage_cache, statistics)
+
+
+class Tracer(object):
+    """
+    A tracer of the API calls. Instrumentation works by replacing the public functions of the API modules, and the public
+    methods of their classes, by recording wrappers when instrument() is called, and by putting the original functions
+    back when uninstrument() is called. When the tracer is not enabled, the API runs its original, unwrapped code, so
+    the instrumentation costs nothing. A tracer can also be used as a context manager:
+        from api import filters, isotopic_corrections
+        with Tracer() as tracer:
+            filtered = filters.FilterPipeline().neutral_loss().apply(dataframe)
+            corrected = isotopic_corrections.isotopic_correction(filtered, sample_columns=samples)
+        tracer.to_chrome_trace('trace.json')
+    Only module attributes and class attributes are replaced: call functions through their module (filters.
+    low_average_filter(...)), since a name bound before instrument() with 'from api.filters import low_average_filter'
+    still refers to the original function and is not recorded. Methods are recorded however the class was imported.
+    Calls are nested: a call made inside another instrumented call is recorded with a greater 'depth', and is included in
+    the time, memory and copies of its caller. Each thread has its own stack of calls, so calls made by different threads
+    are not nested into each other. Memory is measured with tracemalloc, which traces numpy and pandas buffers; its peak
+    is process-wide, so the peak memory of a call also includes what other threads allocated meanwhile.
+    The work of a generator function (ex: read_data_in_chunks()) happens while it is iterated: its event is recorded when
+    it is exhausted or closed, and sums the time, memory and copies of every step, but not the time spent by the caller
+    between steps. Its rows out are the total rows of the DataFrames it yielded.
+    Copies are the calls to DataFrame.copy() and DataFrame.take(), which boolean indexing, .loc and .iloc with arrays,
+    and column lists go through. Other operations that return new DataFrames (ex: arithmetic, where(), sort_values()) are
+    not counted.
+    Worker processes (ex: of BatchRunner) are not traced, only the calls of the process the tracer is enabled in.
+    """
+
+    def __init__(self, modules=DEFAULT_MODULES, trace_memory=True):
+        """
+        :param modules: A list of modules whose public functions and classes are instrumented.
+        :param trace_memory: Whether peak memory is measured. Measuring memory with tracemalloc slows Python code down.
+        """
+        self.modules = list(modules)
+        self.trace_memory = trace_memory
+        self.events = []
+        self._originals = []    # a list of (owner, attribute name, original) tuples, to restore on uninstrument()
+        self._local = threading.local()    # the stack of calls and the copies counter of each thread
+        self._origin = time.perf_counter()
+        self._started_tracemalloc = False
+
+    @property
+    def enabled(self):
+        return bool(self._originals)
+
+    def __enter__(self):
+        return self.instrument()
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.uninstrument()
+        return False
+
+    def instrument(self):
+        """
+        This method replaces the public functions of the modules with recording wrappers.
+        :return: This tracer.
+        """
+        if self.enabled:
+            return self
+        for module in self.modules:
+            for name, value in list(vars(module).items()):
+                if name.startswith('_') or getattr(value, '__module__', None) != module.__name__:
+                    continue
+                if inspect.isfunction(value):
+                    self._patch(module, name, value, '%s.%s' % (module.__name__.split('.')[-1], name))
+                elif inspect.isclass(value):
+                    for method_name, method in list(vars(value).items()):
+                        if not method_name.startswith('_') and inspect.isfunction(method):
+                            self._patch(value, method_name, method, '%s.%s.%s' % (module.__name__.split('.')[-1],
+                                                                                   name, method_name))
+        # count the DataFrame copies made while the tracer is enabled
+        self._patch(pd.DataFrame, 'copy', pd.DataFrame.copy, None)
+        self._patch(pd.DataFrame, 'take', pd.DataFrame.take, None)
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        return self
+
+    def uninstrument(self):
+        """
+        This method puts the original functions back.
+        :return: This tracer.
+        """
+        for owner, name, original in reversed(self._originals):
+            setattr(owner, name, original)
+        self._originals = []
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        return self
+
+    def clear(self):
+        """
+        This method removes every recorded event.
+        :return: This tracer.
+        """
+        self.events = []
+        self._origin = time.perf_counter()
+        return self
+
+    def summary(self):
+        """
+        :return: A pandas.DataFrame with one row per recorded call, in call order.
+        """
+        return pd.DataFrame(self.events, columns=['name', 'depth', 'start', 'seconds', 'peak_memory_delta', 'rows_in',
+                                                  'columns_in', 'rows_out', 'columns_out', 'copies', 'error'])
+
+    def to_json(self, file_path=None):
+        """
+        This method writes the recorded events to a JSON file, as a list of objects.
+        :param file_path: The absolute path to the file to write.
+        :return: This tracer.
+        """
+        if file_path is None:
+            raise ValueError("The 'file_path' parameter must be specified!")
+        with open(file_path, 'w') as json_file:
+            json.dump(self.events, json_file, indent=1)
+        return self
+
+    def to_chrome_trace(self, file_path=None):
+        """
+        This method writes the recorded events to a file in the Chrome trace event format.
+        :param file_path: The absolute path to the file to write.
+        :return: This tracer.
+        """
+        if file_path is None:
+            raise ValueError("The 'file_path' parameter must be specified!")
+        trace_events = [{'name': event['name'], 'cat': event['name'].split('.')[0], 'ph': 'X',
+                         'ts': event['start'] * 1e6, 'dur': event['seconds'] * 1e6, 'pid': os.getpid(),
+                         'tid': event['thread'],
+                         'args': {key: event[key] for key in ('peak_memory_delta', 'rows_in', 'columns_in', 'rows_out',
+                                                              'columns_out', 'copies', 'error')}}
+                        for event in self.events]
+        with open(file_path, 'w') as json_file:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, json_file)
+        return self
+
+    def _patch(self, owner, name, original, event_name):
+        self._originals.append((owner, name, original))
+        if event_name is None:
+            setattr(owner, name, self._count_copies(original))
+        elif inspect.isgeneratorfunction(original):
+            setattr(owner, name, self._record_generator(original, event_name))
+        else:
+            setattr(owner, name, self._record(original, event_name))
+
+    def _count_copies(self, original):
+        tracer = self
+
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            state = tracer._get_state()
+            state.copies = state.copies + 1
+            return original(*args, **kwargs)
+        return wrapper
+
+    def _record(self, original, event_name):
+        tracer = self
+
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            frame = tracer._enter()
+            error = None
+            result = None
+            try:
+                result = original(*args, **kwargs)
+                return result
+            except Exception as exception:
+                error = '%s: %s' % (type(exception).__name__, exception)
+                raise
+            finally:
+                measures = tracer._leave(frame)
+                shape_out = _get_shape(result)
+                tracer._append_event(event_name, measures, args, kwargs, shape_out[0], shape_out[1], error)
+        return wrapper
+
+    def _record_generator(self, original, event_name):
+        tracer = self
+
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            # each step runs in its own frame, and the measures of the steps are summed into one event
+            generator = original(*args, **kwargs)
+            totals = None
+            rows_out = None
+            columns_out = None
+            error = None
+            try:
+                while True:
+                    frame = tracer._enter()
+                    try:
+                        item = next(generator)
+                    except StopIteration:
+                        return
+                    except Exception as exception:
+                        error = '%s: %s' % (type(exception).__name__, exception)
+                        raise
+                    finally:
+                        totals = _add_measures(totals, tracer._leave(frame))
+                    rows, columns_out = _get_shape(item)
+                    if rows is not None:
+                        rows_out = (rows_out or 0) + rows
+                    yield item
+            finally:
+                generator.close()
+                if totals is not None:
+                    tracer._append_event(event_name, totals, args, kwargs, rows_out, columns_out, error)
+        return wrapper
+
+    def _get_state(self):
+        # the stack of calls and the copies counter of the current thread
+        state = self._local
+        if not hasattr(state, 'stack'):
+            state.stack = []
+            state.copies = 0
+        return state
+
+    def _enter(self):
+        state = self._get_state()
+        stack = state.stack
+        frame = {'start': time.perf_counter(), 'copies': state.copies, 'memory': None, 'peak': 0}
+        if self.trace_memory and tracemalloc.is_tracing():
+            if stack:
+                # keep the peak reached so far by the caller before resetting it for this call
+                stack[-1]['peak'] = max(stack[-1]['peak'], tracemalloc.get_traced_memory()[1])
+            frame['memory'] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        stack.append(frame)
+        return frame
+
+    def _leave(self, frame):
+        # end a frame started by _enter(), and return its measures
+        seconds = time.perf_counter() - frame['start']
+        state = self._get_state()
+        stack = state.stack
+        stack.pop()
+        peak_memory_delta = None
+        if frame['memory'] is not None:
+            peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            peak_memory_delta = peak - frame['memory']
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+        return {'start': frame['start'], 'depth': len(stack), 'seconds': seconds, 'peak_memory_delta': peak_memory_delta,
+                'copies': state.copies - frame['copies']}
+
+    def _append_event(self, event_name, measures, args, kwargs, rows_out, columns_out, error):
+        shape_in = _get_shape(next((value for value in list(args) + list(kwargs.values())
+                                    if isinstance(value, pd.DataFrame)), None))
+        self.events.append({'name': event_name, 'depth': measures['depth'], 'start': measures['start'] - self._origin,
+                            'seconds': measures['seconds'], 'peak_memory_delta': measures['peak_memory_delta'],
+                            'rows_in': shape_in[0], 'columns_in': shape_in[1],
+                            'rows_out': rows_out, 'columns_out': columns_out,
+                            'copies': measures['copies'], 'error': error,
+                            'thread': threading.get_ident()})
+
+
+#--------------------------------------------------- helper methods----------------------------------------------//
+
+def _get_shape(value):
+    """
+    A helper method for 'Tracer', it returns the (rows, columns) of a DataFrame, or (None, None) for other values.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.shape[0]), int(value.shape[1])
+    return None, None
+
+
+def _add_measures(totals, measures):
+    """
+    A helper method for 'Tracer', it sums the measures of the steps of a generator: times and copies are added, and the
+    peak memory is the highest of the steps. The start and depth are the ones of the first step.
+    """
+    if totals is None:
+        return dict(measures)
+    peaks = [peak for peak in (totals['peak_memory_delta'], measures['peak_memory_delta']) if peak is not None]
+    return {'start': totals['start'], 'depth': totals['depth'], 'seconds': totals['seconds'] + measures['seconds'],
+            'peak_memory_delta': max(peaks) if peaks else None, 'copies': totals['copies'] + measures['copies']}
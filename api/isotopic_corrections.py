@@ -5,37 +5,50 @@ Created: 10/03/2017
 This file contains functions that perform isotopic related operation on a dataset
 """
 import re
-import json
+from collections import OrderedDict
+from functools import lru_cache
 
-from scipy.stats import binom
+import numpy as np
+import pandas as pd
+
+from .molecules_parser import parse_lipid_names
+from .static_data_registry import StaticDataRegistry, to_mutable
+
+# The mass difference between a C13 and a C12 atom
+C13_MASS_SHIFT = 1.0033548378
+# The ratio of the threshold under which intermediate peaks are pruned to the threshold of the returned peaks
+PRUNING_FACTOR = 1e-6
+_ELEMENT_PATTERN = re.compile(r'([A-Z][a-z]*)(\d*)')
+_ADDUCT_PATTERN = re.compile(r'\[([^\]]*)\]')
 
 def get_isotope_distribution_json(isotope_distribution_file=None):
     """
     This functions read a JSON file that contains an JSON object of isotopes and their abundances in nature. It will return a JSON object.
     The JSON file is expected to contain ONE single JSON object with the form: {
-                                                                                  "H1":   {"mass": null, "abundance": 99.9885},
-                                                                                  "H2":   {"mass": null, "abundance": 0.0115},
-                                                                                  "Li6":  {"mass": null, "abundance":7.59},
-                                                                                  "Li7":  {"mass": null, "abundance":92.71},
-                                                                                  "C12":  {"mass": null, "abundance":98.93},
-                                                                                  "C13":  {"mass": null, "abundance":1.07},
-                                                                                  "O16":  {"mass": null, "abundance":99.757},
-                                                                                  "O17":  {"mass": null, "abundance":0.038},
-                                                                                  "O18":  {"mass": null, "abundance":0.205},
-                                                                                  "F19":  {"mass": null, "abundance":100},
-                                                                                  "NA23": {"mass": null, "abundance":100},
-                                                                                  "P31":  {"mass": null, "abundance":100},
+                                                                                  "H1":   {"mass": 1.00782503223, "abundance": 99.9885},
+                                                                                  "H2":   {"mass": 2.01410177812, "abundance": 0.0115},
+                                                                                  "Li6":  {"mass": 6.0151228874, "abundance": 7.59},
+                                                                                  "Li7":  {"mass": 7.0160034366, "abundance": 92.41},
+                                                                                  "C12":  {"mass": 12.0, "abundance": 98.93},
+                                                                                  "C13":  {"mass": 13.00335483507, "abundance": 1.07},
+                                                                                  "O16":  {"mass": 15.99491461957, "abundance": 99.757},
+                                                                                  "O17":  {"mass": 16.9991317565, "abundance": 0.038},
+                                                                                  "O18":  {"mass": 17.99915961286, "abundance": 0.205},
+                                                                                  "F19":  {"mass": 18.99840316273, "abundance": 100},
+                                                                                  "Na23": {"mass": 22.989769282, "abundance": 100},
+                                                                                  "P31":  {"mass": 30.97376199842, "abundance": 100},
                                                                                     ...
                                                                                 }.
-    Currently, exact mass of elements is stored in a separate JSON file, but one could add value to the "mass" key for these
-    isotopes distribution in their own isotope files if desired. The "mass" key defined here is just for the sake of convenience.
-    :param isotope_distribution_file: An absolute path to the JSON file that contains isotopes
+    The "mass" key is the exact mass of the isotope; it is required by IsotopicEnvelopeCalculator, and is also kept for
+    convenience next to the exact mass of elements, which is stored in a separate JSON file.
+    The file is parsed once per process (see StaticDataRegistry), and every call returns a new copy of its content.
+    :param isotope_distribution_file: An absolute path to the JSON file that contains isotopes. The default is None, which
+    means the isotope abundances of the default StaticDataRegistry.
     :return: A JSON object.
     """
-    # Open the JSON file and read the JSON object
-    with open(isotope_distribution_file) as json_data:
-        data = json.load(json_data)
-    return data
+    if isotope_distribution_file is None:
+        return to_mutable(StaticDataRegistry().isotope_abundances)
+    return to_mutable(StaticDataRegistry.load_file(isotope_distribution_file))
 
 def get_isotope_distribution_from_natoms(n_total_atoms=None, isotope=None, abundance=None):
     """
@@ -47,15 +60,434 @@ def get_isotope_distribution_from_natoms(n_total_atoms=None, isotope=None, abund
     :param abundance: The natural abundance ratio of the isotope of interest. Should be a numerical value between [0,1]
     :return: A dictionary of potential number of isotopes and their probabilities.
     """
-    # If
     if n_total_atoms is None or abundance is None:
         raise ValueError("Both 'natoms' and 'abundance' parameters are required!")
-    n_isotopes_probabilities = dict()
-    for k_isotopes in range(0, n_total_atoms + 1):
-        n_isotopes_probabilities[k_isotopes] = binom.pmf(k_isotopes, n_total_atoms, abundance)
-
+    probabilities = get_isotope_distribution_array(n_total_atoms=n_total_atoms, abundance=abundance)
+    n_isotopes_probabilities = dict(enumerate(probabilities.tolist()))
     return n_isotopes_probabilities
-    
 
-def get_isotopic_mass_distributions():
-    pass
\ No newline at end of file
+
+@lru_cache(maxsize=4096)
+def get_isotope_distribution_array(n_total_atoms=None, abundance=None, max_isotopes=None):
+    """
+    Given the total number of atoms of an element, this function returns a numpy array in which the value at position k
+    is the probability of having k isotope atoms in a molecule. The probability mass function is evaluated for every k
+    at once, and the result is cached by number of atoms and abundance.
+    :param n_total_atoms: An integer number of atoms of interest in a molecule.
+    :param abundance: The natural abundance ratio of the isotope of interest. Should be a numerical value between [0,1]
+    :param max_isotopes: The maximum number of isotope atoms to consider. The default is None, which means all
+    n_total_atoms + 1 probabilities are returned. Probabilities for k > n_total_atoms are 0.
+    :return: A read-only numpy float64 array of probabilities.
+    """
+    if n_total_atoms is None or abundance is None:
+        raise ValueError("Both 'n_total_atoms' and 'abundance' parameters are required!")
+    if max_isotopes is None:
+        max_isotopes = n_total_atoms
+    # the binomial probability mass function, computed in log space so large numbers of atoms do not overflow
+    n_isotopes = np.arange(max_isotopes + 1)
+    probabilities = np.zeros(max_isotopes + 1)
+    possible = n_isotopes[n_isotopes <= n_total_atoms]
+    if abundance <= 0 or abundance >= 1:
+        probabilities[n_isotopes == (n_total_atoms if abundance >= 1 else 0)] = 1.0
+    else:
+        # log C(n, k) = sum of log((n - j + 1) / j) for j = 1..k, for every k at once
+        log_combinations = np.zeros(len(possible))
+        log_combinations[1:] = np.cumsum(np.log((n_total_atoms - possible[1:] + 1) / possible[1:]))
+        probabilities[possible] = np.exp(log_combinations + possible * np.log(abundance)
+                                         + (n_total_atoms - possible) * np.log1p(-abundance))
+    probabilities.setflags(write=False)   # the array is shared by every caller through the cache
+    return probabilities
+
+
+def build_contribution_matrix(masses=None, n_carbons=None, abundance=0.0107, max_isotopes=4, mass_tolerance=0.3,
+                              type_one=False):
+    """
+    This function builds the C13 contribution matrix of a series of compositions (usually the compositions of one lipid
+    class). Element [j, i] of the matrix is the fraction of composition i's intensity that is observed at the precursor
+    mass of composition j because composition i carries k = (mass_j - mass_i) / 1.00335 C13 atoms.
+    Since compositions must be sorted by ascending mass, the matrix is lower triangular and banded by 'max_isotopes'.
+    See build_contribution_band() for the same matrix in banded storage.
+    :param masses: A sorted (ascending) numpy array of precursor masses, one per composition.
+    :param n_carbons: A numpy array of integer total number of carbons, one per composition.
+    :param abundance: The natural abundance ratio of C13, between [0, 1].
+    :param max_isotopes: The maximum number of C13 atoms considered, contributions of heavier isotopes are ignored.
+    :param mass_tolerance: The tolerance (in Da) within which a mass difference is considered equal to k C13 shifts.
+    :param type_one: If False (default), the matrix is scaled so that the unknowns are the monoisotopic intensities,
+    which only removes the contribution of lighter compositions. If True, the unknowns are the whole isotope envelopes,
+    which also corrects for the fraction of each composition that is not monoisotopic.
+    :return: A (n, n) numpy float64 array.
+    """
+    n_lower, band = build_contribution_band(masses=masses, n_carbons=n_carbons, abundance=abundance,
+                                            max_isotopes=max_isotopes, mass_tolerance=mass_tolerance, type_one=type_one)
+    n_compositions = band.shape[1]
+    matrix = np.zeros((n_compositions, n_compositions), dtype=np.float64)
+    for distance in range(n_lower + 1):
+        contributing = np.arange(n_compositions - distance)
+        matrix[contributing + distance, contributing] = band[distance, :n_compositions - distance]
+    return matrix
+
+
+def build_contribution_band(masses=None, n_carbons=None, abundance=0.0107, max_isotopes=4, mass_tolerance=0.3,
+                            type_one=False):
+    """
+    This function builds the C13 contribution matrix of build_contribution_matrix() in the banded storage of
+    scipy.linalg.solve_banded(): only the compositions within max_isotopes C13 shifts of each other contribute to each
+    other, so the matrix is stored in (n_lower + 1, n) memory instead of (n, n), with band[d, i] = matrix[i + d, i].
+    :param masses: See build_contribution_matrix().
+    :param n_carbons: See build_contribution_matrix().
+    :param abundance: See build_contribution_matrix().
+    :param max_isotopes: See build_contribution_matrix().
+    :param mass_tolerance: See build_contribution_matrix().
+    :param type_one: See build_contribution_matrix().
+    :return: A (n_lower, band) tuple, where n_lower is the number of non zero diagonals below the main diagonal and band
+    is a (n_lower + 1, n) numpy float64 array.
+    """
+    if masses is None or n_carbons is None:
+        raise ValueError("Both 'masses' and 'n_carbons' parameters are required!")
+    masses = np.asarray(masses, dtype=np.float64)
+    n_carbons = np.asarray(n_carbons, dtype=np.int64)
+    n_compositions = len(masses)
+    # one row of probabilities per composition, computed once per distinct carbon count
+    unique_carbons, carbon_codes = np.unique(n_carbons, return_inverse=True)
+    distributions = np.vstack([get_isotope_distribution_array(n_total_atoms=int(n), abundance=abundance,
+                                                              max_isotopes=max_isotopes) for n in unique_carbons]
+                              + [np.ones((0, max_isotopes + 1))])
+    probabilities = distributions[carbon_codes.ravel()]
+    if not type_one:
+        probabilities = probabilities / probabilities[:, :1]
+
+    # the farthest heavier composition each composition can contribute to gives the width of the band
+    reach = np.searchsorted(masses, masses + max_isotopes * C13_MASS_SHIFT + mass_tolerance, side='right')
+    n_lower = int((reach - 1 - np.arange(n_compositions)).max()) if n_compositions else 0
+    band = np.zeros((n_lower + 1, n_compositions), dtype=np.float64)
+    band[0] = probabilities[:, 0]
+    for distance in range(1, n_lower + 1):
+        # the number of C13 shifts between each contributing composition and the one 'distance' positions heavier
+        contributing = np.arange(n_compositions - distance)
+        mass_diff = masses[contributing + distance] - masses[contributing]
+        n_shifts = np.rint(mass_diff / C13_MASS_SHIFT).astype(np.int64)
+        adjacent = ((n_shifts >= 1) & (n_shifts <= max_isotopes)
+                    & (np.abs(mass_diff - n_shifts * C13_MASS_SHIFT) <= mass_tolerance))
+        band[distance, contributing] = np.where(adjacent,
+                                                probabilities[contributing, np.clip(n_shifts, 0, max_isotopes)], 0.0)
+    return n_lower, band
+
+
+def isotopic_correction(dataframe=None, sample_columns=None, name_column='lipid_name', precursor_column='precursor',
+                        carbon_column=None, head_group_carbons=None, abundance=0.0107, max_isotopes=4,
+                        mass_tolerance=0.3, type_one=False):
+    """
+    This function performs the C13 isotopic correction of a named dataset, for all sample columns at once. It follows the
+    algorithm of project_design_guidelines.md:
+    1. The fragment intensities of each composition (lipid name) are summed, for every sample.
+    2. For each lipid class, the compositions are sorted by precursor mass and the C13 contribution matrix is built (see
+    build_contribution_band()). The summed intensities of every sample are corrected with one banded triangular solve.
+    3. The fraction of increment/decrement of each composition's total intensity is applied to its individual fragments.
+    Corrected intensities below 0 are set to 0. Rows without a lipid name are left unchanged. The original DataFrame is
+    unmodified.
+    :param dataframe: A pandas DataFrame of named precursor/fragment mass pairs and their intensities.
+    :param sample_columns: A list of column names that contain the intensities of each sample.
+    :param name_column: A string column name where the lipid names can be found.
+    :param precursor_column: A string column name where the precursor masses can be found.
+    :param carbon_column: A string column name where the total number of carbons of each lipid can be found. The default
+    is None, in which case the total number of carbons of the chains is parsed from the lipid name.
+    :param head_group_carbons: A dictionary of lipid groups and the number of carbons of their head group, which is added
+    to the number of carbons parsed from the lipid name. Ex: {'PC': 8, 'TAG': 3}
+    :param abundance: See build_contribution_matrix().
+    :param max_isotopes: See build_contribution_matrix().
+    :param mass_tolerance: See build_contribution_matrix().
+    :param type_one: See build_contribution_matrix().
+    :return: A new pandas DataFrame with corrected intensities.
+    """
+    if dataframe is None or sample_columns is None:
+        raise ValueError("Both 'dataframe' and 'sample_columns' parameters are required!")
+    if head_group_carbons is None:
+        head_group_carbons = dict()
+    codes, names = pd.factorize(dataframe[name_column])
+    named = codes >= 0
+    intensities = dataframe[sample_columns].to_numpy(dtype=np.float64, copy=True)
+
+    # step 1: sum the fragment intensities of each composition
+    summed = pd.DataFrame(intensities[named]).groupby(codes[named]).sum().to_numpy()
+    precursors = pd.Series(dataframe[precursor_column].to_numpy()[named]).groupby(codes[named]).first().to_numpy()
+    parsed = parse_lipid_names(names)
+    groups = parsed['group'].to_numpy()
+    if carbon_column is None:
+        n_carbons = (parsed['total_carbons'].to_numpy(dtype=np.float64)
+                     + parsed['group'].map(head_group_carbons).fillna(0).to_numpy(dtype=np.float64))
+        n_carbons[parsed['total_carbons'].to_numpy() < 0] = np.nan
+    else:
+        n_carbons = pd.Series(dataframe[carbon_column].to_numpy()[named]).groupby(codes[named]).first().to_numpy()
+
+    # step 2: correct the summed intensities of each lipid class, for all samples at once
+    from scipy.linalg import solve_banded    # imported on first use, scipy is slow to import
+    corrected = summed.copy()
+    for group in pd.unique(groups[pd.notnull(groups)]):
+        members = np.flatnonzero((groups == group) & ~np.isnan(n_carbons))
+        members = members[np.argsort(precursors[members], kind='stable')]
+        n_lower, band = build_contribution_band(masses=precursors[members],
+                                                n_carbons=n_carbons[members].astype(np.int64), abundance=abundance,
+                                                max_isotopes=max_isotopes, mass_tolerance=mass_tolerance,
+                                                type_one=type_one)
+        corrected[members] = solve_banded((n_lower, 0), band, summed[members])
+    np.clip(corrected, 0, None, out=corrected)
+
+    # step 3: spread the fraction of increment/decrement back to the individual fragments
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fractions = np.where(summed != 0, corrected / summed, 1.0)
+    intensities[named] = intensities[named] * fractions[codes[named]]
+    new_df = dataframe.copy()
+    new_df[sample_columns] = intensities
+    return new_df
+
+
+def get_isotopic_mass_distributions(formulas=None, isotope_distribution_file=None, threshold=1e-6):
+    """
+    This function predicts the isotopic envelopes of formulas, every element of the formulas included (C, H, N, O, P,
+    Na, Li...). The isotopic peaks are grouped by nominal mass shift from the monoisotopic peak: each peak of an envelope
+    has the average mass of the isotopologues of that nominal mass, weighted by their probabilities, and the sum of their
+    probabilities as abundance. See IsotopicEnvelopeCalculator.
+    :param formulas: A string formula, or a list of string formulas. Ex: C42H80NO8P or C45H80O2[NH4]
+    :param isotope_distribution_file: An absolute path to the JSON file that contains isotopes and their masses, see
+    get_isotope_distribution_json(). The default is None, which means the isotopes of the default StaticDataRegistry.
+    :param threshold: Peaks with an abundance below this value are pruned.
+    :return: A (masses, abundances) tuple of numpy float64 arrays for a string formula, or a list of such tuples, in the
+    same order as 'formulas', for a list of formulas.
+    """
+    if formulas is None:
+        raise ValueError("The 'formulas' parameter must be specified!")
+    calculator = _get_envelope_calculator(isotope_distribution_file, threshold)
+    if isinstance(formulas, str):
+        return calculator.get_envelope(formulas)
+    return calculator.get_envelopes(formulas)
+
+
+class IsotopicEnvelopeCalculator(object):
+    """
+    A calculator of the isotopic envelopes of formulas. The distribution of the isotopes of one element, over nominal
+    mass shifts, is a polynomial; the envelope of n atoms of an element is that polynomial to the n-th power, and the
+    envelope of a formula is the product of the envelopes of its elements. Polynomials are multiplied by convolution,
+    along with a second array of mass moments (probability x mass) that gives the average mass of each nominal peak.
+    After every multiplication, the peaks past the last one above 'threshold' x PRUNING_FACTOR are pruned; the lower
+    threshold keeps the returned peaks, the ones above 'threshold', accurate.
+    Envelopes of n atoms of an element are built by repeated squaring and kept in a cache, so they are shared by every
+    formula with the same number of atoms of that element. The envelopes of all the new compositions of a call are then
+    multiplied together, element by element, as rows of one numpy block. Envelopes of formulas are kept in a LRU cache
+    keyed by elemental composition, so formulas written differently, or lipids of the same composition, are computed once.
+    Adducts in square brackets are added to (or, with '-', subtracted from) the composition, as in FormulaMassCalculator.
+    """
+
+    def __init__(self, isotope_distribution_file=None, isotope_distribution_dict=None, threshold=1e-6, cache_size=65536):
+        """
+        :param isotope_distribution_file: See get_isotopic_mass_distributions().
+        :param isotope_distribution_dict: A dictionary of isotopes, in the format of get_isotope_distribution_json(), used
+        instead of 'isotope_distribution_file'.
+        :param threshold: Peaks with an abundance below this value are pruned.
+        :param cache_size: The maximum number of compositions whose envelope is kept in the cache.
+        """
+        if isotope_distribution_dict is None:
+            isotope_distribution_dict = get_isotope_distribution_json(isotope_distribution_file)
+        self.threshold = threshold
+        self.cache_size = cache_size
+        self._pruning_threshold = threshold * PRUNING_FACTOR
+        self._isotopes = _group_isotopes(isotope_distribution_dict)
+        self._element_envelopes = dict()    # (element, number of atoms) -> (probabilities, mass moments)
+        self._envelopes = OrderedDict()     # composition -> (masses, abundances), least recently used first
+
+    def get_composition(self, formula=None):
+        """
+        This method returns the elemental composition of a formula, adducts included.
+        :param formula: A string formula. Ex: C57H104O6 or C57H104O6[NH4]
+        :return: A dictionary of element symbols and their number of atoms.
+        """
+        if formula is None:
+            raise ValueError("The 'formula' parameter must be specified!")
+        composition = dict()
+        if '[' not in formula:
+            _add_elements(composition, formula, 1)
+        else:
+            _add_elements(composition, _ADDUCT_PATTERN.sub('', formula), 1)
+            for adduct in _ADDUCT_PATTERN.findall(formula):
+                if adduct.startswith('-'):
+                    _add_elements(composition, adduct[1:], -1)
+                else:
+                    _add_elements(composition, adduct.lstrip('+'), 1)
+        if any(count < 0 for count in composition.values()):
+            raise ValueError('The formula %s has a negative number of atoms!' % formula)
+        return {element: count for element, count in composition.items() if count > 0}
+
+    def get_envelope(self, formula=None):
+        """
+        This method returns the isotopic envelope of a formula.
+        :param formula: A string formula. Ex: C57H104O6 or C57H104O6[NH4]
+        :return: A (masses, abundances) tuple of read-only numpy float64 arrays, ordered by mass. The first peak is the
+        monoisotopic peak, unless its abundance is below the threshold.
+        """
+        if formula is None:
+            raise ValueError("The 'formula' parameter must be specified!")
+        return self.get_envelopes([formula])[0]
+
+    def get_envelopes(self, formulas=None):
+        """
+        This method returns the isotopic envelopes of a list or pandas.Series of formulas. Each distinct formula is only
+        parsed once, and each distinct composition is only computed once.
+        :param formulas: A list or pandas.Series of string formulas.
+        :return: A list of (masses, abundances) tuples, see get_envelope(), in the same order as 'formulas'. Missing
+        formulas (None, NaN) get empty arrays.
+        """
+        if formulas is None:
+            raise ValueError("The 'formulas' parameter must be specified!")
+        codes, uniques = pd.factorize(pd.Series(formulas), sort=False)
+        compositions = [tuple(sorted(self.get_composition(formula).items())) for formula in uniques]
+        missing = list(dict.fromkeys(composition for composition in compositions if composition not in self._envelopes))
+        computed = dict(zip(missing, self._compute_envelopes(missing))) if missing else dict()
+        envelopes = []
+        for composition in compositions:
+            if composition in computed:
+                envelope = computed[composition]
+                self._envelopes[composition] = envelope
+            else:
+                envelope = self._envelopes[composition]
+                self._envelopes.move_to_end(composition)
+            envelopes.append(envelope)
+        while len(self._envelopes) > self.cache_size:
+            self._envelopes.popitem(last=False)
+        # missing formulas are factorized to code -1, and get an empty envelope
+        empty = np.empty(0)
+        empty.setflags(write=False)
+        return [envelopes[code] if code >= 0 else (empty, empty) for code in codes]
+
+    def clear_cache(self):
+        """
+        This method empties the caches of envelopes.
+        :return: This calculator.
+        """
+        self._envelopes.clear()
+        self._element_envelopes.clear()
+        return self
+
+    def cache_token(self):
+        """
+        :return: What the envelopes of this calculator depend on, its isotopes and threshold but not its caches of
+        envelopes, to key its methods in a stage_cache.StageCache.
+        """
+        return self._isotopes, self.threshold
+
+    def _compute_envelopes(self, compositions):
+        # one row per composition, one column per nominal mass shift from the monoisotopic peak
+        probabilities = np.ones((len(compositions), 1))
+        moments = np.zeros((len(compositions), 1))
+        elements = sorted({element for composition in compositions for element, _ in composition})
+        for element in elements:
+            counts = np.array([dict(composition).get(element, 0) for composition in compositions], dtype=np.int64)
+            distinct, rows = np.unique(counts, return_inverse=True)
+            element_envelopes = [self._get_element_envelope(element, count) if count else (np.ones(1), np.zeros(1))
+                                 for count in distinct.tolist()]
+            width = max(len(envelope[0]) for envelope in element_envelopes)
+            element_probabilities = np.zeros((len(distinct), width))
+            element_moments = np.zeros((len(distinct), width))
+            for position, envelope in enumerate(element_envelopes):
+                element_probabilities[position, :len(envelope[0])] = envelope[0]
+                element_moments[position, :len(envelope[1])] = envelope[1]
+            element_probabilities = element_probabilities[rows]
+            element_moments = element_moments[rows]
+            # convolve every row at once, one shift of the element envelope at a time
+            n_columns = probabilities.shape[1]
+            new_probabilities = np.zeros((len(compositions), n_columns + width - 1))
+            new_moments = np.zeros((len(compositions), n_columns + width - 1))
+            for shift in range(width):
+                new_probabilities[:, shift:shift + n_columns] += probabilities * element_probabilities[:, shift:shift + 1]
+                new_moments[:, shift:shift + n_columns] += (moments * element_probabilities[:, shift:shift + 1]
+                                                            + probabilities * element_moments[:, shift:shift + 1])
+            above = np.flatnonzero((new_probabilities >= self._pruning_threshold).any(axis=0))
+            stop = above[-1] + 1 if len(above) else 1
+            probabilities = new_probabilities[:, :stop]
+            moments = new_moments[:, :stop]
+
+        kept = probabilities >= self.threshold
+        with np.errstate(divide='ignore', invalid='ignore'):
+            masses = moments / probabilities
+        envelopes = []
+        for row in range(len(compositions)):
+            row_masses = masses[row, kept[row]]
+            row_abundances = probabilities[row, kept[row]]
+            row_masses.setflags(write=False)    # the arrays are shared by every caller through the cache
+            row_abundances.setflags(write=False)
+            envelopes.append((row_masses, row_abundances))
+        return envelopes
+
+    def _get_element_envelope(self, element, count):
+        key = (element, count)
+        if key not in self._element_envelopes:
+            if element not in self._isotopes:
+                raise ValueError('The isotopes of the element %s are unknown!' % element)
+            if count == 1:
+                envelope = self._isotopes[element]
+            else:
+                half = self._get_element_envelope(element, count // 2)
+                envelope = _multiply_envelopes(half, half, self._pruning_threshold)
+                if count % 2:
+                    envelope = _multiply_envelopes(envelope, self._isotopes[element], self._pruning_threshold)
+            self._element_envelopes[key] = envelope
+        return self._element_envelopes[key]
+
+
+#--------------------------------------------------- helper methods----------------------------------------------//
+
+@lru_cache(maxsize=16)
+def _get_envelope_calculator(isotope_distribution_file, threshold):
+    """
+    A helper method for 'get_isotopic_mass_distributions()', it keeps one IsotopicEnvelopeCalculator per isotopes file
+    and threshold, so envelopes are cached across calls.
+    """
+    return IsotopicEnvelopeCalculator(isotope_distribution_file=isotope_distribution_file, threshold=threshold)
+
+
+def _group_isotopes(isotope_distribution_dict):
+    """
+    A helper method for 'IsotopicEnvelopeCalculator', it groups the isotopes of a get_isotope_distribution_json() object
+    by element. Isotope keys are an element symbol and a mass number, the symbol in any case ("NA23" is sodium).
+    :return: A dictionary of element symbols and (probabilities, mass moments) arrays indexed by nominal mass shift from
+    the lightest isotope. Abundances are normalized to sum to 1 for each element.
+    """
+    isotopes = dict()
+    for key, value in isotope_distribution_dict.items():
+        match = re.match(r'^([A-Za-z]+)(\d+)$', key)
+        if match is None:
+            raise ValueError('Invalid isotope: %s, isotopes must be an element symbol and a mass number. Ex: C13' % key)
+        if value.get('mass') is None:
+            raise ValueError("The 'mass' of the isotope %s is missing!" % key)
+        element = match.group(1)[0].upper() + match.group(1)[1:].lower()
+        isotopes.setdefault(element, []).append((int(match.group(2)), float(value['mass']), float(value['abundance'])))
+    grouped = dict()
+    for element, element_isotopes in isotopes.items():
+        mass_numbers = np.array([isotope[0] for isotope in element_isotopes])
+        shifts = mass_numbers - mass_numbers.min()
+        abundances = np.array([isotope[2] for isotope in element_isotopes])
+        probabilities = np.zeros(shifts.max() + 1)
+        moments = np.zeros(shifts.max() + 1)
+        np.add.at(probabilities, shifts, abundances / abundances.sum())
+        np.add.at(moments, shifts, abundances / abundances.sum() * np.array([isotope[1] for isotope in element_isotopes]))
+        grouped[element] = (probabilities, moments)
+    return grouped
+
+
+def _multiply_envelopes(first, second, threshold):
+    """
+    A helper method for 'IsotopicEnvelopeCalculator', it combines two (probabilities, mass moments) envelopes, and
+    prunes the peaks past the last one above the threshold.
+    """
+    probabilities = np.convolve(first[0], second[0])
+    moments = np.convolve(first[1], second[0]) + np.convolve(first[0], second[1])
+    above = np.flatnonzero(probabilities >= threshold)
+    stop = above[-1] + 1 if len(above) else 1
+    return probabilities[:stop], moments[:stop]
+
+
+def _add_elements(composition, formula, sign):
+    """
+    A helper method for 'IsotopicEnvelopeCalculator', it adds (sign=1) or subtracts (sign=-1) the atoms of a formula
+    without adducts to a composition dictionary.
+    """
+    for element, count in _ELEMENT_PATTERN.findall(formula):
+        composition[element] = composition.get(element, 0) + sign * (int(count) if count else 1)
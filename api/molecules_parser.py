@@ -8,12 +8,18 @@ strings based on number of elements and double bonds, calculate mass, find name
 """
 
 
-import json
+import itertools
 import re
+from functools import lru_cache
 
 import numpy as np
 import pandas as pd
 
+from .static_data_registry import StaticDataRegistry
+
+# The maximum number of (found pair, known pair) candidates MassPairIndex.annotate() expands at once
+MAX_CANDIDATES = 1 << 21
+
 
 def get_name_for_mass_pair(precursor=None, fragment=None, mass_name_list=None, pm_tolerance=0.3, fm_tolerance=None, atol=True):
     """
@@ -28,7 +34,7 @@ def get_name_for_mass_pair(precursor=None, fragment=None, mass_name_list=None, p
     in the list.
     :param fm_tolerance: The fragment mass tolerance within which a fragment mass will be considered matched from the fragment mass
     in the list. The default is equal to pm_tolerance.
-    :param atol: Whether the tolerance parameter is absolute or relative. THe default is True for absolute; and False for relative
+    :param atol: Whether the tolerance parameter is absolute (Da) or relative (ppm). THe default is True for absolute; and False for relative
     :return: A DataFrame of matched precursor/fragment mass pair, lipid name... from the name list
     """
     # default fragment mass tolerance to precursor mass tolerance if not specified
@@ -39,18 +45,213 @@ def get_name_for_mass_pair(precursor=None, fragment=None, mass_name_list=None, p
         raise ValueError("Both 'precursor' and 'mass_name_list' parameter required")
     if 'precursor' not in list(mass_name_list) or 'fragment' not in  list(mass_name_list) or 'lipid_name' not in list(mass_name_list):
         raise ValueError("'mass_name_list' DataFrame must have 'precursor', 'fragment', and 'name' columns")
-    # chose between either relative or absolute tolerance
+    # chose between either absolute (Da) or relative (ppm) tolerance
     if atol:
-        precursor_matches = pd.Series(np.isclose(mass_name_list['precursor'], pd.Series(precursor, mass_name_list.index), atol=pm_tolerance))
-        fragment_matches = pd.Series(np.isclose(mass_name_list['fragment'], pd.Series(fragment, mass_name_list.index), atol=fm_tolerance))
-        pair_matches = np.logical_and(precursor_matches, fragment_matches)
-        return mass_name_list[pair_matches]
+        precursor_matches = np.abs(mass_name_list['precursor'].values - precursor) <= pm_tolerance
+        fragment_matches = np.abs(mass_name_list['fragment'].values - fragment) <= fm_tolerance
     else:
-        precursor_matches = pd.Series(np.isclose(mass_name_list['precursor'], pd.Series(precursor, mass_name_list.index), atol=pm_tolerance))
-        fragment_matches = pd.Series(np.isclose(mass_name_list['fragment'], pd.Series(fragment, mass_name_list.index), atol=fm_tolerance))
-        pair_matches = np.logical_and(precursor_matches, fragment_matches)
-        return mass_name_list[pair_matches]
+        precursor_matches = np.abs(mass_name_list['precursor'].values - precursor) <= abs(precursor) * pm_tolerance * 1e-6
+        fragment_matches = np.abs(mass_name_list['fragment'].values - fragment) <= abs(fragment) * fm_tolerance * 1e-6
+    pair_matches = np.logical_and(precursor_matches, fragment_matches)
+    return mass_name_list[pair_matches]
+
+
+class MassPairIndex(object):
+    """
+    A sorted index of known precursor/fragment mass pairs and their names. The index is built once from a lab's mass
+    name list, sorted on precursor and then fragment mass, and can then annotate a whole DataFrame of found mass pairs
+    in one vectorized call. Instead of comparing every found pair against every known pair (O(N*M)), the candidate
+    precursor window of each found pair is located with a binary search (numpy.searchsorted), so annotating N pairs
+    against M known pairs costs O((N + M) log M) plus the number of candidates in the windows.
+    """
+
+    def __init__(self, mass_name_list=None):
+        """
+        :param mass_name_list: A pandas.DataFrame that contains the list of known mass pairs and their names. The
+        DataFrame MUST have at least the following column names: 'precursor', 'fragment', and 'lipid_name'. Any other
+        columns are carried along and returned with the matches.
+        """
+        if mass_name_list is None:
+            raise ValueError("The 'mass_name_list' parameter must be specified!")
+        if 'precursor' not in list(mass_name_list) or 'fragment' not in list(mass_name_list) or 'lipid_name' not in list(mass_name_list):
+            raise ValueError("'mass_name_list' DataFrame must have 'precursor', 'fragment', and 'lipid_name' columns")
+        # sort on precursor first, then fragment (np.lexsort uses the last key as the primary key)
+        order = np.lexsort((mass_name_list['fragment'].values, mass_name_list['precursor'].values))
+        self._library = mass_name_list.iloc[order].reset_index(drop=True)
+        self._precursor = self._library['precursor'].values.astype(np.float64)
+        self._fragment = self._library['fragment'].values.astype(np.float64)
+
+    def __len__(self):
+        return len(self._precursor)
+
+    @property
+    def library(self):
+        """
+        :return: The sorted pandas.DataFrame of known mass pairs this index was built from.
+        """
+        return self._library
+
+    def cache_token(self):
+        """
+        :return: What the matches of this index depend on, its sorted library, to key its methods in a
+        stage_cache.StageCache.
+        """
+        return self._library
+
+    @classmethod
+    def from_sorted_library(cls, library=None):
+        """
+        This method builds an index from a library that is already sorted on precursor and then fragment mass, such as
+        the 'library' of another index, without sorting or copying it again.
+        :param library: A sorted pandas.DataFrame, see __init__().
+        :return: A MassPairIndex.
+        """
+        if library is None:
+            raise ValueError("The 'library' parameter must be specified!")
+        index = cls.__new__(cls)
+        index._library = library
+        index._precursor = library['precursor'].to_numpy(dtype=np.float64)
+        index._fragment = library['fragment'].to_numpy(dtype=np.float64)
+        return index
+
+    def save(self, file_path=None):
+        """
+        This method saves the sorted index to a numpy .npz file, so a library only has to be built once.
+        :param file_path: The absolute path to the file to write. The '.npz' extension is added if missing.
+        :return: This index.
+        """
+        if file_path is None:
+            raise ValueError("The 'file_path' parameter must be specified!")
+        arrays = {'columns': np.array(list(self._library), dtype=str)}
+        for position, column in enumerate(self._library):
+            values = self._library[column].to_numpy()
+            if not np.issubdtype(values.dtype, np.number):
+                values = values.astype(str)
+            arrays['column_%d' % position] = values
+        np.savez(file_path, **arrays)
+        return self
+
+    @classmethod
+    def load(cls, file_path=None):
+        """
+        This method loads an index saved with save().
+        :param file_path: The absolute path to the .npz file, the same path as given to save(): the '.npz' extension
+        is added if missing.
+        :return: A MassPairIndex.
+        """
+        if file_path is None:
+            raise ValueError("The 'file_path' parameter must be specified!")
+        if isinstance(file_path, str) and not file_path.endswith('.npz'):
+            file_path = file_path + '.npz'    # like numpy.savez() does in save()
+        with np.load(file_path, allow_pickle=False) as arrays:
+            columns = arrays['columns'].tolist()
+            library = pd.DataFrame({column: arrays['column_%d' % position] for position, column in enumerate(columns)},
+                                   columns=columns)
+        return cls.from_sorted_library(library)
+
+    def annotate(self, dataframe=None, precursor_col='precursor', fragment_col='fragment', pm_tolerance=0.3,
+                 fm_tolerance=None, atol=True):
+        """
+        This method matches every precursor/fragment mass pair of a DataFrame against the known mass pairs of this index
+        and returns every candidate match with its mass errors. The original DataFrame is unmodified.
+        :param dataframe: A pandas.DataFrame that contains the found mass pairs.
+        :param precursor_col: A string column name where the precursor masses can be found.
+        :param fragment_col: A string column name where the fragment masses can be found.
+        :param pm_tolerance: The precursor mass tolerance, in Da when 'atol' is True, in ppm otherwise.
+        :param fm_tolerance: The fragment mass tolerance, in Da when 'atol' is True, in ppm otherwise. The default is
+        equal to pm_tolerance.
+        :param atol: Whether the tolerance parameters are absolute (Da) or relative (ppm). The default is True for absolute.
+        :return: A new DataFrame with one row per candidate match. It has a 'query_index' column (the index label of
+        the matched row in 'dataframe'), the found 'query_precursor' and 'query_fragment' masses, the columns of the
+        matched known pair, and the 'precursor_error' and 'fragment_error' (found - known, in Da, or in ppm of the found
+        mass).
+        """
+        if dataframe is None:
+            raise ValueError("The 'dataframe' parameter containing mass pairs must be specified!")
+        # default fragment mass tolerance to precursor mass tolerance if not specified
+        if fm_tolerance is None:
+            fm_tolerance = pm_tolerance
+        query_precursor = dataframe[precursor_col].values.astype(np.float64)
+        query_fragment = dataframe[fragment_col].values.astype(np.float64)
+
+        # locate the window of known precursors that fall within the tolerance of each found precursor
+        if atol:
+            pm_delta = np.full(len(query_precursor), pm_tolerance, dtype=np.float64)
+        else:
+            pm_delta = np.abs(query_precursor) * pm_tolerance * 1e-6
+        starts = np.searchsorted(self._precursor, query_precursor - pm_delta, side='left')
+        stops = np.searchsorted(self._precursor, query_precursor + pm_delta, side='right')
+        counts = np.maximum(stops - starts, 0)
+
+        # expand the windows into flat (query, candidate) position pairs and only keep candidates whose fragment also
+        # matches; queries are expanded in batches of at most MAX_CANDIDATES candidates to bound memory
+        cumulative_counts = np.cumsum(counts)
+        batch_bounds = [0]
+        while batch_bounds[-1] < len(counts):
+            expanded = cumulative_counts[batch_bounds[-1] - 1] if batch_bounds[-1] else 0
+            batch_stop = np.searchsorted(cumulative_counts, expanded + MAX_CANDIDATES, side='right')
+            batch_bounds.append(max(int(batch_stop), batch_bounds[-1] + 1))
+        kept_query_pos, kept_library_pos, kept_fragment_diff = [], [], []
+        for batch_start, batch_stop in zip(batch_bounds[:-1], batch_bounds[1:]):
+            batch_counts = counts[batch_start:batch_stop]
+            query_pos = np.repeat(np.arange(batch_start, batch_stop), batch_counts)
+            offsets = np.arange(batch_counts.sum()) - np.repeat(np.cumsum(batch_counts) - batch_counts, batch_counts)
+            library_pos = np.repeat(starts[batch_start:batch_stop], batch_counts) + offsets
+            fragment_diff = query_fragment[query_pos] - self._fragment[library_pos]
+            if atol:
+                kept = np.abs(fragment_diff) <= fm_tolerance
+            else:
+                kept = np.abs(fragment_diff) <= np.abs(query_fragment[query_pos]) * fm_tolerance * 1e-6
+            kept_query_pos.append(query_pos[kept])
+            kept_library_pos.append(library_pos[kept])
+            kept_fragment_diff.append(fragment_diff[kept])
+        query_pos = np.concatenate(kept_query_pos + [np.zeros(0, dtype=np.intp)]).astype(np.intp)
+        library_pos = np.concatenate(kept_library_pos + [np.zeros(0, dtype=np.intp)]).astype(np.intp)
+        fragment_diff = np.concatenate(kept_fragment_diff + [np.zeros(0)])
+        precursor_error = query_precursor[query_pos] - self._precursor[library_pos]
+        fragment_error = fragment_diff
+        if not atol:
+            # relative to the found masses, like the windows, so a match is kept when its ppm error is within tolerance
+            precursor_error = precursor_error / np.abs(query_precursor[query_pos]) * 1e6
+            fragment_error = fragment_error / np.abs(query_fragment[query_pos]) * 1e6
+
+        matches = self._library.iloc[library_pos].reset_index(drop=True)
+        matches.insert(0, 'query_index', dataframe.index.values[query_pos])
+        matches.insert(1, 'query_precursor', query_precursor[query_pos])
+        matches.insert(2, 'query_fragment', query_fragment[query_pos])
+        matches['precursor_error'] = precursor_error
+        matches['fragment_error'] = fragment_error
+        return matches
 
+    def assign_names(self, dataframe=None, name_column='lipid_name', precursor_col='precursor', fragment_col='fragment',
+                     pm_tolerance=0.3, fm_tolerance=None, atol=True):
+        """
+        This method names every precursor/fragment mass pair of a DataFrame with its best candidate match, which is the
+        known pair with the smallest sum of absolute precursor and fragment errors. The original DataFrame is unmodified.
+        :param dataframe: A pandas.DataFrame that contains the found mass pairs.
+        :param name_column: The string name of the column the names are written to.
+        :param precursor_col: See annotate().
+        :param fragment_col: See annotate().
+        :param pm_tolerance: See annotate().
+        :param fm_tolerance: See annotate().
+        :param atol: See annotate().
+        :return: A new DataFrame with a 'name_column' column, which is missing for pairs without any match.
+        """
+        if dataframe is None:
+            raise ValueError("The 'dataframe' parameter containing mass pairs must be specified!")
+        # annotate by position, so duplicated index labels in 'dataframe' are not an issue
+        positional = pd.DataFrame({precursor_col: dataframe[precursor_col].to_numpy(),
+                                   fragment_col: dataframe[fragment_col].to_numpy()})
+        matches = self.annotate(positional, precursor_col=precursor_col, fragment_col=fragment_col,
+                                pm_tolerance=pm_tolerance, fm_tolerance=fm_tolerance, atol=atol)
+        errors = np.abs(matches['precursor_error'].to_numpy()) + np.abs(matches['fragment_error'].to_numpy())
+        best = np.lexsort((errors, matches['query_index'].to_numpy()))
+        best = best[np.unique(matches['query_index'].to_numpy()[best], return_index=True)[1]]
+        names = np.full(len(dataframe), np.nan, dtype=object)
+        names[matches['query_index'].to_numpy()[best]] = matches['lipid_name'].to_numpy()[best]
+        new_df = dataframe.copy()
+        new_df[name_column] = names
+        return new_df
 
 
 def get_mass_from_formula(formula=None, elements_mass_file=None):
@@ -67,21 +268,108 @@ def get_mass_from_formula(formula=None, elements_mass_file=None):
                                                                       "P": 30.97376199842
                                                                       ...
                                                                     }
+    The elements mass file is only read once per process, see FormulaMassCalculator for bulk calculations and adducts.
     :return: A float mass value of the formula.
     """
     # Raise error if neither formula nor elements_mass_file are specified
     if formula is None or elements_mass_file is None:
         raise ValueError("Both 'formula' and 'elements_mass_file' must be specified!")
-    mass_sum = 0
-    # first open the json file that contains elements and their masses
-    with open(elements_mass_file) as json_data:
-        data = json.load(json_data)
+    return _get_formula_mass_calculator(elements_mass_file).get_mass(formula)
+
+
+class FormulaMassCalculator(object):
+    """
+    A calculator that computes the mass of formula strings. The elements mass table is loaded once when the calculator
+    is created, and parsed formulas are kept in a LRU cache, so computing the masses of a whole library requires no disk
+    access and no repeated regular expression parsing.
+    A formula may end with one or more adducts in square brackets, for example: C42H80NO8P[-H], C45H80O2[NH4] or
+    C24H50NO7P[HF2]. An adduct starting with '-' is subtracted from the formula mass, any other adduct is added.
+    """
+
+    def __init__(self, elements_mass_file=None, elements_mass_dict=None, cache_size=65536):
+        """
+        :param elements_mass_file: The absolute path to a JSON file that contains the elements and their masses. See
+        get_mass_from_formula().
+        :param elements_mass_dict: A dictionary of element symbols and their masses, used instead of 'elements_mass_file'.
+        :param cache_size: The maximum number of parsed formulas kept in the cache.
+        """
+        if elements_mass_file is None and elements_mass_dict is None:
+            raise ValueError("Either 'elements_mass_file' or 'elements_mass_dict' must be specified!")
+        if elements_mass_dict is None:
+            elements_mass_dict = StaticDataRegistry.load_file(elements_mass_file)
+        self._elements_mass = dict(elements_mass_dict)
+        self._cached_mass = lru_cache(maxsize=cache_size)(self._parse_mass)
+
+    def get_mass(self, formula=None):
+        """
+        This method calculates the mass of a single formula string, adducts included.
+        :param formula: A string formula. Ex: C57H104O6 or C57H104O6[NH4]
+        :return: A float mass value of the formula.
+        """
+        if formula is None:
+            raise ValueError("The 'formula' parameter must be specified!")
+        return self._cached_mass(formula)
+
+    def get_masses(self, formulas=None):
+        """
+        This method calculates the masses of a list or pandas.Series of formula strings. Each distinct formula is only
+        parsed once.
+        :param formulas: A list or pandas.Series of string formulas.
+        :return: A numpy float64 array of masses, in the same order as 'formulas'.
+        """
+        if formulas is None:
+            raise ValueError("The 'formulas' parameter must be specified!")
+        codes, uniques = pd.factorize(pd.Series(formulas), sort=False)
+        unique_masses = np.fromiter((self._cached_mass(formula) for formula in uniques), dtype=np.float64, count=len(uniques))
+        # missing formulas are factorized to code -1
+        masses = np.full(len(codes), np.nan, dtype=np.float64)
+        found = codes >= 0
+        masses[found] = unique_masses[codes[found]]
+        return masses
+
+    def get_adduct_mass(self, adduct=None):
+        """
+        This method returns the mass delta of an adduct. Ex: 'NH4', '+Na', '-H' or '[-H]'.
+        :param adduct: An adduct string, with or without the square brackets.
+        :return: A float mass delta, negative for adducts starting with '-'.
+        """
+        if adduct is None:
+            raise ValueError("The 'adduct' parameter must be specified!")
+        adduct = adduct.strip('[]')
+        if adduct.startswith('-'):
+            return -self._elements_sum(adduct[1:])
+        return self._elements_sum(adduct.lstrip('+'))
+
+    def clear_cache(self):
+        """
+        This method empties the cache of parsed formulas.
+        :return: This calculator.
+        """
+        self._cached_mass.cache_clear()
+        return self
+
+    def cache_token(self):
+        """
+        :return: What the masses of this calculator depend on, its elements masses but not its cache of parsed formulas,
+        to key its methods in a stage_cache.StageCache.
+        """
+        return self._elements_mass
+
+    def _parse_mass(self, formula):
+        # split the formula into its neutral part and its adducts
+        mass_sum = self._elements_sum(re.sub(r'\[[^\]]*\]', '', formula))
+        for adduct in re.findall(r'\[([^\]]*)\]', formula):
+            mass_sum = mass_sum + self.get_adduct_mass(adduct)
+        return mass_sum
+
+    def _elements_sum(self, formula):
+        mass_sum = 0
         for tup in re.findall(r'([A-Z][a-z]*)(\d*)', formula):
             if tup[1]:
-                mass_sum = mass_sum + int(tup[1]) * data[tup[0]]
+                mass_sum = mass_sum + int(tup[1]) * self._elements_mass[tup[0]]
             else:
-                mass_sum = mass_sum + data[tup[0]]
-    return mass_sum
+                mass_sum = mass_sum + self._elements_mass[tup[0]]
+        return mass_sum
 
 
 def parse_lipid_name(name=None):
@@ -123,14 +411,61 @@ def get_mass_from_name(name=None, elements_mass_dict=None, head_group_mass_dict
     try:
         # mass = head_group's mass + (ncarbons * carbon_mass) + (ncarbons * 2 + 1) * hydrogen_mass
         mass = (head_group_mass_dict[parsed[0]]  + (elements_mass_dict['C'] * int(parsed[1])) # head group and ncarbons mass
-                                                + (int(parsed[1]) * 2 + 1) * int(elements_mass_dict['H']) # total possible hydrogen mass
-                                                - (int(parsed[2]) * 2) * int(elements_mass_dict['H'])) # minus hydrogen mass replaced by double bonds
+                                                + (int(parsed[1]) * 2 + 1) * elements_mass_dict['H'] # total possible hydrogen mass
+                                                - (int(parsed[2]) * 2) * elements_mass_dict['H']) # minus hydrogen mass replaced by double bonds
     except:
         print ("Some elements and head group not found")
     return mass
 
 
 
+def parse_lipid_names(names=None):
+    """
+    This function parses a list or pandas.Series of lipid names that follow our naming convention,
+    GROUP|cbs:dbs|(c1:d1~c2:d2)[adduct], into a columnar table. Each distinct name is only parsed once, and the distinct
+    names are parsed together by one regular expression search (see _parse_unique_lipid_names()).
+    Chains written with other separators, such as FAHFA|40:9|(MS2-20:4,20:5)[-H], are parsed as well.
+    :param names: A list or pandas.Series of lipid name strings.
+    :return: A new pandas.DataFrame, with one row per name (and the same index as 'names' if it is a Series), and the
+    columns: 'group', 'total_carbons', 'total_double_bonds', 'n_chains', 'chains' (a tuple of (carbons, double bonds)
+    tuples) and 'adduct'. Names that do not follow the convention have missing values and a total_carbons of -1.
+    """
+    if names is None:
+        raise ValueError("The 'names' parameter must be specified!")
+    names = pd.Series(names)
+    codes, uniques = pd.factorize(names.to_numpy(dtype=object))
+    parsed = _parse_unique_lipid_names(uniques, with_chains=True)
+    positions = np.where(codes >= 0, codes, len(uniques))    # missing names take the last, unparsed row
+    return pd.DataFrame({column: values[positions] for column, values in parsed.items()}, index=names.index)
+
+
+def get_masses_from_names(names=None, elements_mass_dict=None, head_group_mass_dict=None, calculator=None):
+    """
+    This function calculates the masses of a list or pandas.Series of lipid names at once. It uses the same formula as
+    get_mass_from_name(), evaluated as one array expression over the distinct parsed names (see parse_lipid_names()).
+    :param names: A list or pandas.Series of lipid name strings.
+    :param elements_mass_dict: See get_mass_from_name().
+    :param head_group_mass_dict: See get_mass_from_name().
+    :param calculator: An optional FormulaMassCalculator. When given, the mass delta of each name's adduct (ex: [NH4],
+    [-H]) is added, otherwise the neutral masses are returned.
+    :return: A numpy float64 array of masses. Names whose head group is unknown have a NaN mass.
+    """
+    if names is None or elements_mass_dict is None or head_group_mass_dict is None:
+        raise ValueError("The 'names', 'elements_mass_dict', and 'head_group_mass_dict' parameters must be specified!")
+    codes, uniques = pd.factorize(pd.Series(names).to_numpy(dtype=object))
+    parsed = _parse_unique_lipid_names(uniques, with_chains=False)
+    head_group_masses = np.array([head_group_mass_dict.get(group, np.nan) for group in parsed['group']], dtype=np.float64)
+    ncarbons = parsed['total_carbons'].astype(np.float64)
+    ndouble_bonds = parsed['total_double_bonds'].astype(np.float64)
+    # mass = head_group's mass + (ncarbons * carbon_mass) + (ncarbons * 2 + 1 - ndouble_bonds * 2) * hydrogen_mass
+    masses = (head_group_masses + elements_mass_dict['C'] * ncarbons
+              + (ncarbons * 2 + 1 - ndouble_bonds * 2) * elements_mass_dict['H'])
+    if calculator is not None:
+        masses = masses + np.array([0.0 if adduct is None else calculator.get_adduct_mass(adduct)
+                                    for adduct in parsed['adduct']], dtype=np.float64)
+    return masses[np.where(codes >= 0, codes, len(uniques))]
+
+
 def get_name_from_carbons_double_bonds(group=None, ncarbons=None, ndouble_bonds=None):
     """
     This function accept a lipid group, number of carbons, and number of double bonds as arguments and return a name string
@@ -166,7 +501,111 @@ def get_name_from_double_chains(group=None, chain_1=(0, 0), chain_2=(0, 0)):
 
 
 def build_lipids_from_group_chains(group=None, chains=None):
-    pass
+    """
+    This function return a lipid name from any number of chain tuples passed in as arguments, ex: ('TAG', [(16, 0),
+    (18, 1), (18, 2)]) returns 'TAG|52:3|(16:0~18:1~18:2)'. NOTE: This function perform no test on whether the resulting
+    lipid name is valid!
+    :param group: A lipid group string. Ex: TAG, PI, DAG ...
+    :param chains: A list of tuples that contain the number of carbons and double bonds of each chain. Ex: [(16, 0), (18, 1)]
+    :return: A lipid name string
+    """
+    if group is None or chains is None:
+        raise ValueError("'group' and 'chains' parameters must be specified!")
+    name = (get_name_from_carbons_double_bonds(group=group, ncarbons=sum(chain[0] for chain in chains),
+                                               ndouble_bonds=sum(chain[1] for chain in chains))
+            + "(%s)" % "~".join("%d:%d" % (chain[0], chain[1]) for chain in chains))
+    return name
+
+
+def generate_lipid_library(group_chains=None, elements_mass_dict=None, head_group_mass_dict=None,
+                           fragment_mass_dict=None, adduct_dict=None, calculator=None, batch_size=100000):
+    """
+    This function lazily enumerates every head group x fatty acyl chains combination and yields the resulting library of
+    names and precursor/fragment mass pairs in batches. Chains are combined without regard to their position, so
+    positional isomers (ex: PC 16:0~18:1 and PC 18:1~16:0) are only generated once. Masses are computed for a whole batch
+    at once, with the same formula as get_mass_from_name().
+    The fragment mass of a group is taken from 'fragment_mass_dict' when the group is in it (ex: the phosphocholine
+    fragment of PC). Otherwise, one mass pair is generated for each distinct chain of a lipid, with the fragment mass
+    being the precursor mass minus the neutral loss of that chain as a fatty acid (CnH(2n-2d)O2).
+    :param group_chains: A dictionary of lipid groups and a (number of chains, list of chain tuples) pair. Ex:
+    {'PC': (2, [(16, 0), (18, 1)]), 'TAG': (3, [(16, 0), (18, 1), (18, 2)])}
+    :param elements_mass_dict: A dictionary of element symbols and their masses, it must contain 'C', 'H' and 'O'.
+    :param head_group_mass_dict: A dictionary of head groups and their masses. See get_mass_from_name().
+    :param fragment_mass_dict: An optional dictionary of lipid groups and their fixed fragment mass.
+    :param adduct_dict: An optional dictionary of lipid groups and their adduct string. Ex: {'TAG': 'NH4', 'PC': 'H'}.
+    The adduct is appended to the names, and its mass is added to the precursor mass. It requires 'calculator'.
+    :param calculator: A FormulaMassCalculator used to compute the adduct masses.
+    :param batch_size: The maximum number of lipids enumerated at once, which bounds memory use.
+    :return: A generator of pandas.DataFrame objects with the columns 'lipid_name', 'precursor' and 'fragment'.
+    """
+    if group_chains is None or elements_mass_dict is None or head_group_mass_dict is None:
+        raise ValueError("The 'group_chains', 'elements_mass_dict', and 'head_group_mass_dict' parameters must be specified!")
+    if fragment_mass_dict is None:
+        fragment_mass_dict = dict()
+    if adduct_dict is None:
+        adduct_dict = dict()
+    if adduct_dict and calculator is None:
+        raise ValueError("The 'calculator' parameter must be specified to compute adduct masses!")
+    carbon_mass, hydrogen_mass, oxygen_mass = elements_mass_dict['C'], elements_mass_dict['H'], elements_mass_dict['O']
+    for group, (n_chains, chains) in group_chains.items():
+        adduct = adduct_dict.get(group)
+        adduct_mass = calculator.get_adduct_mass(adduct) if adduct else 0.0
+        suffix = "[%s]" % adduct if adduct else ""
+        combinations = itertools.combinations_with_replacement(sorted(set(tuple(chain) for chain in chains)), n_chains)
+        while True:
+            batch = list(itertools.islice(combinations, batch_size))
+            if not batch:
+                break
+            chain_array = np.array(batch, dtype=np.int64).reshape(len(batch), n_chains, 2)
+            ncarbons = chain_array[:, :, 0].sum(axis=1)
+            ndouble_bonds = chain_array[:, :, 1].sum(axis=1)
+            precursors = (head_group_mass_dict[group] + carbon_mass * ncarbons
+                          + (ncarbons * 2 + 1 - ndouble_bonds * 2) * hydrogen_mass + adduct_mass)
+            names = np.array([build_lipids_from_group_chains(group=group, chains=combination) + suffix
+                              for combination in batch], dtype=object)
+            if group in fragment_mass_dict:
+                fragments = np.full(len(batch), fragment_mass_dict[group], dtype=np.float64)
+            else:
+                # one mass pair per distinct chain: chains are sorted, so a chain is distinct from the ones before it
+                # when it differs from the previous chain of the same lipid
+                distinct = np.ones((len(batch), n_chains), dtype=bool)
+                distinct[:, 1:] = np.any(chain_array[:, 1:] != chain_array[:, :-1], axis=2)
+                rows, positions = np.nonzero(distinct)
+                chain_carbons = chain_array[rows, positions, 0]
+                chain_double_bonds = chain_array[rows, positions, 1]
+                neutral_losses = (carbon_mass * chain_carbons + hydrogen_mass * (chain_carbons * 2 - chain_double_bonds * 2)
+                                  + oxygen_mass * 2)
+                names = names[rows]
+                precursors = precursors[rows]
+                fragments = precursors - neutral_losses
+            yield pd.DataFrame({'lipid_name': names, 'precursor': precursors, 'fragment': fragments})
+
+
+def build_mass_pair_index(library_batches=None):
+    """
+    This function builds a sorted MassPairIndex from library batches, such as the ones yielded by
+    generate_lipid_library(). The index can then be saved with MassPairIndex.save() and reloaded with
+    MassPairIndex.load(), so a lab's library only has to be rebuilt when its chains or head groups change.
+    :param library_batches: An iterable of pandas.DataFrame objects with at least the columns 'lipid_name', 'precursor'
+    and 'fragment'.
+    :return: A MassPairIndex.
+    """
+    if library_batches is None:
+        raise ValueError("The 'library_batches' parameter must be specified!")
+    # keep the columns of each batch as it is yielded, the batches themselves are not held
+    pieces = dict()
+    for batch in library_batches:
+        if pieces and list(batch) != list(pieces):
+            raise ValueError("Every library batch must have the same columns, in the same order!")
+        for column in batch:
+            pieces.setdefault(column, []).append(batch[column].to_numpy())
+    if not pieces:
+        return MassPairIndex(pd.DataFrame({'lipid_name': [], 'precursor': [], 'fragment': []}))
+    columns = {column: np.concatenate(pieces.pop(column)) for column in list(pieces)}
+    # sort on precursor first, then fragment, like MassPairIndex.__init__() but with one copy of each column at a time
+    order = np.lexsort((columns['fragment'], columns['precursor']))
+    library = pd.DataFrame({column: columns.pop(column)[order] for column in list(columns)}, copy=False)
+    return MassPairIndex.from_sorted_library(library)
 
 
 def get_lipid_group_from_name(name=None):
@@ -177,4 +616,49 @@ def get_lipid_group_from_name(name=None):
     """
     if name is None:
         raise  ValueError("The 'name' parameter must be specified!")
-    return re.match('\w+', name)[0]
\ No newline at end of file
+    return re.match('\w+', name)[0]
+
+
+#--------------------------------------------------- helper methods----------------------------------------------//
+
+_LIPID_NAME_REGEX = re.compile(r'^(?:[^\S\n]*(?P<group>[^|\s]+)\|(?P<total_carbons>\d+):(?P<total_double_bonds>\d+)\|'
+                               r'(?:\((?P<chains>[^)\n]*)\))?(?:\[(?P<adduct>[^\]\n]*)\])?)?.*$', re.MULTILINE)
+_CHAIN_REGEX = re.compile(r'(\d+):(\d+)')
+
+
+def _parse_unique_lipid_names(uniques, with_chains=True):
+    """
+    A helper method for 'parse_lipid_names()' and 'get_masses_from_names()', it parses distinct lipid names with one
+    findall over the names joined by line breaks, and the chains of each distinct chains string once.
+    :param uniques: A numpy array of distinct lipid names.
+    :param with_chains: Whether to parse the chains ('n_chains' and 'chains') as well.
+    :return: A dictionary of column names and numpy arrays, with one value per name plus a last, unparsed name.
+    """
+    names = [name if isinstance(name, str) else '' for name in uniques.tolist()] + ['']
+    fields = _LIPID_NAME_REGEX.findall('\n'.join(names))
+    if len(fields) != len(names):
+        # some names span several lines, they are matched one by one
+        fields = [_LIPID_NAME_REGEX.match(name).groups('') for name in names]
+    groups, total_carbons, total_double_bonds, chains, adducts = zip(*fields)
+    parsed = {'group': np.array([group or None for group in groups], dtype=object),
+              'total_carbons': np.array([int(value) if value else -1 for value in total_carbons], dtype=np.int64),
+              'total_double_bonds': np.array([int(value) if value else -1 for value in total_double_bonds], dtype=np.int64)}
+    if with_chains:
+        chain_codes, chain_uniques = pd.factorize(np.array(chains, dtype=object))
+        unique_chains = [tuple([(int(carbons), int(double_bonds)) for carbons, double_bonds in _CHAIN_REGEX.findall(text)])
+                         for text in chain_uniques]
+        parsed['n_chains'] = np.array([len(chain) for chain in unique_chains], dtype=np.int64)[chain_codes]
+        parsed['chains'] = np.fromiter(unique_chains, dtype=object, count=len(unique_chains))[chain_codes]
+    parsed['adduct'] = np.array([adduct or None for adduct in adducts], dtype=object)
+    return parsed
+
+
+@lru_cache(maxsize=None)
+def _get_formula_mass_calculator(elements_mass_file):
+    """
+    A helper method for 'get_mass_from_formula()', it keeps one FormulaMassCalculator per elements mass file so the file
+    is only read once per process.
+    :param elements_mass_file: The absolute path to the elements mass JSON file.
+    :return: A FormulaMassCalculator.
+    """
+    return FormulaMassCalculator(elements_mass_file=elements_mass_file)
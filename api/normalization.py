@@ -0,0 +1,129 @@
+"""
+
+Created on: 10/16/2026
+
+This module contains the normalization of lipid intensities to internal standards. Internal standards are known lipids
+mixed directly into the samples at a known concentration.
+"""
+import numpy as np
+import pandas as pd
+
+from .molecules_parser import parse_lipid_names
+
+
+class InternalStandardNormalizer(object):
+    """
+    A normalizer built from a lab's panel of internal standards. Each lipid is matched to the standard of its class
+    (lipid group); when a class has several standards, the one with the nearest total number of carbons is used, and
+    lipids of a class without any standard fall back to the standard with the nearest total number of carbons.
+    The lipid to standard mapping is kept for every name seen, so repeated runs on the same panel reuse it, and the
+    intensities of all samples are normalized with one broadcasted array operation:
+        normalized = intensity / standard_intensity * standard_concentration
+    """
+
+    def __init__(self, standards=None, name_column='lipid_name', concentration_column='concentration'):
+        """
+        :param standards: A pandas.DataFrame of internal standards, with one row per standard.
+        :param name_column: A string column name where the names of the standards can be found. Names must follow our
+        naming convention, read project_design_guidelines.md for more info.
+        :param concentration_column: A string column name where the concentrations of the standards can be found.
+        """
+        if standards is None:
+            raise ValueError("The 'standards' parameter must be specified!")
+        self.names = standards[name_column].tolist()
+        self.concentrations = standards[concentration_column].to_numpy(dtype=np.float64)
+        parsed = parse_lipid_names(self.names)
+        self._groups = parsed['group'].to_numpy()
+        self._carbons = parsed['total_carbons'].to_numpy(dtype=np.int64)
+        self._mapping = dict()   # lipid name -> position of its standard in 'names', -1 when there is none
+
+    def map_standards(self, names=None):
+        """
+        This method returns the position of the standard of each lipid name.
+        :param names: A list or pandas.Series of lipid names.
+        :return: A numpy integer array of positions in 'names' of this normalizer, -1 for lipids without a standard.
+        """
+        if names is None:
+            raise ValueError("The 'names' parameter must be specified!")
+        codes, uniques = pd.factorize(pd.Series(names))
+        unmapped = [name for name in uniques if name not in self._mapping]
+        if unmapped:
+            self._mapping.update(zip(unmapped, self._find_standards(unmapped).tolist()))
+        unique_positions = np.array([self._mapping[name] for name in uniques] + [-1], dtype=np.int64)
+        return unique_positions[np.where(codes >= 0, codes, len(uniques))]
+
+    def normalize(self, dataframe=None, sample_columns=None, name_column='lipid_name'):
+        """
+        This method normalizes the intensities of every lipid of a dataset to its internal standard. The intensity of a
+        standard in a sample is the sum of the intensities of the rows named after that standard. Lipids without a
+        standard, or whose standard is not found in the dataset, get missing values. The original DataFrame is unmodified.
+        :param dataframe: A pandas.DataFrame of named lipids and their intensities.
+        :param sample_columns: A list of column names that contain the intensities of each sample.
+        :param name_column: A string column name where the lipid names can be found.
+        :return: A new pandas.DataFrame with normalized intensities (in the unit of the standard concentrations).
+        """
+        if dataframe is None or sample_columns is None:
+            raise ValueError("Both 'dataframe' and 'sample_columns' parameters must be specified!")
+        names = dataframe[name_column]
+        intensities = dataframe[sample_columns].to_numpy(dtype=np.float64)
+
+        # the intensities of every standard in every sample, plus a last row of NaN for lipids without a standard
+        standard_codes = pd.Categorical(names, categories=self.names).codes
+        found = standard_codes >= 0
+        standard_intensities = np.full((len(self.names) + 1, len(sample_columns)), np.nan)
+        if found.any():
+            summed = pd.DataFrame(intensities[found]).groupby(standard_codes[found]).sum()
+            standard_intensities[summed.index.to_numpy()] = summed.to_numpy()
+        concentrations = np.append(self.concentrations, np.nan)
+
+        positions = self.map_standards(names)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            normalized = intensities / standard_intensities[positions] * concentrations[positions][:, None]
+        new_df = dataframe.copy()
+        new_df[sample_columns] = normalized
+        return new_df
+
+    def cache_token(self):
+        """
+        :return: What the normalization depends on, the names and concentrations of the standards but not the lipid to
+        standard mapping kept so far, to key the methods of this normalizer in a stage_cache.StageCache.
+        """
+        return self.names, self.concentrations
+
+    def _find_standards(self, names):
+        # parse the names, then match every lipid of a group at once against the standards of that group
+        parsed = parse_lipid_names(names)
+        groups = parsed['group'].to_numpy()
+        carbons = parsed['total_carbons'].to_numpy(dtype=np.int64)
+        positions = np.full(len(names), -1, dtype=np.int64)
+        matched = np.zeros(len(names), dtype=bool)
+        for group in pd.unique(self._groups[pd.notnull(self._groups)]):
+            members = groups == group
+            candidates = np.flatnonzero(self._groups == group)
+            positions[members] = _nearest_carbons(carbons[members], candidates, self._carbons)
+            matched |= members
+        # fall back to the nearest number of carbons among all standards
+        fallback = ~matched & pd.notnull(groups)
+        candidates = np.flatnonzero(self._carbons >= 0)
+        if fallback.any() and len(candidates):
+            positions[fallback] = _nearest_carbons(carbons[fallback], candidates, self._carbons)
+        return positions
+
+
+#--------------------------------------------------- helper methods----------------------------------------------//
+
+def _nearest_carbons(carbons, candidates, standard_carbons):
+    """
+    A helper method for 'InternalStandardNormalizer', it returns, for each number of carbons, the candidate standard with
+    the nearest number of carbons (the smaller one on ties).
+    :param carbons: A numpy integer array of number of carbons.
+    :param candidates: A non empty numpy array of positions of candidate standards.
+    :param standard_carbons: A numpy integer array of the number of carbons of every standard.
+    :return: A numpy integer array of standard positions.
+    """
+    candidates = candidates[np.argsort(standard_carbons[candidates], kind='stable')]
+    sorted_carbons = standard_carbons[candidates]
+    upper = np.clip(np.searchsorted(sorted_carbons, carbons, side='left'), 0, len(candidates) - 1)
+    lower = np.clip(upper - 1, 0, len(candidates) - 1)
+    use_lower = np.abs(carbons - sorted_carbons[lower]) <= np.abs(sorted_carbons[upper] - carbons)
+    return candidates[np.where(use_lower, lower, upper)]
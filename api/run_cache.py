@@ -0,0 +1,283 @@
+"""
+
+Created on: 10/16/2026
+
+This module contains a columnar on-disk cache for parsed runs. The first time a run file (csv or xlsx) is read, each of
+its columns is written to a raw binary file next to a JSON metadata sidecar; later reads memory-map these files instead of
+parsing the run again.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .file_directory_parser import read_data_in_chunks
+
+METADATA_FILE = 'metadata.json'
+
+
+class RunCache(object):
+    """
+    A cache of parsed runs, stored in a directory. Each run is stored in its own entry, keyed by the absolute path of the
+    source file, and stamped with the source's modification time and size and the dtype schema it was parsed with: when
+    the source or the schema changes, the entry is automatically rebuilt on the next read.
+    Numeric columns are stored as raw arrays and reloaded with numpy.memmap, so a cached run is reloaded without copying
+    its intensities; nullable integer columns also store a mask of their missing values. Categorical and text columns are
+    stored as integer codes, and their categories are kept in the metadata sidecar. A column whose dtype changes between
+    chunks (see file_directory_parser.read_data_in_chunks()) is stored in a dtype that fits every chunk.
+    DataFrames returned by read() are backed by read-only memory maps, the filters of api/filters.py return new
+    DataFrames and can be used on them as usual.
+    """
+
+    def __init__(self, cache_dir=None):
+        """
+        :param cache_dir: The absolute path to the directory where the cache entries are stored. It is created if it does
+        not exist.
+        """
+        if cache_dir is None:
+            raise ValueError("The 'cache_dir' parameter must be specified!")
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def read(self, file_path=None, dtype_schema=None, chunk_size=100000):
+        """
+        This method returns the run stored in a file as a pandas.DataFrame(). The file is parsed and cached on the first
+        read, or when it changed since it was cached, or when it was cached with another 'dtype_schema'; otherwise the
+        cached columns are memory-mapped.
+        :param file_path: The absolute path string to a csv or xlsx file.
+        :param dtype_schema: See file_directory_parser.read_data_in_chunks().
+        :param chunk_size: The number of rows parsed at once when the run is cached.
+        :return: A pandas.DataFrame object.
+        """
+        if file_path is None:
+            raise ValueError("The 'file_path' parameter must be specified!")
+        if not self.is_cached(file_path, dtype_schema=dtype_schema):
+            self._write_entry(file_path, dtype_schema, chunk_size)
+        return self._load_entry(file_path)
+
+    def is_cached(self, file_path=None, dtype_schema=None):
+        """
+        :param file_path: The absolute path string to a csv or xlsx file.
+        :param dtype_schema: See file_directory_parser.read_data_in_chunks().
+        :return: True if the file has a cache entry that is up to date with the file and was parsed with the same
+        'dtype_schema', False otherwise.
+        """
+        if file_path is None:
+            raise ValueError("The 'file_path' parameter must be specified!")
+        metadata = self._read_metadata(file_path)
+        return (metadata is not None and metadata['stamp'] == _get_file_stamp(file_path)
+                and metadata.get('schema') == _describe_schema(dtype_schema))
+
+    def invalidate(self, file_path=None):
+        """
+        This method removes the cache entry of a file, if any.
+        :param file_path: The absolute path string to a csv or xlsx file.
+        :return: This cache.
+        """
+        if file_path is None:
+            raise ValueError("The 'file_path' parameter must be specified!")
+        shutil.rmtree(self._get_entry_dir(file_path), ignore_errors=True)
+        return self
+
+    def clear(self):
+        """
+        This method removes every cache entry.
+        :return: This cache.
+        """
+        for entry in os.listdir(self.cache_dir):
+            shutil.rmtree(os.path.join(self.cache_dir, entry), ignore_errors=True)
+        return self
+
+    def _get_entry_dir(self, file_path):
+        key = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key)
+
+    def _read_metadata(self, file_path):
+        try:
+            with open(os.path.join(self._get_entry_dir(file_path), METADATA_FILE)) as json_data:
+                return json.load(json_data)
+        except (IOError, ValueError):
+            return None
+
+    def _write_entry(self, file_path, dtype_schema, chunk_size):
+        stamp = _get_file_stamp(file_path)
+        # write the entry in a temporary directory first, so a failed write never leaves a half written entry
+        temp_dir = tempfile.mkdtemp(dir=self.cache_dir)
+        columns = None
+        handles = dict()    # column name -> {'data': file, 'mask': file}
+        try:
+            category_codes = dict()     # column name -> {category: code}, across all chunks
+            n_rows = 0
+            for chunk in read_data_in_chunks(file_path, chunk_size=chunk_size, dtype_schema=dtype_schema):
+                if columns is None:
+                    columns = [_describe_column(name, dtype, position)
+                               for position, (name, dtype) in enumerate(chunk.dtypes.items())]
+                    handles = {column['name']: _open_column(temp_dir, column) for column in columns}
+                for position, column in enumerate(columns):
+                    values = chunk[column['name']]
+                    target = _widen_column(column, _describe_column(column['name'], values.dtype, position))
+                    if target != column:
+                        # a later chunk that does not fit the storage of the column (ex: text after numbers): the
+                        # values written so far are converted to a storage that fits both
+                        _close_column(handles[column['name']])
+                        stored = _read_column(temp_dir, column, n_rows, category_codes.get(column['name']))
+                        columns[position] = column = target
+                        handles[column['name']] = _open_column(temp_dir, column)
+                        _write_column(handles[column['name']], column, stored,
+                                      category_codes.setdefault(column['name'], dict()))
+                    _write_column(handles[column['name']], column, values,
+                                  category_codes.setdefault(column['name'], dict()))
+                n_rows = n_rows + len(chunk)
+            for column_handles in handles.values():
+                _close_column(column_handles)
+            for column in columns or []:
+                if column['kind'] == 'category':
+                    codes = category_codes.get(column['name'], dict())
+                    column['categories'] = sorted(codes, key=codes.get)
+            metadata = {'source': os.path.abspath(file_path), 'stamp': stamp, 'schema': _describe_schema(dtype_schema),
+                        'n_rows': n_rows, 'columns': columns or []}
+            with open(os.path.join(temp_dir, METADATA_FILE), 'w') as json_file:
+                json.dump(metadata, json_file)
+            entry_dir = self._get_entry_dir(file_path)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.rename(temp_dir, entry_dir)
+        except BaseException:
+            for column_handles in handles.values():
+                _close_column(column_handles)
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+    def _load_entry(self, file_path):
+        entry_dir = self._get_entry_dir(file_path)
+        metadata = self._read_metadata(file_path)
+        n_rows = metadata['n_rows']
+        data = dict()
+        for column in metadata['columns']:
+            values = _map_file(os.path.join(entry_dir, column['file']), column['dtype'], n_rows)
+            if column['kind'] == 'category':
+                values = pd.Categorical.from_codes(values, categories=column['categories'])
+            elif column['kind'] == 'nullable':
+                mask = _map_file(os.path.join(entry_dir, column['mask_file']), np.dtype(bool).str, n_rows)
+                values = pd.api.types.pandas_dtype(column['nullable_dtype']).construct_array_type()(values, mask)
+            data[column['name']] = values
+        return pd.DataFrame(data, columns=[column['name'] for column in metadata['columns']], copy=False)
+
+
+#--------------------------------------------------- helper methods----------------------------------------------//
+
+def _get_file_stamp(file_path):
+    """
+    A helper method for 'RunCache', it returns the modification time and size of a file, used to detect changed sources.
+    """
+    stat = os.stat(file_path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _describe_schema(dtype_schema):
+    """
+    A helper method for 'RunCache', it returns a JSON friendly description of a dtype schema, stored with each entry so
+    an entry parsed with another schema is not returned.
+    """
+    if dtype_schema is None:
+        return None
+    return [[column, str(pd.api.types.pandas_dtype(dtype))] for column, dtype in dtype_schema.items()]
+
+
+def _describe_column(name, dtype, position):
+    """
+    A helper method for 'RunCache', it describes how a column of a given dtype is stored: categories and text as integer
+    codes, nullable numbers (ex: 'Int64') as values and a mask of missing values, other numbers as raw values.
+    """
+    if isinstance(dtype, pd.CategoricalDtype) or not pd.api.types.is_numeric_dtype(dtype):
+        return {'name': name, 'kind': 'category', 'dtype': np.dtype(np.int32).str, 'file': '%d.bin' % position}
+    if isinstance(dtype, pd.api.extensions.ExtensionDtype):
+        return {'name': name, 'kind': 'nullable', 'dtype': np.dtype(dtype.numpy_dtype).str, 'nullable_dtype': dtype.name,
+                'file': '%d.bin' % position, 'mask_file': '%d.mask' % position}
+    return {'name': name, 'kind': 'numeric', 'dtype': np.dtype(dtype).str, 'file': '%d.bin' % position}
+
+
+def _widen_column(column, chunk_column):
+    """
+    A helper method for 'RunCache', it returns the storage of a column that fits both its current storage and the values
+    of a new chunk: categories when either is categorical, otherwise the common numeric dtype, nullable when it is an
+    integer dtype and either is nullable.
+    """
+    if all(column.get(key) == chunk_column.get(key) for key in ('kind', 'dtype', 'nullable_dtype')):
+        return column
+    if 'category' in (column['kind'], chunk_column['kind']):
+        return _describe_column(column['name'], pd.CategoricalDtype(), int(column['file'].split('.')[0]))
+    dtype = np.result_type(np.dtype(column['dtype']), np.dtype(chunk_column['dtype']))
+    if dtype.kind in 'biu' and 'nullable' in (column['kind'], chunk_column['kind']):
+        dtype = pd.api.types.pandas_dtype({'b': 'boolean', 'i': 'Int%d', 'u': 'UInt%d'}[dtype.kind].replace(
+            '%d', str(dtype.itemsize * 8)))
+    return _describe_column(column['name'], dtype, int(column['file'].split('.')[0]))
+
+
+def _open_column(directory, column):
+    """
+    A helper method for 'RunCache', it opens the files a column is written to.
+    """
+    handles = {'data': open(os.path.join(directory, column['file']), 'wb')}
+    if column['kind'] == 'nullable':
+        handles['mask'] = open(os.path.join(directory, column['mask_file']), 'wb')
+    return handles
+
+
+def _close_column(handles):
+    for handle in handles.values():
+        handle.close()
+
+
+def _write_column(handles, column, values, codes):
+    """
+    A helper method for 'RunCache', it appends the values of a chunk to the files of a column.
+    """
+    if column['kind'] == 'category':
+        values = _get_global_codes(values, codes)
+    elif column['kind'] == 'nullable':
+        values = pd.Series(values)
+        missing = values.isna().to_numpy()
+        np.ascontiguousarray(missing, dtype=bool).tofile(handles['mask'])
+        values = values.to_numpy(dtype=column['dtype'], na_value=0)
+    else:
+        values = pd.Series(values).to_numpy(dtype=column['dtype'], na_value=np.nan)
+    np.ascontiguousarray(values, dtype=column['dtype']).tofile(handles['data'])
+
+
+def _read_column(directory, column, n_rows, codes):
+    """
+    A helper method for 'RunCache', it reads back the values written so far for a column, as a pandas.Series.
+    """
+    values = np.fromfile(os.path.join(directory, column['file']), dtype=column['dtype'], count=n_rows)
+    if column['kind'] == 'category':
+        categories = sorted(codes, key=codes.get) if codes else []
+        return pd.Series(pd.Categorical.from_codes(values, categories=categories))
+    if column['kind'] == 'nullable':
+        mask = np.fromfile(os.path.join(directory, column['mask_file']), dtype=bool, count=n_rows)
+        return pd.Series(pd.api.types.pandas_dtype(column['nullable_dtype']).construct_array_type()(values, mask))
+    return pd.Series(values)
+
+
+def _map_file(file_path, dtype, n_rows):
+    """
+    A helper method for 'RunCache', it memory-maps the values of a column file, read-only.
+    """
+    if n_rows:
+        return np.memmap(file_path, dtype=dtype, mode='r', shape=(n_rows,))
+    return np.empty(0, dtype=dtype)
+
+
+def _get_global_codes(values, codes):
+    """
+    A helper method for 'RunCache', it converts the values of a chunk into category codes that are shared by every chunk
+    of a run. New categories are added to 'codes'. Missing values get the code -1.
+    """
+    categorical = pd.Categorical(values)
+    lookup = np.array([codes.setdefault(category, len(codes)) for category in categorical.categories.tolist()] + [-1],
+                      dtype=np.int32)
+    # code -1 (missing) picks the last element of the lookup, which is -1 as well
+    return lookup[categorical.codes]
@@ -0,0 +1,348 @@
+"""
+
+Created on: 10/16/2026
+
+This module contains a content-addressed on-disk cache of the outputs of pipeline stages (filtering, annotation, isotopic
+correction...). When a pipeline is run again after a parameter change, the stages before the change are not recomputed.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+ENTRY_EXTENSION = '.pkl'
+
+
+class StageCache(object):
+    """
+    A cache of stage outputs, stored as pickle files in a directory. An output is keyed by a hash of the stage's input,
+    its function and its parameters, so the key changes whenever anything that could change the output does. Inputs are
+    either data, hashed by content (pandas.util.hash_pandas_object() for DataFrames), or the key of the upstream stage
+    that produced them, which avoids hashing intermediate results again.
+    The total size of the entries is bounded by 'max_bytes': when it is exceeded, the least recently used entries are
+    removed. Reading an entry marks it as recently used.
+    Functions are identified by their module, qualified name, bytecode, default arguments and closure variables, with
+    the arguments of partials hashed by content, so lambdas and closures with different code or captured values get
+    different keys. Functions wrapped by a decorator (ex: functools.lru_cache) are identified by the function they wrap
+    as well. The instance of a bound method, or an object given as a parameter, is identified by the content of what its
+    cache_token() method returns: the configuration its results depend on, without the caches it fills as it is used
+    (ex: the library of MassPairIndex.assign_names, or the standards of InternalStandardNormalizer.normalize). Methods of
+    classes without cache_token() are refused with a TypeError, since their key would miss the state of the instance.
+    Global variables read by a function and the code of the functions it calls are not part of the key: a change in them
+    is not detected, use clear() after such a change (ex: an upgrade).
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=1 << 30):
+        """
+        :param cache_dir: The absolute path to the directory where the entries are stored. It is created if it does not
+        exist.
+        :param max_bytes: The maximum total size of the entries, in bytes.
+        """
+        if cache_dir is None:
+            raise ValueError("The 'cache_dir' parameter must be specified!")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get_key(self, function=None, input_key=None, parameters=None):
+        """
+        This method returns the key of the output of a function applied to an input with some parameters.
+        :param function: The stage function.
+        :param input_key: The key of the input, see hash_data().
+        :param parameters: A dictionary of keyword arguments of the function.
+        :return: A hexadecimal key string.
+        """
+        if function is None or input_key is None:
+            raise ValueError("Both 'function' and 'input_key' parameters must be specified!")
+        digest = hashlib.sha1(input_key.encode('ascii'))
+        digest.update(_hash_function(function))
+        for name in sorted(parameters or {}):
+            digest.update(name.encode('utf-8'))
+            digest.update(_hash_value(parameters[name]))
+        return digest.hexdigest()
+
+    def contains(self, key=None):
+        """
+        :param key: An entry key.
+        :return: True if the cache has an entry for the key, False otherwise.
+        """
+        if key is None:
+            raise ValueError("The 'key' parameter must be specified!")
+        return os.path.exists(self._get_entry_path(key))
+
+    def load(self, key=None):
+        """
+        This method returns the value of an entry and marks the entry as recently used.
+        :param key: An entry key.
+        :return: The cached value. A KeyError is raised when there is no entry for the key.
+        """
+        if key is None:
+            raise ValueError("The 'key' parameter must be specified!")
+        entry_path = self._get_entry_path(key)
+        try:
+            with open(entry_path, 'rb') as entry_file:
+                value = pickle.load(entry_file)
+        except FileNotFoundError:
+            raise KeyError(key)
+        os.utime(entry_path)
+        return value
+
+    def store(self, key=None, value=None):
+        """
+        This method writes an entry, then removes the least recently used entries if the cache is too large. A value
+        larger than 'max_bytes' is not stored.
+        :param key: An entry key.
+        :param value: A picklable value.
+        :return: This cache.
+        """
+        if key is None:
+            raise ValueError("The 'key' parameter must be specified!")
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return self
+        # write to a temporary file first, so a failed write never leaves a half written entry
+        handle, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, self._get_entry_path(key))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self._evict()
+        return self
+
+    def run(self, function=None, data=None, parameters=None, input_key=None):
+        """
+        This method returns the output of a stage, from the cache if it was computed before.
+        :param function: The stage function, called as function(data, **parameters).
+        :param data: The input of the stage.
+        :param parameters: A dictionary of keyword arguments of the function.
+        :param input_key: The key of the input. The default is None, which means the input is hashed by content.
+        :return: An (output, key) tuple. The key can be used as the 'input_key' of the next stage.
+        """
+        if function is None:
+            raise ValueError("The 'function' parameter must be specified!")
+        if input_key is None:
+            input_key = hash_data(data)
+        key = self.get_key(function, input_key, parameters)
+        try:
+            return self.load(key), key
+        except KeyError:
+            pass
+        output = function(data, **(parameters or {}))
+        self.store(key, output)
+        return output, key
+
+    def size(self):
+        """
+        :return: The total size of the entries, in bytes.
+        """
+        return sum(size for _, size, _ in self._list_entries())
+
+    def clear(self):
+        """
+        This method removes every entry.
+        :return: This cache.
+        """
+        for entry_path, _, _ in self._list_entries():
+            os.remove(entry_path)
+        return self
+
+    def _get_entry_path(self, key):
+        return os.path.join(self.cache_dir, key + ENTRY_EXTENSION)
+
+    def _list_entries(self):
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith(ENTRY_EXTENSION):
+                entry_path = os.path.join(self.cache_dir, file_name)
+                try:
+                    stat = os.stat(entry_path)
+                except FileNotFoundError:
+                    continue
+                entries.append((entry_path, stat.st_size, stat.st_mtime_ns))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._list_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for entry_path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
+            total = total - size
+
+
+class CachedPipeline(object):
+    """
+    A chain of stages whose outputs are kept in a StageCache. Stages are added with stage(), which returns this pipeline:
+        pipeline = (CachedPipeline(StageCache('/tmp/stages'))
+                    .stage('filters', FilterPipeline().neutral_loss().average_and_max(columns=samples).apply)
+                    .stage('annotation', mass_pair_index.assign_names, pm_tolerance=0.05)
+                    .stage('correction', isotopic_correction, sample_columns=samples))
+        corrected = pipeline.run(dataframe)
+    The key of each stage is chained from the key of the stage before it, and only the input of the first stage is
+    hashed. When run() is called, the keys of all stages are computed first; the last cached output is loaded and only
+    the stages after it are computed. Changing a parameter of the 'correction' stage above therefore reuses the cached
+    annotation, without even loading the filtered data. Stage functions are keyed as described in StageCache: changing a
+    global variable a stage reads, or a function it calls, requires clearing the cache.
+    """
+
+    def __init__(self, cache=None):
+        """
+        :param cache: A StageCache.
+        """
+        if cache is None:
+            raise ValueError("The 'cache' parameter must be specified!")
+        self.cache = cache
+        self.last_run = []      # the (stage name, key, status) of each stage of the last run
+        self._stages = []
+
+    def __len__(self):
+        return len(self._stages)
+
+    def stage(self, name=None, function=None, **parameters):
+        """
+        This method adds a stage at the end of the pipeline.
+        :param name: A name for the stage, used in 'last_run'.
+        :param function: The stage function, called as function(data, **parameters) with the output of the previous stage.
+        :param parameters: The keyword arguments of the function.
+        :return: This pipeline.
+        """
+        if name is None or function is None:
+            raise ValueError("Both 'name' and 'function' parameters must be specified!")
+        self._stages.append((name, function, parameters))
+        return self
+
+    def run(self, data=None):
+        """
+        This method runs every stage on some data, reusing the cached outputs.
+        :param data: The input of the first stage, usually a pandas.DataFrame.
+        :return: The output of the last stage. The status ('cached', 'computed' or 'skipped') of every stage is recorded
+        in 'last_run'.
+        """
+        if data is None:
+            raise ValueError("The 'data' parameter must be specified!")
+        keys = []
+        key = hash_data(data)
+        for name, function, parameters in self._stages:
+            key = self.cache.get_key(function, key, parameters)
+            keys.append(key)
+        statuses = ['skipped'] * len(self._stages)
+        # start after the last stage whose output is in the cache
+        start = 0
+        for position in range(len(keys) - 1, -1, -1):
+            try:
+                data = self.cache.load(keys[position])
+            except KeyError:
+                continue
+            statuses[position] = 'cached'
+            start = position + 1
+            break
+        for position in range(start, len(self._stages)):
+            _, function, parameters = self._stages[position]
+            data = function(data, **parameters)
+            self.cache.store(keys[position], data)
+            statuses[position] = 'computed'
+        self.last_run = [(stage[0], key, status) for stage, key, status in zip(self._stages, keys, statuses)]
+        return data
+
+
+def hash_data(data=None):
+    """
+    This function returns a hash of the content of some data: the values, index, column names and dtypes of a
+    pandas.DataFrame or pandas.Series, the values, dtype and shape of a numpy array, and the pickle of any other value.
+    :param data: The data to hash.
+    :return: A hexadecimal hash string.
+    """
+    return hashlib.sha1(_hash_value(data)).hexdigest()
+
+
+#--------------------------------------------------- helper methods----------------------------------------------//
+
+def _hash_value(value):
+    """
+    A helper method for 'StageCache', it returns the digest of the content of a value.
+    """
+    digest = hashlib.sha1(type(value).__name__.encode('utf-8'))
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        columns = value.columns if isinstance(value, pd.DataFrame) else [value.name]
+        dtypes = value.dtypes if isinstance(value, pd.DataFrame) else [value.dtype]
+        digest.update(repr([(str(column), str(dtype)) for column, dtype in zip(columns, dtypes)]).encode('utf-8'))
+    elif isinstance(value, np.ndarray):
+        digest.update(repr((value.dtype.str, value.shape)).encode('utf-8'))
+        digest.update(np.ascontiguousarray(value).tobytes() if value.dtype != object else pickle.dumps(value.tolist()))
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            digest.update(_hash_value(item))
+    elif isinstance(value, dict):
+        for name in sorted(value, key=repr):
+            digest.update(repr(name).encode('utf-8'))
+            digest.update(_hash_value(value[name]))
+    elif hasattr(value, 'cache_token') and not isinstance(value, type):
+        digest.update(_hash_value(value.cache_token()))
+    else:
+        digest.update(pickle.dumps(value, protocol=4))
+    return digest.digest()
+
+
+def _hash_function(function):
+    """
+    A helper method for 'StageCache', it returns the digest of a stage function: its qualified name, its code, default
+    arguments and closure variables, plus the function it wraps, the cache_token() of the instance of a bound method, or
+    the function and arguments of a partial.
+    """
+    if isinstance(function, partial):
+        return _hash_value((_hash_function(function.func), function.args, function.keywords))
+    digest = hashlib.sha1(('%s.%s' % (getattr(function, '__module__', None),
+                                      getattr(function, '__qualname__', type(function).__qualname__))).encode('utf-8'))
+    code_function = getattr(function, '__func__', function)
+    if hasattr(code_function, '__code__'):
+        # two lambdas, or two closures made by the same factory, share a qualified name but not their code or cells
+        digest.update(_hash_code(code_function.__code__))
+        digest.update(_hash_value(code_function.__defaults__))
+        digest.update(_hash_value(code_function.__kwdefaults__))
+        for cell in code_function.__closure__ or ():
+            try:
+                contents = cell.cell_contents
+            except ValueError:      # an empty cell
+                continue
+            if contents is code_function:    # a recursive nested function
+                continue
+            digest.update(_hash_function(contents) if callable(contents) and not isinstance(contents, type)
+                          else _hash_value(contents))
+    wrapped = getattr(function, '__wrapped__', None)
+    if wrapped is not None:
+        # ex: a functools.lru_cache wrapper, which has no code of its own
+        digest.update(_hash_function(wrapped))
+    instance = getattr(function, '__self__', None)
+    if instance is not None and not isinstance(instance, (type, type(os))):
+        # only the configuration of the instance, not the caches it fills, ex: the mapping of InternalStandardNormalizer
+        if not hasattr(instance, 'cache_token'):
+            raise TypeError('Cannot key the method %s of a %s instance: its class must define a cache_token() method '
+                            'that returns the configuration its results depend on!' % (
+                                getattr(function, '__name__', function), type(instance).__name__))
+        digest.update(_hash_value(instance.cache_token()))
+    return digest.digest()
+
+
+def _hash_code(code):
+    """
+    A helper method for 'StageCache', it returns the digest of a code object: its bytecode, the names it uses and its
+    constants, nested functions included.
+    """
+    digest = hashlib.sha1(code.co_code)
+    digest.update(repr(code.co_names).encode('utf-8'))
+    for constant in code.co_consts:
+        digest.update(_hash_code(constant) if isinstance(constant, type(code)) else repr(constant).encode('utf-8'))
+    return digest.digest()
@@ -0,0 +1,138 @@
+"""
+
+Created on: 10/16/2026
+
+This module contains the registry of the static data files (element masses, isotope abundances...). Each file is read
+and parsed once per process, and its content is frozen, so every function and every worker thread can share it without
+copying. Each lab can point the registry to its own files.
+"""
+import json
+import os
+import threading
+from types import MappingProxyType
+
+# The directory of the static data files shipped with the API, and the file name of each kind of static data
+STATIC_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static_data')
+STATIC_DATA_FILES = {'exact_masses': 'exact_masses.json',
+                     'isotope_abundances': 'isotope_abundances.json'}
+
+
+class StaticDataRegistry(object):
+    """
+    A registry of the static data of a lab. The registry resolves a kind of static data (ex: 'exact_masses') to a JSON
+    file, either the lab's override of that kind, or the file of the same name in 'static_dir'. Parsed files are kept in
+    a cache shared by every registry of the process, keyed by real path, so a file is parsed once however many registries
+    or functions use it. The data is returned frozen: objects as read-only mappings (types.MappingProxyType) and arrays as
+    tuples. Use to_mutable() to get a modifiable copy.
+        registry = StaticDataRegistry(overrides={'exact_masses': '/labs/our_lab/exact_masses.json'})
+        registry.exact_masses['C']
+    """
+
+    _loaded = dict()    # real path -> frozen data, shared by every registry
+    _lock = threading.Lock()
+
+    def __init__(self, static_dir=STATIC_DATA_DIR, overrides=None):
+        """
+        :param static_dir: The absolute path to the directory of the static data files.
+        :param overrides: A dictionary of kinds of static data and the absolute paths to the files used instead of the
+        ones in 'static_dir', ex: {'isotope_abundances': '/labs/our_lab/isotopes.json'}.
+        """
+        self.static_dir = static_dir
+        self.overrides = dict(overrides or {})
+
+    @property
+    def exact_masses(self):
+        return self.get('exact_masses')
+
+    @property
+    def isotope_abundances(self):
+        return self.get('isotope_abundances')
+
+    def get_path(self, name=None):
+        """
+        This method returns the file of a kind of static data.
+        :param name: A kind of static data, ex: 'exact_masses'.
+        :return: The absolute path to the JSON file.
+        """
+        if name is None:
+            raise ValueError("The 'name' parameter must be specified!")
+        if name in self.overrides:
+            return self.overrides[name]
+        return os.path.join(self.static_dir, STATIC_DATA_FILES.get(name, name + '.json'))
+
+    def get(self, name=None):
+        """
+        This method returns the frozen content of a kind of static data.
+        :param name: A kind of static data, ex: 'exact_masses'.
+        :return: A read-only mapping.
+        """
+        return self.load_file(self.get_path(name))
+
+    def set_override(self, name=None, file_path=None):
+        """
+        This method makes the registry use a lab's own file for a kind of static data.
+        :param name: A kind of static data, ex: 'exact_masses'.
+        :param file_path: The absolute path to the JSON file.
+        :return: This registry.
+        """
+        if name is None or file_path is None:
+            raise ValueError("Both 'name' and 'file_path' parameters must be specified!")
+        self.overrides[name] = file_path
+        return self
+
+    @classmethod
+    def load_file(cls, file_path=None):
+        """
+        This method returns the frozen content of a JSON file, parsing it only the first time it is requested.
+        :param file_path: The absolute path to the JSON file.
+        :return: The frozen JSON value, usually a read-only mapping.
+        """
+        if file_path is None:
+            raise ValueError("The 'file_path' parameter must be specified!")
+        key = os.path.realpath(file_path)
+        try:
+            return cls._loaded[key]
+        except KeyError:
+            pass
+        with cls._lock:
+            if key not in cls._loaded:
+                with open(key) as json_data:
+                    cls._loaded[key] = _freeze(json.load(json_data))
+            return cls._loaded[key]
+
+    @classmethod
+    def clear(cls):
+        """
+        This method empties the cache of parsed files, so edited files are read again.
+        :return: None
+        """
+        with cls._lock:
+            cls._loaded.clear()
+
+
+def to_mutable(data=None):
+    """
+    This function returns a modifiable deep copy of frozen static data: dictionaries instead of read-only mappings, and
+    lists instead of tuples.
+    :param data: Frozen data returned by a StaticDataRegistry.
+    :return: The copy.
+    """
+    if isinstance(data, MappingProxyType):
+        return {key: to_mutable(value) for key, value in data.items()}
+    if isinstance(data, tuple):
+        return [to_mutable(value) for value in data]
+    return data
+
+
+#--------------------------------------------------- helper methods----------------------------------------------//
+
+def _freeze(data):
+    """
+    A helper method for 'StaticDataRegistry', it recursively turns dictionaries into read-only mappings and lists into
+    tuples.
+    """
+    if isinstance(data, dict):
+        return MappingProxyType({key: _freeze(value) for key, value in data.items()})
+    if isinstance(data, list):
+        return tuple(_freeze(value) for value in data)
+    return data
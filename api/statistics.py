@@ -0,0 +1,182 @@
+"""
+
+Created on: 10/16/2026
+
+This module contains the statistical comparison of sample groups: Welch's t-test, one-way ANOVA and fold changes, with
+Benjamini-Hochberg correction for multiple testing. Every test runs on all lipids (rows) at once, as array operations over
+the intensity matrix. Sample groups are given as lists of columns, like the groups of filters.low_average_group_filter().
+Missing intensities are ignored.
+"""
+import numpy as np
+import pandas as pd
+
+from .filters import ColumnGroups
+
+
+def welch_t_test(dataframe=None, group_a=None, group_b=None):
+    """
+    This function performs Welch's t-test (the two sample t-test without the equal variance assumption) between two
+    groups of samples, for every row. The results are the same as scipy.stats.ttest_ind(equal_var=False, nan_policy='omit')
+    applied to each row.
+    :param dataframe: A pandas.DataFrame of intensities.
+    :param group_a: A list of the columns of the first group.
+    :param group_b: A list of the columns of the second group.
+    :return: A pandas.DataFrame with the index of 'dataframe' and the columns 't_statistic', 'degrees_of_freedom' and
+    'p_value' (two-sided). Rows with less than 2 values in a group get missing values.
+    """
+    if dataframe is None or group_a is None or group_b is None:
+        raise ValueError("The 'dataframe', 'group_a' and 'group_b' parameters must be specified!")
+    column_groups = ColumnGroups(groups=[group_a, group_b])
+    counts, means, variances = column_groups.moments(column_groups.block(dataframe))
+    t_statistic, degrees_of_freedom, p_value = _welch(counts, means, variances)
+    return pd.DataFrame({'t_statistic': t_statistic, 'degrees_of_freedom': degrees_of_freedom, 'p_value': p_value},
+                        index=dataframe.index)
+
+
+def one_way_anova(dataframe=None, groups=None):
+    """
+    This function performs a one-way analysis of variance between groups of samples, for every row. The results are the
+    same as scipy.stats.f_oneway() applied to the non missing values of each row. Groups without any value in a row are
+    left out of the test of that row.
+    :param dataframe: A pandas.DataFrame of intensities.
+    :param groups: A list of lists of group columns, at least 2 groups.
+    :return: A pandas.DataFrame with the index of 'dataframe' and the columns 'f_statistic', 'df_between', 'df_within' and
+    'p_value'. Rows with less than 2 groups, or no more values than groups, get missing values.
+    """
+    if dataframe is None or groups is None:
+        raise ValueError("Both 'dataframe' and 'groups' parameters must be specified!")
+    if len(groups) < 2:
+        raise ValueError("The 'groups' parameter must contain at least 2 groups!")
+    column_groups = ColumnGroups(groups=groups)
+    counts, means, variances = column_groups.moments(column_groups.block(dataframe))
+    f_statistic, df_between, df_within, p_value = _anova(counts, means, variances)
+    return pd.DataFrame({'f_statistic': f_statistic, 'df_between': df_between, 'df_within': df_within,
+                         'p_value': p_value}, index=dataframe.index)
+
+
+def fold_change(dataframe=None, numerator=None, denominator=None):
+    """
+    This function calculates the fold change between the mean intensities of two groups of samples, for every row.
+    :param dataframe: A pandas.DataFrame of intensities.
+    :param numerator: A list of the columns of the group in the numerator (ex: the treated samples).
+    :param denominator: A list of the columns of the group in the denominator (ex: the control samples).
+    :return: A pandas.DataFrame with the index of 'dataframe' and the columns 'fold_change' and 'log2_fold_change'.
+    """
+    if dataframe is None or numerator is None or denominator is None:
+        raise ValueError("The 'dataframe', 'numerator' and 'denominator' parameters must be specified!")
+    column_groups = ColumnGroups(groups=[numerator, denominator])
+    means = column_groups.means(column_groups.block(dataframe))
+    ratio, log2_ratio = _fold_change(means[:, 0], means[:, 1])
+    return pd.DataFrame({'fold_change': ratio, 'log2_fold_change': log2_ratio}, index=dataframe.index)
+
+
+def benjamini_hochberg(p_values=None):
+    """
+    This function adjusts p-values for multiple testing with the Benjamini-Hochberg procedure, which controls the false
+    discovery rate. Missing p-values stay missing and are not counted as tests.
+    :param p_values: A list, numpy array or pandas.Series of p-values.
+    :return: A numpy float64 array of adjusted p-values (q-values), in the order of 'p_values'.
+    """
+    if p_values is None:
+        raise ValueError("The 'p_values' parameter must be specified!")
+    p_values = np.asarray(p_values, dtype=np.float64)
+    adjusted = np.full(p_values.shape, np.nan)
+    tested = np.flatnonzero(~np.isnan(p_values))
+    if len(tested) == 0:
+        return adjusted
+    order = tested[np.argsort(p_values[tested], kind='stable')]
+    scaled = p_values[order] * len(tested) / np.arange(1, len(tested) + 1)
+    # the adjusted p-value of a rank is the smallest scaled p-value of that rank or any higher rank
+    adjusted[order] = np.minimum(np.minimum.accumulate(scaled[::-1])[::-1], 1.0)
+    return adjusted
+
+
+def compare_groups(dataframe=None, groups=None, group_names=None, name_column=None):
+    """
+    This function compares groups of samples for every row (lipid) of a dataset. The group statistics are computed once
+    and shared by the tests: with 2 groups, Welch's t-test and the fold change of the second group over the first one
+    are performed; with more groups, a one-way ANOVA is performed, and the fold change of every other group over the
+    first one is reported. The p-values are adjusted with the Benjamini-Hochberg procedure over all rows.
+    :param dataframe: A pandas.DataFrame of intensities.
+    :param groups: A list of lists of group columns, at least 2 groups. The first group is the reference (ex: control).
+    :param group_names: A list of names for the groups, used in the output column names. The default is None, which
+    means 'group_0', 'group_1'...
+    :param name_column: An optional column (ex: 'lipid_name') copied to the output.
+    :return: A pandas.DataFrame with the index of 'dataframe' and the columns: 'mean_<group>' for every group,
+    'log2_fold_change' (2 groups) or 'log2_fold_change_<group>' for every group but the first one (more groups),
+    't_statistic' and 'degrees_of_freedom' (2 groups) or 'f_statistic' (more groups), 'p_value' and 'adjusted_p_value'.
+    """
+    if dataframe is None or groups is None:
+        raise ValueError("Both 'dataframe' and 'groups' parameters must be specified!")
+    if len(groups) < 2:
+        raise ValueError("The 'groups' parameter must contain at least 2 groups!")
+    if group_names is None:
+        group_names = ['group_%d' % position for position in range(len(groups))]
+    if len(group_names) != len(groups):
+        raise ValueError("The 'group_names' parameter must contain one name per group!")
+    column_groups = ColumnGroups(groups=groups)
+    counts, means, variances = column_groups.moments(column_groups.block(dataframe))
+
+    result = dict()
+    if name_column is not None:
+        result[name_column] = dataframe[name_column].to_numpy()
+    for position, name in enumerate(group_names):
+        result['mean_%s' % name] = means[:, position]
+    if len(groups) == 2:
+        result['log2_fold_change'] = _fold_change(means[:, 1], means[:, 0])[1]
+        result['t_statistic'], result['degrees_of_freedom'], result['p_value'] = _welch(counts, means, variances)
+    else:
+        for position, name in enumerate(group_names[1:], 1):
+            result['log2_fold_change_%s' % name] = _fold_change(means[:, position], means[:, 0])[1]
+        result['f_statistic'], _, _, result['p_value'] = _anova(counts, means, variances)
+    result['adjusted_p_value'] = benjamini_hochberg(result['p_value'])
+    return pd.DataFrame(result, index=dataframe.index)
+
+
+#--------------------------------------------------- helper methods----------------------------------------------//
+
+def _welch(counts, means, variances):
+    """
+    A helper method for 'welch_t_test()', it returns the t statistics, degrees of freedom and two-sided p-values of
+    the first two groups of (n_rows, n_groups) group statistics.
+    """
+    from scipy import special    # imported on first use, scipy is slow to import
+    with np.errstate(divide='ignore', invalid='ignore'):
+        squared_errors = variances[:, :2] / counts[:, :2]
+        squared_error = squared_errors.sum(axis=1)
+        t_statistic = (means[:, 0] - means[:, 1]) / np.sqrt(squared_error)
+        degrees_of_freedom = squared_error ** 2 / (squared_errors ** 2 / (counts[:, :2] - 1)).sum(axis=1)
+        p_value = 2 * special.stdtr(degrees_of_freedom, -np.abs(t_statistic))
+    return t_statistic, degrees_of_freedom, p_value
+
+
+def _anova(counts, means, variances):
+    """
+    A helper method for 'one_way_anova()', it returns the F statistics, degrees of freedom and p-values of
+    (n_rows, n_groups) group statistics.
+    """
+    from scipy import special    # imported on first use, scipy is slow to import
+    present = counts > 0
+    n_groups = present.sum(axis=1)
+    n_values = counts.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        grand_means = np.where(present, counts * means, 0).sum(axis=1) / n_values
+        between = np.where(present, counts * (means - grand_means[:, None]) ** 2, 0).sum(axis=1)
+        within = np.where(counts > 1, (counts - 1) * variances, 0).sum(axis=1)
+        df_between = (n_groups - 1).astype(np.float64)
+        df_within = (n_values - n_groups).astype(np.float64)
+        invalid = (n_groups < 2) | (df_within < 1)
+        df_between[invalid] = np.nan
+        df_within[invalid] = np.nan
+        f_statistic = (between / df_between) / (within / df_within)
+        p_value = special.fdtrc(df_between, df_within, f_statistic)
+    return f_statistic, df_between, df_within, p_value
+
+
+def _fold_change(numerator_means, denominator_means):
+    """
+    A helper method for 'fold_change()', it returns the ratios of group means and their log2.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = numerator_means / denominator_means
+        return ratio, np.log2(ratio)
@@ -0,0 +1,357 @@
+"""
+
+Created on: 10/16/2026
+
+This module times and memory-profiles the public functions of the API on synthetic data, at increasing sizes, and writes
+machine-readable JSON results so that regressions can be compared across commits offline. Run it from the root of the
+project, ex:
+    python -m benchmarks.run_benchmarks --sizes 1000,10000,100000 --output bench_new.json
+    python -m benchmarks.run_benchmarks --compare bench_old.json bench_new.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from api import filters, isotopic_corrections, molecules_parser, normalization, file_directory_parser, statistics
+from api.batch_processing import BatchRunner
+from api.database import ConnectionPool, IntensityLoader
+from api.instrumentation import Tracer
+from api.run_cache import RunCache
+from api.stage_cache import StageCache
+from api.static_data_registry import StaticDataRegistry
+from benchmarks.synthetic_data import ELEMENTS_MASS, HEAD_GROUPS, SyntheticDataGenerator
+
+N_SAMPLES = 12
+SAMPLE_COLUMNS = ['s%d' % sample for sample in range(N_SAMPLES)]
+SAMPLE_GROUPS = [SAMPLE_COLUMNS[:4], SAMPLE_COLUMNS[4:8], SAMPLE_COLUMNS[8:]]
+HEAD_GROUP_MASSES = {group: masses[0] for group, masses in HEAD_GROUPS.items()}
+MAX_LIBRARY_SIZE = 100000
+
+
+def _setup_run(generator, size):
+    return {'dataframe': generator.run(n_rows=size, n_samples=N_SAMPLES)}
+
+
+def _setup_named_run(generator, size):
+    library = generator.library(n_entries=min(size, MAX_LIBRARY_SIZE))
+    run = generator.run(n_rows=size, n_samples=N_SAMPLES, library=library, matched_fraction=0.8)
+    index = molecules_parser.MassPairIndex(library)
+    return {'dataframe': index.assign_names(run, pm_tolerance=0.05)}
+
+
+def _setup_annotation(generator, size):
+    library = generator.library(n_entries=min(size, MAX_LIBRARY_SIZE))
+    return {'index': molecules_parser.MassPairIndex(library),
+            'dataframe': generator.run(n_rows=size, n_samples=1, library=library)}
+
+
+def _setup_names(generator, size):
+    return {'names': generator.library(n_entries=size)['lipid_name']}
+
+
+def _setup_csv(generator, size):
+    file_path = os.path.join(tempfile.mkdtemp(), 'run.csv')
+    generator.run(n_rows=size, n_samples=N_SAMPLES).to_csv(file_path, index=False)
+    return {'file_path': file_path}
+
+
+def _setup_run_cache(generator, size):
+    # the run is cached once here, so the case measures a read from the cache
+    kwargs = _setup_csv(generator, size)
+    kwargs['cache'] = RunCache(os.path.join(os.path.dirname(kwargs['file_path']), 'cache'))
+    kwargs['cache'].read(kwargs['file_path'])
+    return kwargs
+
+
+def _setup_batch(generator, size, n_files=4):
+    # the rows are split over the files, and the peak memory only counts the main process, not the workers
+    library = generator.library(n_entries=min(size, MAX_LIBRARY_SIZE))
+    dir_path = tempfile.mkdtemp()
+    for position in range(n_files):
+        run = generator.run(n_rows=max(size // n_files, 1), n_samples=N_SAMPLES, library=library, matched_fraction=0.8)
+        run.to_csv(os.path.join(dir_path, 'run_%d.csv' % position), index=False)
+    runner = BatchRunner(molecules_parser.MassPairIndex(library), annotate_kwargs={'pm_tolerance': 0.05},
+                         correction_kwargs={'head_group_carbons': {'PC': 8, 'PE': 5, 'PI': 9, 'TAG': 3, 'DAG': 3}},
+                         max_workers=2)
+    return {'runner': runner, 'dir_path': dir_path}
+
+
+def _setup_intensity_loader(generator, size):
+    kwargs = _setup_named_run(generator, size)
+    pool = ConnectionPool(sqlite3, max_size=1, database=os.path.join(tempfile.mkdtemp(), 'intensities.db'))
+    kwargs['loader'] = IntensityLoader(pool).create_table()
+    return kwargs
+
+
+def _setup_stage_cache(generator, size):
+    # the stage is run once here, so the case measures hashing the input and loading the cached output
+    kwargs = _setup_run(generator, size)
+    kwargs['cache'] = StageCache(tempfile.mkdtemp())
+    _run_cached_stage(**kwargs)
+    return kwargs
+
+
+def _run_cached_stage(cache, dataframe):
+    return cache.run(filters.set_baseline_to_value, dataframe, parameters={'threshold': 100})
+
+
+def _trace_pipeline(dataframe):
+    with Tracer(trace_memory=False):
+        return filters.FilterPipeline().set_baseline(columns=SAMPLE_COLUMNS).neutral_loss(threshold=50).apply(dataframe)
+
+
+def _read_chunks(file_path):
+    return file_directory_parser.concat_chunks(file_directory_parser.read_data_in_chunks(file_path))
+
+
+def _generate_library(n_chains):
+    chains = [(12 + position // 7, position % 7) for position in range(n_chains)]
+    return molecules_parser.build_mass_pair_index(molecules_parser.generate_lipid_library(
+        group_chains={'PC': (2, chains)}, elements_mass_dict=ELEMENTS_MASS, head_group_mass_dict=HEAD_GROUP_MASSES))
+
+
+def _normalize(dataframe):
+    standards = pd.DataFrame({'lipid_name': ['PC|28:0|(14:0~14:0)', 'PE|30:0|(15:0~15:0)', 'TAG|45:0|(15:0~15:0~15:0)'],
+                              'concentration': [10.0, 10.0, 5.0]})
+    normalizer = normalization.InternalStandardNormalizer(standards)
+    return normalizer.normalize(dataframe, sample_columns=SAMPLE_COLUMNS)
+
+
+# Every benchmark case: name -> (setup function, benchmarked function). The setup builds the inputs for a size and is
+# not timed. Size is the number of rows of the run, or the number of items (library entries, formulas, names...).
+CASES = {
+    'filters.set_baseline_to_value': (_setup_run, lambda dataframe: filters.set_baseline_to_value(dataframe, threshold=100)),
+    'filters.neutral_loss_filter': (_setup_run, lambda dataframe: filters.neutral_loss_filter(dataframe, threshold=50)),
+    'filters.low_average_filter': (_setup_run, lambda dataframe: filters.low_average_filter(dataframe, columns=SAMPLE_COLUMNS)),
+    'filters.average_and_max_filter':
+        (_setup_run, lambda dataframe: filters.average_and_max_filter(dataframe, columns=SAMPLE_COLUMNS)),
+    'filters.low_average_group_filter':
+        (_setup_run, lambda dataframe: filters.low_average_group_filter(dataframe, groups=SAMPLE_GROUPS)),
+    'filters.average_and_max_group_filter':
+        (_setup_run, lambda dataframe: filters.average_and_max_group_filter(dataframe, group=SAMPLE_GROUPS[0])),
+    'filters.child_peaks_filter':
+        (_setup_run, lambda dataframe: filters.child_peaks_filter(dataframe, child_peaks=[(1, 10), (17, 19), (44, 46)])),
+    'filters.group_quantile_filter':
+        (_setup_run, lambda dataframe: filters.group_quantile_filter(dataframe, group=SAMPLE_COLUMNS)),
+    'filters.FilterPipeline.apply':
+        (_setup_run, lambda dataframe: filters.FilterPipeline().set_baseline(columns=SAMPLE_COLUMNS).neutral_loss(threshold=50)
+         .child_peaks().low_average_group(groups=SAMPLE_GROUPS).group_quantile(group=SAMPLE_COLUMNS).apply(dataframe)),
+    'molecules_parser.get_name_for_mass_pair':
+        (lambda generator, size: {'library': generator.library(n_entries=size)},
+         lambda library: molecules_parser.get_name_for_mass_pair(precursor=700.5, fragment=184.07, mass_name_list=library)),
+    'molecules_parser.MassPairIndex':
+        (lambda generator, size: {'mass_name_list': generator.library(n_entries=size)}, molecules_parser.MassPairIndex),
+    'molecules_parser.MassPairIndex.annotate': (_setup_annotation, lambda index, dataframe: index.annotate(dataframe)),
+    'molecules_parser.MassPairIndex.assign_names': (_setup_annotation, lambda index, dataframe: index.assign_names(dataframe)),
+    'molecules_parser.get_mass_from_formula':
+        (lambda generator, size: {'formulas': generator.formulas(n_formulas=size), 'elements_mass_file': _elements_mass_file()},
+         lambda formulas, elements_mass_file: [molecules_parser.get_mass_from_formula(formula, elements_mass_file)
+                                               for formula in formulas]),
+    'molecules_parser.FormulaMassCalculator.get_masses':
+        (lambda generator, size: {'formulas': generator.formulas(n_formulas=size)},
+         lambda formulas: molecules_parser.FormulaMassCalculator(elements_mass_dict=ELEMENTS_MASS).get_masses(formulas)),
+    'molecules_parser.parse_lipid_name': (_setup_names, lambda names: [molecules_parser.parse_lipid_name(name) for name in names]),
+    'molecules_parser.parse_lipid_names': (_setup_names, molecules_parser.parse_lipid_names),
+    'molecules_parser.get_lipid_group_from_name':
+        (_setup_names, lambda names: [molecules_parser.get_lipid_group_from_name(name) for name in names]),
+    'molecules_parser.get_mass_from_name':
+        (_setup_names, lambda names: [molecules_parser.get_mass_from_name(name, ELEMENTS_MASS, HEAD_GROUP_MASSES)
+                                      for name in names]),
+    'molecules_parser.get_masses_from_names':
+        (_setup_names, lambda names: molecules_parser.get_masses_from_names(names, ELEMENTS_MASS, HEAD_GROUP_MASSES)),
+    'molecules_parser.generate_lipid_library':
+        (lambda generator, size: {'n_chains': int(np.sqrt(2 * size))}, _generate_library),
+    'isotopic_corrections.get_isotope_distribution_from_natoms':
+        (lambda generator, size: {'n_total_atoms': size},
+         lambda n_total_atoms: isotopic_corrections.get_isotope_distribution_from_natoms(n_total_atoms, abundance=0.0107)),
+    'isotopic_corrections.isotopic_correction':
+        (_setup_named_run, lambda dataframe: isotopic_corrections.isotopic_correction(
+            dataframe, sample_columns=SAMPLE_COLUMNS, head_group_carbons={'PC': 8, 'PE': 5, 'PI': 9, 'TAG': 3, 'DAG': 3})),
+    'isotopic_corrections.get_isotopic_mass_distributions':
+        (lambda generator, size: {'formulas': generator.formulas(n_formulas=size)},
+         lambda formulas: isotopic_corrections.IsotopicEnvelopeCalculator().get_envelopes(formulas)),
+    'normalization.InternalStandardNormalizer.normalize': (_setup_named_run, _normalize),
+    'statistics.compare_groups':
+        (_setup_run, lambda dataframe: statistics.compare_groups(dataframe, groups=SAMPLE_GROUPS)),
+    'file_directory_parser.read_data_from_file': (_setup_csv, file_directory_parser.read_data_from_file),
+    'file_directory_parser.read_data_in_chunks': (_setup_csv, _read_chunks),
+    'run_cache.RunCache.read': (_setup_run_cache, lambda cache, file_path: cache.read(file_path)),
+    'batch_processing.BatchRunner.run': (_setup_batch, lambda runner, dir_path: list(runner.run(dir_path))),
+    'database.IntensityLoader.load':
+        (_setup_intensity_loader, lambda loader, dataframe: loader.load(dataframe, sample_columns=SAMPLE_COLUMNS)),
+    'stage_cache.StageCache.run': (_setup_stage_cache, _run_cached_stage),
+    'instrumentation.Tracer': (_setup_run, _trace_pipeline),
+}
+
+
+def run_benchmarks(sizes=(1000, 10000, 100000), cases=None, seed=0, repeat=3, max_seconds=30.0, log=None):
+    """
+    This function runs the benchmark cases at every size. Each case is timed 'repeat' times (the best time is kept) and
+    memory-profiled once with tracemalloc, which traces numpy and pandas allocations. Once a case takes more than
+    'max_seconds' at a size, it is skipped at larger sizes.
+    :param sizes: A list of sizes, from 10^3 to 10^7.
+    :param cases: A list of case names, see CASES. The default is None for all cases.
+    :param seed: The seed of the synthetic data.
+    :param repeat: The number of timed runs of each case and size.
+    :param max_seconds: The time above which larger sizes of a case are skipped.
+    :param log: An optional function called with a message string after each measure.
+    :return: A list of dictionaries, one per case and size.
+    """
+    if cases is None:
+        cases = list(CASES)
+    results = []
+    for case in cases:
+        setup, function = CASES[case]
+        too_slow = False
+        for size in sizes:
+            result = {'case': case, 'size': int(size), 'seconds': None, 'peak_memory_bytes': None, 'error': None,
+                      'skipped': too_slow}
+            if not too_slow:
+                try:
+                    kwargs = setup(SyntheticDataGenerator(seed), int(size))
+                    result['seconds'] = _time(function, kwargs, repeat)
+                    result['peak_memory_bytes'] = _peak_memory(function, kwargs)
+                    too_slow = result['seconds'] > max_seconds
+                except Exception as error:
+                    result['error'] = '%s: %s' % (type(error).__name__, error)
+            results.append(result)
+            if log is not None:
+                log('%-60s %10d %12s %14s %s' % (case, size, _format(result['seconds'], '%.6f'),
+                                                  _format(result['peak_memory_bytes'], '%d'),
+                                                  result['error'] or ('skipped' if result['skipped'] else '')))
+    return results
+
+
+def compare_results(old_results=None, new_results=None):
+    """
+    This function compares the results of 2 benchmark runs, ex: of 2 commits.
+    :param old_results: A list of results, see run_benchmarks().
+    :param new_results: A list of results, see run_benchmarks().
+    :return: A pandas.DataFrame with the times and peak memory of both runs and their ratio (new / old) for each case
+    and size measured in both runs.
+    """
+    if old_results is None or new_results is None:
+        raise ValueError("Both 'old_results' and 'new_results' parameters must be specified!")
+    columns = ['case', 'size', 'seconds', 'peak_memory_bytes']
+    old = pd.DataFrame(old_results)[columns]
+    new = pd.DataFrame(new_results)[columns]
+    compared = old.merge(new, on=['case', 'size'], suffixes=('_old', '_new')).dropna()
+    compared['time_ratio'] = compared['seconds_new'] / compared['seconds_old']
+    compared['memory_ratio'] = compared['peak_memory_bytes_new'] / compared['peak_memory_bytes_old']
+    return compared
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the LipPy API on synthetic data.')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='Comma separated sizes, ex: 1e3,1e4,1e5,1e6,1e7')
+    parser.add_argument('--cases', default=None, help='Comma separated case names, or prefixes such as "filters."')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-seconds', type=float, default=30.0)
+    parser.add_argument('--output', default='bench_output.json', help='The JSON file results are written to')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Compare 2 result files instead of running')
+    parser.add_argument('--list', action='store_true', help='List the benchmark cases')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print('\n'.join(CASES))
+        return
+    if args.compare:
+        with open(args.compare[0]) as old_file, open(args.compare[1]) as new_file:
+            compared = compare_results(json.load(old_file)['results'], json.load(new_file)['results'])
+        with pd.option_context('display.max_rows', None, 'display.width', 200):
+            print(compared.to_string(index=False))
+        return
+
+    sizes = [int(float(size)) for size in args.sizes.split(',')]
+    cases = None
+    if args.cases:
+        prefixes = args.cases.split(',')
+        cases = [case for case in CASES if any(case.startswith(prefix) for prefix in prefixes)]
+    results = run_benchmarks(sizes=sizes, cases=cases, seed=args.seed, repeat=args.repeat, max_seconds=args.max_seconds,
+                             log=print)
+    with open(args.output, 'w') as json_file:
+        json.dump({'environment': _get_environment(), 'seed': args.seed, 'results': results}, json_file, indent=1)
+
+
+#--------------------------------------------------- helper methods----------------------------------------------//
+
+def _time(function, kwargs, repeat):
+    """
+    A helper method for 'run_benchmarks()', it returns the best wall time of 'repeat' calls.
+    """
+    best = None
+    for _ in range(max(repeat, 1)):
+        _clear_caches()
+        gc.collect()
+        start = time.perf_counter()
+        function(**kwargs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _peak_memory(function, kwargs):
+    """
+    A helper method for 'run_benchmarks()', it returns the peak memory allocated during one call, in bytes.
+    """
+    _clear_caches()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function(**kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _clear_caches():
+    """
+    A helper method for '_time()' and '_peak_memory()', it empties the caches the API keeps between calls (static data
+    files, formula mass calculators, isotope distributions and envelope calculators), so every measured call does the
+    full work instead of only the first one. The on-disk caches of the RunCache and StageCache cases are kept, those
+    cases measure a read from the cache.
+    """
+    StaticDataRegistry.clear()
+    molecules_parser._get_formula_mass_calculator.cache_clear()
+    isotopic_corrections.get_isotope_distribution_array.cache_clear()
+    isotopic_corrections._get_envelope_calculator.cache_clear()
+
+
+def _elements_mass_file():
+    """
+    A helper method for the 'get_mass_from_formula' case, it returns the path to the exact masses file of the project.
+    """
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static_data', 'exact_masses.json')
+
+
+def _get_environment():
+    """
+    A helper method for 'main()', it describes the commit and versions the benchmarks ran with.
+    """
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'platform': platform.platform(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'argv': sys.argv}
+
+
+def _format(value, pattern):
+    return '-' if value is None else pattern % value
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+
+Created on: 10/16/2026
+
+This module generates seeded synthetic lipidomics data for the benchmarks: libraries of known precursor/fragment mass
+pairs, and runs of found mass pairs with log-normal intensities over a number of samples.
+"""
+import numpy as np
+import pandas as pd
+
+# Head groups used by the synthetic libraries, with a (neutral head group mass, fixed fragment mass) pair. A fragment
+# mass of None means the fragments are neutral losses of the chains.
+HEAD_GROUPS = {'PC': (297.0, 184.0733),
+               'PE': (255.0, 141.0191),
+               'PI': (374.0, 241.0118),
+               'TAG': (89.0, None),
+               'DAG': (73.0, None),
+               'CE': (386.0, 369.3516)}
+ELEMENTS_MASS = {'C': 12.000000, 'H': 1.00782503223, 'O': 15.99491461957, 'P': 30.97376199842, 'N': 14.00307400443,
+                 'Na': 22.989770, 'F': 18.998403, 'Li': 7.0160034366, 'Cl': 34.968852682}
+
+
+class SyntheticDataGenerator(object):
+    """
+    A seeded generator of synthetic data. Two generators created with the same seed return the same data, so benchmark
+    results of different commits are measured on the same inputs.
+    """
+
+    def __init__(self, seed=0):
+        """
+        :param seed: The seed of the random number generator.
+        """
+        self.seed = seed
+        self._random = np.random.RandomState(seed)
+
+    def library(self, n_entries=1000):
+        """
+        This method generates a library of known mass pairs, named after our naming convention.
+        :param n_entries: The number of mass pairs of the library.
+        :return: A pandas.DataFrame with the columns 'lipid_name', 'precursor' and 'fragment'.
+        """
+        groups = np.array(sorted(HEAD_GROUPS))
+        group = groups[self._random.randint(0, len(groups), n_entries)]
+        chain_1 = self._chains(n_entries)
+        chain_2 = self._chains(n_entries)
+        ncarbons = chain_1[0] + chain_2[0]
+        ndouble_bonds = chain_1[1] + chain_2[1]
+        head_group_mass = np.array([HEAD_GROUPS[name][0] for name in group])
+        precursor = (head_group_mass + ELEMENTS_MASS['C'] * ncarbons
+                     + (ncarbons * 2 + 1 - ndouble_bonds * 2) * ELEMENTS_MASS['H'])
+        neutral_loss = (ELEMENTS_MASS['C'] * chain_1[0] + ELEMENTS_MASS['H'] * (chain_1[0] * 2 - chain_1[1] * 2)
+                        + ELEMENTS_MASS['O'] * 2)
+        fixed_fragment = np.array([np.nan if HEAD_GROUPS[name][1] is None else HEAD_GROUPS[name][1] for name in group])
+        fragment = np.where(np.isnan(fixed_fragment), precursor - neutral_loss, fixed_fragment)
+        names = pd.Series(group).str.cat([pd.Series(ncarbons).astype(str) + ':' + pd.Series(ndouble_bonds).astype(str),
+                                          '(' + pd.Series(chain_1[0]).astype(str) + ':' + pd.Series(chain_1[1]).astype(str)
+                                          + '~' + pd.Series(chain_2[0]).astype(str) + ':' + pd.Series(chain_2[1]).astype(str)
+                                          + ')'], sep='|')
+        return pd.DataFrame({'lipid_name': names, 'precursor': precursor, 'fragment': fragment})
+
+    def run(self, n_rows=1000, n_samples=10, library=None, matched_fraction=0.5, noise=0.01):
+        """
+        This method generates a run of found precursor/fragment mass pairs and their intensities. A part of the pairs is
+        drawn from a library (with mass noise), the rest is background.
+        :param n_rows: The number of mass pairs of the run.
+        :param n_samples: The number of sample columns, named 's0', 's1'...
+        :param library: An optional library (see library()) the matched pairs are drawn from.
+        :param matched_fraction: The fraction of pairs drawn from the library, when one is given.
+        :param noise: The standard deviation (in Da) of the mass noise added to the matched pairs.
+        :return: A pandas.DataFrame with the columns 'precursor', 'fragment', 'neutral_loss' and the sample columns.
+        """
+        precursor = self._random.uniform(300, 1000, n_rows)
+        fragment = precursor * self._random.uniform(0.2, 0.9, n_rows)
+        if library is not None and len(library):
+            matched = self._random.rand(n_rows) < matched_fraction
+            drawn = self._random.randint(0, len(library), int(matched.sum()))
+            precursor[matched] = library['precursor'].to_numpy()[drawn] + self._random.normal(0, noise, len(drawn))
+            fragment[matched] = library['fragment'].to_numpy()[drawn] + self._random.normal(0, noise, len(drawn))
+        dataframe = pd.DataFrame({'precursor': precursor, 'fragment': fragment, 'neutral_loss': precursor - fragment})
+        intensities = self._random.lognormal(mean=5, sigma=1.5, size=(n_rows, n_samples))
+        for sample in range(n_samples):
+            dataframe['s%d' % sample] = intensities[:, sample]
+        return dataframe
+
+    def formulas(self, n_formulas=1000, adduct_fraction=0.3):
+        """
+        This method generates formula strings of lipid-like compositions, some of them with an adduct.
+        :param n_formulas: The number of formulas.
+        :param adduct_fraction: The fraction of formulas that end with an adduct.
+        :return: A list of formula strings.
+        """
+        carbons = self._random.randint(10, 70, n_formulas)
+        hydrogens = carbons * 2 - self._random.randint(0, 12, n_formulas)
+        oxygens = self._random.randint(2, 10, n_formulas)
+        adducts = np.where(self._random.rand(n_formulas) < adduct_fraction,
+                           np.array(['[NH4]', '[-H]', '[Na]'])[self._random.randint(0, 3, n_formulas)], '')
+        return ['C%dH%dO%d%s' % values for values in zip(carbons, hydrogens, oxygens, adducts)]
+
+    def _chains(self, n_chains):
+        return self._random.randint(12, 25, n_chains), self._random.randint(0, 7, n_chains)
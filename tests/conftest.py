@@ -0,0 +1,8 @@
+"""
+Makes the 'api' package importable however the tests are run, ex: a bare 'pytest tests' from the root of the
+project.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
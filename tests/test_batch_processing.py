@@ -0,0 +1,66 @@
+"""
+
+Created on: 10/16/2026
+
+This module checks that BatchRunner gives the same result as processing each run file in the main process, corrects
+only the intensity columns by default, and keeps going when one of the files fails.
+Run it from the root of the project, ex:
+    pytest tests
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from api import file_directory_parser
+from api.batch_processing import BatchRunner
+from api.isotopic_corrections import isotopic_correction
+from api.molecules_parser import MassPairIndex
+
+CORRECTION_KWARGS = {'head_group_carbons': {'PC': 8}}
+
+
+@pytest.fixture
+def mass_pair_index():
+    return MassPairIndex(pd.DataFrame({'lipid_name': ['PC|34:1|', 'PC|34:1|', 'PC|34:0|', 'PC|34:0|'],
+                                       'precursor': [760.585, 760.585, 762.601, 762.601],
+                                       'fragment': [184.07, 104.11, 184.07, 104.11]}))
+
+
+@pytest.fixture
+def run_dir(tmp_path):
+    # the heavy composition holds the M+2 peak of the light one, so the correction changes its intensities
+    for position, scale in enumerate((1.0, 2.0)):
+        pd.DataFrame({'precursor': [760.585, 760.585, 762.601, 762.601, 500.0],
+                      'fragment': [184.07, 104.11, 184.07, 104.11, 100.0],
+                      'scan': [101, 102, 103, 104, 105],
+                      's1': np.array([600.0, 400.0, 270.0, 30.0, 5.0]) * scale,
+                      's2': np.array([60.0, 40.0, 300.0, 100.0, 7.0]) * scale}).to_csv(
+            tmp_path / ('run_%d.csv' % position), index=False)
+    (tmp_path / 'nested').mkdir()
+    (tmp_path / 'nested' / 'broken.csv').write_text('precursor,fragment,s1\n760.585,184.07,1.0\n760.585,oops\n')
+    return tmp_path
+
+
+def test_batch_runner_matches_serial_processing(run_dir, mass_pair_index):
+    runner = BatchRunner(mass_pair_index, correction_kwargs=CORRECTION_KWARGS, max_workers=2)
+    progress = []
+    results = {result.file_path: result for result in
+               runner.run(str(run_dir), progress=lambda n_done, n_total, result: progress.append((n_done, n_total)))}
+    assert sorted(results) == file_directory_parser.discover_run_files(str(run_dir))
+    assert progress == [(1, 3), (2, 3), (3, 3)]
+    for file_path, result in results.items():
+        if file_path.endswith('broken.csv'):
+            assert result.result is None and 'Error' in result.error
+            continue
+        assert result.error is None
+        named = mass_pair_index.assign_names(file_directory_parser.concat_chunks(
+            file_directory_parser.read_data_in_chunks(file_path)))
+        expected = isotopic_correction(named, sample_columns=['s1', 's2'], **CORRECTION_KWARGS)
+        pd.testing.assert_frame_equal(result.result, expected)
+        assert result.result['scan'].tolist() == [101, 102, 103, 104, 105]
+        assert not np.allclose(result.result['s1'].to_numpy(), named['s1'].to_numpy())
+
+
+def test_intensity_columns_of_the_sniffed_schema(run_dir):
+    schema = file_directory_parser.sniff_dtype_schema(str(run_dir / 'run_0.csv'))
+    assert file_directory_parser.get_intensity_columns(schema) == ['s1', 's2']
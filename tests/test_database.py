@@ -0,0 +1,55 @@
+"""
+
+Created on: 10/16/2026
+
+This module checks that IntensityLoader upserts the intensities of a run into SQLite: loading the same run twice leaves
+the table unchanged, and loading new values replaces the old ones.
+Run it from the root of the project, ex:
+    pytest tests
+"""
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from api.database import ConnectionPool, IntensityLoader
+
+
+@pytest.fixture
+def loader(tmp_path):
+    pool = ConnectionPool(sqlite3, max_size=2, database=str(tmp_path / 'intensities.db'))
+    yield IntensityLoader(pool, batch_size=2).create_table()
+    pool.close()
+
+
+@pytest.fixture
+def dataframe():
+    # 2 fragments of PC|34:1|, summed when loaded, and a row without a name, which is not loaded
+    return pd.DataFrame({'lipid_name': ['PC|34:1|', 'PC|34:1|', 'PE|36:2|', None],
+                         's1': [1.0, 2.0, np.nan, 4.0], 's2': [10.0, 20.0, 30.0, 40.0]})
+
+
+def _read_table(loader):
+    with loader.pool.connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute('SELECT lipid_name, sample, intensity FROM %s ORDER BY lipid_name, sample' % loader.table)
+        rows = cursor.fetchall()
+        cursor.close()
+    return rows
+
+
+def test_loading_twice_leaves_the_table_unchanged(loader, dataframe):
+    assert loader.load(dataframe, sample_columns=['s1', 's2']) == 3
+    expected = [('PC|34:1|', 's1', 3.0), ('PC|34:1|', 's2', 30.0), ('PE|36:2|', 's2', 30.0)]
+    assert _read_table(loader) == expected
+    assert loader.load(dataframe, sample_columns=['s1', 's2']) == 3
+    assert _read_table(loader) == expected
+
+
+def test_new_values_replace_the_old_ones(loader, dataframe):
+    loader.load(dataframe, sample_columns=['s1', 's2'])
+    updated = dataframe.assign(s1=[5.0, 5.0, 7.0, 0.0])
+    loader.load(updated, sample_columns=['s1'])
+    assert _read_table(loader) == [('PC|34:1|', 's1', 10.0), ('PC|34:1|', 's2', 30.0), ('PE|36:2|', 's1', 7.0),
+                                   ('PE|36:2|', 's2', 30.0)]
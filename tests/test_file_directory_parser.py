@@ -0,0 +1,62 @@
+"""
+
+Created on: 10/16/2026
+
+This module checks that reading a run in chunks gives the same data as reading it at once.
+Run it from the root of the project, ex:
+    pytest tests
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from api import file_directory_parser
+
+N_ROWS = 50
+
+
+@pytest.fixture
+def run_file(tmp_path):
+    rng = np.random.default_rng(0)
+    run = pd.DataFrame({'lipid_name': ['L%d' % (row % 7) for row in range(N_ROWS)],
+                        'precursor': rng.uniform(500, 900, N_ROWS), 'fragment': rng.uniform(100, 300, N_ROWS),
+                        'scan': np.arange(N_ROWS) + 2 ** 25 + 1,    # not exact in float32
+                        'adduct': [None] * 30 + ['[M+H]'] * (N_ROWS - 30),    # all missing in the first rows
+                        's1': rng.uniform(0, 1e4, N_ROWS).round(2), 's2': rng.uniform(0, 1e4, N_ROWS).round(2)})
+    file_path = tmp_path / 'run.csv'
+    run.to_csv(file_path, index=False)
+    return str(file_path)
+
+
+def test_schema_keeps_integer_and_text_columns(run_file):
+    schema = file_directory_parser.build_dtype_schema(sample=pd.read_csv(run_file, nrows=20))
+    assert schema['precursor'] == np.float64 and schema['s1'] == np.float32
+    assert schema['lipid_name'] == 'category' and schema['scan'] == 'Int64'
+    assert 'adduct' not in schema    # no value in the sample, pandas infers it
+
+
+def test_chunks_match_the_whole_file(run_file, monkeypatch):
+    monkeypatch.setattr(file_directory_parser, 'SNIFF_ROWS', 20)
+    chunks = list(file_directory_parser.read_data_in_chunks(run_file, chunk_size=8))
+    assert [len(chunk) for chunk in chunks] == [8] * 6 + [2]
+    result = file_directory_parser.concat_chunks(chunks)
+    expected = pd.read_csv(run_file)
+    assert result.index.equals(expected.index)
+    np.testing.assert_array_equal(result['scan'].to_numpy(dtype=np.int64), expected['scan'].to_numpy())
+    assert result['adduct'].tolist()[29:] == [np.nan] + ['[M+H]'] * (N_ROWS - 30)
+    assert result['lipid_name'].astype(str).tolist() == expected['lipid_name'].tolist()
+    np.testing.assert_allclose(result['s1'].to_numpy(), expected['s1'].to_numpy(), rtol=1e-6)
+
+
+def test_columns_that_do_not_fit_the_sniffed_schema_are_widened(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_directory_parser, 'SNIFF_ROWS', 10)
+    file_path = str(tmp_path / 'run.csv')
+    pd.DataFrame({'polarity': [1] * 20 + ['negative'] * 10, 'count': [3] * 15 + [2.5] * 15,
+                  's1': np.arange(30.0)}).to_csv(file_path, index=False)
+    result = file_directory_parser.concat_chunks(file_directory_parser.read_data_in_chunks(file_path, chunk_size=4))
+    expected = pd.read_csv(file_path)
+    assert result.index.equals(expected.index)
+    assert result['polarity'].astype(str).tolist() == expected['polarity'].astype(str).tolist()
+    np.testing.assert_array_equal(result['count'].to_numpy(dtype=np.float64), expected['count'].to_numpy())
+    with pytest.raises(ValueError):
+        list(file_directory_parser.read_data_in_chunks(file_path, chunk_size=4, dtype_schema={'polarity': 'Int64'}))
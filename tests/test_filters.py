@@ -0,0 +1,88 @@
+"""
+
+Created on: 10/16/2026
+
+This module checks that the group filters, computed with ColumnGroups, keep the same rows as the original row by row
+implementations, and that a FilterPipeline gives the same result as calling the filters one after the other.
+Run it from the root of the project, ex:
+    pytest tests
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from api import filters
+
+SAMPLES = ['s%d' % sample for sample in range(9)]
+GROUPS = [SAMPLES[:3], SAMPLES[3:6], SAMPLES[6:]]
+
+
+@pytest.fixture
+def dataframe():
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(mean=4.5, sigma=1, size=(500, len(SAMPLES)))
+    values[rng.random(values.shape) < 0.1] = np.nan
+    dataframe = pd.DataFrame(values, columns=SAMPLES)
+    dataframe.insert(0, 'neutral_loss', rng.uniform(-20, 100, len(dataframe)).round(1))
+    dataframe.insert(0, 'lipid_name', ['L%d' % row for row in range(len(dataframe))])
+    return dataframe
+
+
+def _row_low_average_group(dataframe, groups, threshold):
+    return dataframe.loc[dataframe.apply(lambda row: any(row[group].mean() >= threshold for group in groups), axis=1)]
+
+
+def _row_group_quantile(dataframe, group, quantile, threshold):
+    return dataframe.loc[(dataframe[group] >= threshold).apply(lambda row: row.sum() / len(row) >= quantile, axis=1)]
+
+
+def test_low_average_filter_matches_row_means(dataframe):
+    expected = dataframe.loc[dataframe[SAMPLES].mean(axis=1) >= 100]
+    pd.testing.assert_frame_equal(filters.low_average_filter(dataframe, columns=SAMPLES), expected)
+
+
+def test_average_and_max_filter_matches_row_reductions(dataframe):
+    expected = dataframe.loc[(dataframe[SAMPLES].mean(axis=1) >= 100) | (dataframe[SAMPLES].max(axis=1) >= 300)]
+    pd.testing.assert_frame_equal(filters.average_and_max_filter(dataframe, columns=SAMPLES), expected)
+
+
+@pytest.mark.parametrize('threshold', [50, 100, 200])
+def test_low_average_group_filter_matches_row_by_row(dataframe, threshold):
+    pd.testing.assert_frame_equal(filters.low_average_group_filter(dataframe, groups=GROUPS, threshold=threshold),
+                                  _row_low_average_group(dataframe, GROUPS, threshold))
+
+
+@pytest.mark.parametrize('quantile', [0, 0.3, 0.5, 1])
+def test_group_quantile_filter_matches_row_by_row(dataframe, quantile):
+    pd.testing.assert_frame_equal(filters.group_quantile_filter(dataframe, group=SAMPLES, quantile=quantile),
+                                  _row_group_quantile(dataframe, SAMPLES, quantile, 100))
+
+
+@pytest.mark.parametrize('dtypes', [{}, {sample: np.float32 for sample in SAMPLES}, {'s0': np.float32, 's1': np.float32}])
+def test_pipeline_matches_sequential_filters(dataframe, dtypes):
+    dataframe = dataframe.astype(dtypes)
+    dataframe['scan'] = np.arange(len(dataframe), dtype=np.int64)
+    baseline_columns = SAMPLES + ['scan']
+    pipeline = (filters.FilterPipeline().set_baseline(columns=baseline_columns, threshold=50).neutral_loss(threshold=0)
+                .child_peaks(child_peaks=[(1, 10), (17, 19)]).low_average_group(groups=GROUPS)
+                .average_and_max(columns=SAMPLES).group_quantile(group=SAMPLES))
+    expected = filters.set_baseline_to_value(dataframe, columns=baseline_columns, threshold=50)
+    expected = filters.neutral_loss_filter(expected, threshold=0)
+    expected = filters.child_peaks_filter(expected, child_peaks=[(1, 10), (17, 19)])
+    expected = filters.low_average_group_filter(expected, groups=GROUPS)
+    expected = filters.average_and_max_filter(expected, columns=SAMPLES)
+    expected = filters.group_quantile_filter(expected, group=SAMPLES)
+    result = pipeline.apply(dataframe)
+    assert 0 < len(result) < len(dataframe)
+    # the transformed columns keep their dtype, like they do with set_baseline_to_value()
+    pd.testing.assert_series_equal(result.dtypes, dataframe.dtypes)
+    # child_peaks_filter() concatenates the rows above and below each range, so only the row order differs
+    pd.testing.assert_frame_equal(result, expected.sort_index())
+    np.testing.assert_array_equal(pipeline.mask(dataframe), dataframe.index.isin(expected.index))
+
+
+def test_pipeline_upcasts_like_set_baseline_to_value(dataframe):
+    dataframe = dataframe.astype({sample: np.float32 for sample in SAMPLES})
+    result = filters.FilterPipeline().set_baseline(columns=SAMPLES, threshold=50, set_value=0.1).apply(dataframe)
+    pd.testing.assert_frame_equal(result, filters.set_baseline_to_value(dataframe, columns=SAMPLES, threshold=50,
+                                                                        set_value=0.1))
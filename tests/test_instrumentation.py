@@ -0,0 +1,66 @@
+"""
+
+Created on: 10/16/2026
+
+This module checks that Tracer records the work of generator functions, counts the copies made by boolean indexing,
+and keeps the calls of each thread apart.
+Run it from the root of the project, ex:
+    pytest tests
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from api import file_directory_parser, filters
+from api.instrumentation import DEFAULT_MODULES, Tracer
+
+
+def _events(tracer, name):
+    return [event for event in tracer.events if event['name'] == name]
+
+
+def test_generator_functions_are_recorded_once_exhausted(tmp_path):
+    file_path = str(tmp_path / 'run.csv')
+    pd.DataFrame({'precursor': np.arange(50.0), 's1': np.arange(50.0)}).to_csv(file_path, index=False)
+    with Tracer(trace_memory=False) as tracer:
+        chunks = file_directory_parser.read_data_in_chunks(file_path, chunk_size=20)
+        assert not _events(tracer, 'file_directory_parser.read_data_in_chunks')
+        assert len(list(chunks)) == 3
+    event, = _events(tracer, 'file_directory_parser.read_data_in_chunks')
+    assert event['rows_out'] == 50 and event['columns_out'] == 2 and event['seconds'] > 0
+    # the schema is sniffed while the generator runs, so it is nested in it
+    assert _events(tracer, 'file_directory_parser.sniff_dtype_schema')[0]['depth'] == event['depth'] + 1
+
+
+def test_boolean_indexing_is_counted_as_a_copy():
+    dataframe = pd.DataFrame({'neutral_loss': [-5.0, 10.0, 20.0], 's1': [1.0, 2.0, 3.0]})
+    take = pd.DataFrame.take
+    with Tracer(trace_memory=False) as tracer:
+        assert len(filters.neutral_loss_filter(dataframe, threshold=0)) == 2
+    assert _events(tracer, 'filters.neutral_loss_filter')[0]['copies'] == 1
+    assert pd.DataFrame.take is take
+
+
+def test_calls_of_other_threads_are_not_nested():
+    dataframe = pd.DataFrame({'neutral_loss': [-5.0, 10.0, 20.0], 's1': [1.0, 2.0, 3.0]})
+    barrier = threading.Barrier(4)
+
+    def work():
+        barrier.wait()
+        filters.neutral_loss_filter(dataframe, threshold=0)
+
+    with Tracer(trace_memory=False) as tracer:
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    events = _events(tracer, 'filters.neutral_loss_filter')
+    assert len(events) == 4 and all(event['depth'] == 0 for event in events)
+    assert len({event['thread'] for event in events}) == 4
+
+
+def test_every_module_is_instrumented_by_default():
+    names = {module.__name__.split('.')[-1] for module in DEFAULT_MODULES}
+    assert {'run_cache', 'batch_processing'} <= names
@@ -0,0 +1,120 @@
+"""
+
+Created on: 10/16/2026
+
+This module checks the isotopic correction against hand computed C13 contributions, and the isotopic envelopes of
+IsotopicEnvelopeCalculator against a brute force enumeration of every isotopologue of small formulas.
+Run it from the root of the project, ex:
+    pytest tests
+"""
+import itertools
+from collections import defaultdict
+from math import comb
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from api import isotopic_corrections
+
+C13_ABUNDANCE = 0.0107
+ISOTOPES = {'H1': {'mass': 1.00782503223, 'abundance': 99.9885}, 'H2': {'mass': 2.01410177812, 'abundance': 0.0115},
+            'C12': {'mass': 12.0, 'abundance': 98.93}, 'C13': {'mass': 13.00335483507, 'abundance': 1.07},
+            'N14': {'mass': 14.00307400443, 'abundance': 99.636}, 'N15': {'mass': 15.00010889888, 'abundance': 0.364},
+            'O16': {'mass': 15.99491461957, 'abundance': 99.757}, 'O17': {'mass': 16.99913175650, 'abundance': 0.038},
+            'O18': {'mass': 17.99915961286, 'abundance': 0.205}, 'Na23': {'mass': 22.9897692820, 'abundance': 100.0},
+            'Cl35': {'mass': 34.968852682, 'abundance': 75.76}, 'Cl37': {'mass': 36.965902602, 'abundance': 24.24}}
+
+
+def _binomial(n_atoms, k):
+    return comb(n_atoms, k) * C13_ABUNDANCE ** k * (1 - C13_ABUNDANCE) ** (n_atoms - k)
+
+
+@pytest.fixture
+def dataframe():
+    # PC|34:0 is 2.016 Da heavier than PC|34:1, within the tolerance of 2 C13 shifts, so the M+2 peak of PC|34:1 is
+    # observed at the precursor of PC|34:0. Each composition has 2 fragments and 42 carbons, 8 of them in the head group.
+    return pd.DataFrame({'lipid_name': ['PC|34:1|', 'PC|34:1|', 'PC|34:0|', 'PC|34:0|', None],
+                         'precursor': [760.585, 760.585, 762.601, 762.601, 500.0],
+                         'fragment': [184.07, 104.11, 184.07, 104.11, 100.0],
+                         'n_carbons': [42, 42, 42, 42, 0],
+                         's1': [600.0, 400.0, 270.0, 30.0, 5.0],
+                         's2': [60.0, 40.0, 300.0, 100.0, 7.0]})
+
+
+def test_m_plus_2_contribution_is_subtracted(dataframe):
+    corrected = isotopic_corrections.isotopic_correction(dataframe, sample_columns=['s1', 's2'],
+                                                         carbon_column='n_carbons')
+    ratio = _binomial(42, 2) / _binomial(42, 0)
+    for sample, light, heavy in (('s1', 1000.0, 300.0), ('s2', 100.0, 400.0)):
+        expected_heavy = max(heavy - light * ratio, 0.0)
+        # the lightest composition is unchanged, and each fragment keeps its share of its composition's total
+        np.testing.assert_allclose(corrected[sample].iloc[:2], dataframe[sample].iloc[:2])
+        np.testing.assert_allclose(corrected[sample].iloc[2:4], dataframe[sample].iloc[2:4] * expected_heavy / heavy)
+    assert corrected['s1'].iloc[4] == 5.0 and corrected['s2'].iloc[4] == 7.0
+    assert dataframe['s1'].iloc[2] == 270.0    # the original DataFrame is unmodified
+
+
+def test_type_one_also_corrects_the_envelope(dataframe):
+    corrected = isotopic_corrections.isotopic_correction(dataframe, sample_columns=['s1'], carbon_column='n_carbons',
+                                                         type_one=True)
+    light = 1000.0 / _binomial(42, 0)
+    heavy = (300.0 - light * _binomial(42, 2)) / _binomial(42, 0)
+    np.testing.assert_allclose(corrected['s1'].iloc[:4].to_numpy(),
+                               [600.0 * light / 1000.0, 400.0 * light / 1000.0, 270.0 * heavy / 300.0,
+                                30.0 * heavy / 300.0])
+
+
+def test_carbons_are_parsed_from_the_names(dataframe):
+    from_names = isotopic_corrections.isotopic_correction(dataframe, sample_columns=['s1', 's2'],
+                                                          head_group_carbons={'PC': 8})
+    from_column = isotopic_corrections.isotopic_correction(dataframe, sample_columns=['s1', 's2'],
+                                                           carbon_column='n_carbons')
+    pd.testing.assert_frame_equal(from_names, from_column)
+
+
+def _brute_force_envelope(composition):
+    """
+    Enumerates every isotopologue, one isotope per atom, and groups them by nominal mass shift.
+    """
+    atoms = []
+    for element, count in composition.items():
+        isotopes = [(int(key[len(element):]), value['mass'], value['abundance'] / 100) for key, value in ISOTOPES.items()
+                    if key[:len(element)] == element and key[len(element):].isdigit()]
+        atoms.extend([isotopes] * count)
+    lightest = sum(min(isotope[0] for isotope in isotopes) for isotopes in atoms)
+    probabilities, moments = defaultdict(float), defaultdict(float)
+    for isotopologue in itertools.product(*atoms):
+        shift = sum(isotope[0] for isotope in isotopologue) - lightest
+        probability = np.prod([isotope[2] for isotope in isotopologue])
+        probabilities[shift] += probability
+        moments[shift] += probability * sum(isotope[1] for isotope in isotopologue)
+    shifts = sorted(probabilities)
+    return (np.array([moments[shift] / probabilities[shift] for shift in shifts]),
+            np.array([probabilities[shift] for shift in shifts]))
+
+
+@pytest.mark.parametrize('formula, composition', [
+    ('C2H6O', {'C': 2, 'H': 6, 'O': 1}),
+    ('C3H7NO2', {'C': 3, 'H': 7, 'N': 1, 'O': 2}),
+    ('CH2Cl2', {'C': 1, 'H': 2, 'Cl': 2}),
+    ('C2H4O2[Na]', {'C': 2, 'H': 4, 'O': 2, 'Na': 1}),
+    ('C2H5O2[-H]', {'C': 2, 'H': 4, 'O': 2}),
+])
+def test_envelope_matches_brute_force_enumeration(formula, composition):
+    threshold = 1e-12
+    calculator = isotopic_corrections.IsotopicEnvelopeCalculator(isotope_distribution_dict=ISOTOPES,
+                                                                 threshold=threshold)
+    masses, abundances = calculator.get_envelope(formula)
+    expected_masses, expected_abundances = _brute_force_envelope(composition)
+    kept = expected_abundances >= threshold
+    np.testing.assert_allclose(abundances, expected_abundances[kept], rtol=1e-9, atol=1e-15)
+    np.testing.assert_allclose(masses, expected_masses[kept], rtol=0, atol=1e-9)
+
+
+def test_envelopes_are_shared_and_missing_formulas_are_empty():
+    calculator = isotopic_corrections.IsotopicEnvelopeCalculator(isotope_distribution_dict=ISOTOPES)
+    envelopes = calculator.get_envelopes(['C2H6O', None, 'H6C2O', np.nan])
+    np.testing.assert_array_equal(envelopes[0][1], envelopes[2][1])
+    for masses, abundances in (envelopes[1], envelopes[3]):
+        assert len(masses) == 0 and len(abundances) == 0
@@ -0,0 +1,104 @@
+"""
+
+Created on: 10/16/2026
+
+This module checks MassPairIndex against the pair by pair get_name_for_mass_pair(), its save/load round trip, and the
+bulk parse_lipid_names() and get_masses_from_names() against hand parsed names and the name by name get_mass_from_name().
+Run it from the root of the project, ex:
+    pytest tests
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from api import molecules_parser
+
+
+@pytest.fixture
+def library():
+    rng = np.random.default_rng(0)
+    library = pd.DataFrame({'precursor': rng.uniform(300, 900, 2000).round(2),
+                            'fragment': rng.uniform(100, 300, 2000).round(2)})
+    library['lipid_name'] = ['L%d' % row for row in range(len(library))]
+    return library
+
+
+@pytest.fixture
+def found(library):
+    found = library.sample(300, random_state=1)[['precursor', 'fragment']] + 0.004
+    found.index = found.index + 10000
+    return found
+
+
+@pytest.mark.parametrize('atol, tolerance', [(True, 0.3), (True, 0.01), (False, 500), (False, 10)])
+def test_annotate_matches_pair_by_pair(library, found, atol, tolerance):
+    matches = molecules_parser.MassPairIndex(library).annotate(found, pm_tolerance=tolerance, atol=atol)
+    for label, row in found.iterrows():
+        expected = molecules_parser.get_name_for_mass_pair(row['precursor'], row['fragment'], library,
+                                                           pm_tolerance=tolerance, atol=atol)
+        assert set(matches.loc[matches['query_index'] == label, 'lipid_name']) == set(expected['lipid_name'])
+
+
+@pytest.mark.parametrize('atol, tolerance', [(True, 0.01), (False, 50)])
+def test_annotate_errors_are_within_tolerance(library, found, atol, tolerance):
+    matches = molecules_parser.MassPairIndex(library).annotate(found, pm_tolerance=tolerance, atol=atol)
+    assert len(matches) >= len(found)
+    assert (np.abs(matches['precursor_error']) <= tolerance).all()
+    assert (np.abs(matches['fragment_error']) <= tolerance).all()
+    diff = matches['query_precursor'] - matches['precursor']
+    expected = diff if atol else diff / matches['query_precursor'] * 1e6
+    np.testing.assert_allclose(matches['precursor_error'], expected)
+
+
+def test_annotate_ppm_window_scales_with_mass():
+    library = pd.DataFrame({'precursor': [100.0, 1000.0], 'fragment': [50.0, 500.0], 'lipid_name': ['light', 'heavy']})
+    # 0.005 Da is 50 ppm of 100 Da but only 5 ppm of 1000 Da
+    found = pd.DataFrame({'precursor': [100.005, 1000.005], 'fragment': [50.0, 500.0]})
+    index = molecules_parser.MassPairIndex(library)
+    assert index.annotate(found, pm_tolerance=10, atol=False)['lipid_name'].tolist() == ['heavy']
+    assert index.annotate(found, pm_tolerance=0.01, atol=True)['lipid_name'].tolist() == ['light', 'heavy']
+
+
+def test_saved_index_is_loaded_unchanged(tmp_path, library, found):
+    index = molecules_parser.MassPairIndex(library)
+    index.save(str(tmp_path / 'library'))
+    loaded = molecules_parser.MassPairIndex.load(str(tmp_path / 'library'))
+    pd.testing.assert_frame_equal(loaded.library, index.library)
+    pd.testing.assert_frame_equal(loaded.annotate(found, pm_tolerance=0.01), index.annotate(found, pm_tolerance=0.01))
+
+
+def test_index_built_from_batches_matches_the_whole_library(library):
+    batches = (library.iloc[start:start + 300] for start in range(0, len(library), 300))
+    built = molecules_parser.build_mass_pair_index(batches)
+    pd.testing.assert_frame_equal(built.library, molecules_parser.MassPairIndex(library).library)
+    assert len(molecules_parser.build_mass_pair_index(iter([]))) == 0
+
+
+NAMES = pd.Series(['PC|34:1|(16:0~18:1)[+H]', 'FAHFA|40:9|(MS2-20:4,20:5)[-H]', 'TAG|52:2|', None, 'not a lipid',
+                   'PC|34:1|(16:0~18:1)[+H]', ' CE|24:0|(24:0)[NH4]'], index=list('abcdefg'))
+ELEMENTS_MASS = {'C': 12.0, 'H': 1.00782503223, 'N': 14.00307400443, 'O': 15.99491461957}
+HEAD_GROUP_MASSES = {'PC': 226.077598, 'FAHFA': 44.997654, 'TAG': 101.0239, 'CE': 386.35487}
+
+
+@pytest.mark.parametrize('names', [NAMES, NAMES.str.replace('not a lipid', 'not a\nlipid')])
+def test_parse_lipid_names(names):
+    parsed = molecules_parser.parse_lipid_names(names)
+    assert parsed.index.equals(names.index)
+    assert parsed['group'].fillna('').tolist() == ['PC', 'FAHFA', 'TAG', '', '', 'PC', 'CE']
+    assert parsed['total_carbons'].tolist() == [34, 40, 52, -1, -1, 34, 24]
+    assert parsed['total_double_bonds'].tolist() == [1, 9, 2, -1, -1, 1, 0]
+    assert parsed['chains'].tolist() == [((16, 0), (18, 1)), ((20, 4), (20, 5)), (), (), (), ((16, 0), (18, 1)), ((24, 0),)]
+    assert parsed['n_chains'].tolist() == [2, 2, 0, 0, 0, 2, 1]
+    assert parsed['adduct'].fillna('').tolist() == ['+H', '-H', '', '', '', '+H', 'NH4']
+
+
+def test_get_masses_from_names_matches_name_by_name():
+    names = NAMES.dropna().drop('e')
+    masses = molecules_parser.get_masses_from_names(names, ELEMENTS_MASS, HEAD_GROUP_MASSES)
+    expected = [molecules_parser.get_mass_from_name(name, ELEMENTS_MASS, HEAD_GROUP_MASSES) for name in names]
+    np.testing.assert_allclose(masses, expected, rtol=0, atol=1e-9)
+    assert np.isnan(molecules_parser.get_masses_from_names(NAMES, ELEMENTS_MASS, HEAD_GROUP_MASSES)[[3, 4]]).all()
+    calculator = molecules_parser.FormulaMassCalculator(elements_mass_dict=ELEMENTS_MASS)
+    with_adducts = molecules_parser.get_masses_from_names(names, ELEMENTS_MASS, HEAD_GROUP_MASSES, calculator=calculator)
+    np.testing.assert_allclose(with_adducts - masses, [ELEMENTS_MASS['H'], -ELEMENTS_MASS['H'], 0.0, ELEMENTS_MASS['H'],
+                                                       ELEMENTS_MASS['N'] + 4 * ELEMENTS_MASS['H']])
@@ -0,0 +1,77 @@
+"""
+
+Created on: 10/16/2026
+
+This module checks that RunCache returns the parsed run, and rebuilds its entry when the source or the schema changes.
+Run it from the root of the project, ex:
+    pytest tests
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from api import file_directory_parser
+from api.run_cache import RunCache
+
+
+@pytest.fixture
+def run_file(tmp_path):
+    run = pd.DataFrame({'lipid_name': ['PC|34:1|', 'PE|36:2|', None, 'PC|34:1|'], 'precursor': [760.58, 744.55, 500.0, 760.58],
+                        'scan': [2 ** 25 + 1, 2 ** 25 + 2, 2 ** 25 + 3, 2 ** 25 + 4], 's1': [1.5, 2.5, 3.5, 4.5]})
+    file_path = str(tmp_path / 'run.csv')
+    run.to_csv(file_path, index=False)
+    return file_path
+
+
+def _rewrite(file_path, run):
+    # the same size and modification time would hide the change, so both are moved on
+    stat = os.stat(file_path)
+    run.to_csv(file_path, index=False)
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_read_returns_the_parsed_run(tmp_path, run_file):
+    cache = RunCache(str(tmp_path / 'cache'))
+    first = cache.read(run_file)
+    assert cache.is_cached(run_file)
+    second = cache.read(run_file)
+    pd.testing.assert_frame_equal(first, second)
+    expected = file_directory_parser.concat_chunks(file_directory_parser.read_data_in_chunks(run_file))
+    assert second['lipid_name'].tolist() == expected['lipid_name'].tolist()
+    assert second['scan'].tolist() == [2 ** 25 + 1, 2 ** 25 + 2, 2 ** 25 + 3, 2 ** 25 + 4]
+    np.testing.assert_array_equal(second['s1'].to_numpy(), expected['s1'].to_numpy())
+
+
+def test_changed_source_is_parsed_again(tmp_path, run_file):
+    cache = RunCache(str(tmp_path / 'cache'))
+    cache.read(run_file)
+    run = pd.read_csv(run_file)
+    run['s1'] = run['s1'] * 10
+    _rewrite(run_file, run)
+    assert not cache.is_cached(run_file)
+    np.testing.assert_allclose(cache.read(run_file)['s1'].to_numpy(), [15.0, 25.0, 35.0, 45.0])
+    # a change of size alone is detected as well
+    run.iloc[:2].to_csv(run_file, index=False)
+    assert len(cache.read(run_file)) == 2
+
+
+def test_another_schema_is_parsed_again(tmp_path, run_file):
+    cache = RunCache(str(tmp_path / 'cache'))
+    assert cache.read(run_file)['s1'].dtype == np.float32
+    schema = {'lipid_name': 'category', 'precursor': np.float64, 'scan': np.int64, 's1': np.float64}
+    assert not cache.is_cached(run_file, dtype_schema=schema)
+    assert cache.read(run_file, dtype_schema=schema)['s1'].dtype == np.float64
+    assert cache.is_cached(run_file, dtype_schema=schema) and not cache.is_cached(run_file)
+
+
+def test_columns_that_change_dtype_between_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_directory_parser, 'SNIFF_ROWS', 4)
+    file_path = str(tmp_path / 'run.csv')
+    pd.DataFrame({'polarity': ['1'] * 6 + ['negative'] * 6, 'adduct': [None] * 6 + ['[M+H]'] * 6,
+                  'count': ['3'] * 6 + ['2.5'] * 6}).to_csv(file_path, index=False)
+    result = RunCache(str(tmp_path / 'cache')).read(file_path, chunk_size=4)
+    assert [str(value) for value in result['polarity']] == ['1'] * 6 + ['negative'] * 6
+    assert result['adduct'].tolist() == [np.nan] * 6 + ['[M+H]'] * 6
+    np.testing.assert_array_equal(result['count'].to_numpy(dtype=np.float64), [3.0] * 6 + [2.5] * 6)
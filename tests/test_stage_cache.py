@@ -0,0 +1,73 @@
+"""
+
+Created on: 10/16/2026
+
+This module checks that StageCache keys change with the code and the parameters of a stage, and that the instance of a
+bound method is keyed by its cache_token(), without the caches it fills.
+Run it from the root of the project, ex:
+    pytest tests
+"""
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from api.molecules_parser import FormulaMassCalculator
+from api.normalization import InternalStandardNormalizer
+from api.stage_cache import StageCache, hash_data
+
+ELEMENTS_MASS = {'C': 12.0, 'H': 1.00782503223, 'N': 14.00307400443, 'O': 15.99491461957, 'P': 30.97376199842}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return StageCache(str(tmp_path / 'stages'))
+
+
+def _scale(dataframe, factor=2):
+    return dataframe * factor
+
+
+def test_key_changes_with_code_and_parameters(cache):
+    input_key = hash_data(pd.DataFrame({'s1': [1.0, 2.0]}))
+    keys = {cache.get_key(_scale, input_key), cache.get_key(_scale, input_key, {'factor': 3}),
+            cache.get_key(lambda dataframe: dataframe * 2, input_key), cache.get_key(lambda dataframe: dataframe + 2, input_key)}
+    assert len(keys) == 4
+    assert cache.get_key(_scale, input_key, {'factor': 3}) == cache.get_key(_scale, input_key, {'factor': 3})
+
+
+def test_bound_methods_are_keyed_by_their_cache_token(cache):
+    formulas = ['C2H6O', 'C3H7NO2[-H]']
+    calculator = FormulaMassCalculator(elements_mass_dict=ELEMENTS_MASS)
+    masses, key = cache.run(calculator.get_masses, formulas)
+    # the formulas parsed by the first run are in the cache of the calculator, but not in the key
+    cached, cached_key = cache.run(calculator.get_masses, formulas)
+    assert cached_key == key
+    np.testing.assert_array_equal(cached, masses)
+    heavier = FormulaMassCalculator(elements_mass_dict=dict(ELEMENTS_MASS, C=12.1))
+    assert cache.run(heavier.get_masses, formulas)[1] != key
+    # a LRU cache wrapper of a bound method is keyed by the method it wraps
+    input_key = hash_data(formulas)
+    assert (cache.get_key(lru_cache()(calculator.get_mass), input_key)
+            != cache.get_key(lru_cache()(heavier.get_mass), input_key))
+
+
+def test_normalizer_is_cached_once_its_mapping_is_filled(cache):
+    normalizer = InternalStandardNormalizer(pd.DataFrame({'lipid_name': ['PC|28:0|(14:0~14:0)'], 'concentration': [10.0]}))
+    dataframe = pd.DataFrame({'lipid_name': ['PC|28:0|(14:0~14:0)', 'PC|34:1|'], 's1': [2.0, 4.0]})
+    parameters = {'sample_columns': ['s1']}
+    normalized, key = cache.run(normalizer.normalize, dataframe, parameters)
+    assert cache.contains(key)
+    cached, cached_key = cache.run(normalizer.normalize, dataframe, parameters)
+    assert cached_key == key
+    pd.testing.assert_frame_equal(cached, normalized)
+
+
+def test_methods_without_cache_token_are_refused(cache):
+    class Scaler(object):
+        def scale(self, dataframe):
+            return dataframe * 2
+
+    with pytest.raises(TypeError, match='cache_token'):
+        cache.get_key(Scaler().scale, hash_data(1))
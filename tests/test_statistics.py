@@ -0,0 +1,77 @@
+"""
+
+Created on: 10/16/2026
+
+This module checks that the vectorized tests of api.statistics give the same results as scipy.stats applied to each row.
+Run it from the root of the project, ex:
+    pytest tests
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from api import statistics
+
+GROUPS = [['a0', 'a1', 'a2', 'a3'], ['b0', 'b1', 'b2'], ['c0', 'c1', 'c2', 'c3', 'c4']]
+
+
+@pytest.fixture
+def dataframe():
+    rng = np.random.default_rng(0)
+    columns = [column for group in GROUPS for column in group]
+    values = rng.lognormal(mean=6, sigma=1, size=(200, len(columns)))
+    values[rng.random(values.shape) < 0.1] = np.nan
+    values[0, :4] = np.nan    # a row without any value in the first group
+    values[1, 1:4] = np.nan    # a row with a single value in the first group
+    return pd.DataFrame(values, columns=columns)
+
+
+def _row_values(dataframe, row, group):
+    values = dataframe.loc[row, group].to_numpy(dtype=np.float64)
+    return values[~np.isnan(values)]
+
+
+def test_welch_t_test_matches_scipy(dataframe):
+    result = statistics.welch_t_test(dataframe, group_a=GROUPS[0], group_b=GROUPS[1])
+    for row in dataframe.index:
+        first, second = _row_values(dataframe, row, GROUPS[0]), _row_values(dataframe, row, GROUPS[1])
+        if len(first) < 2 or len(second) < 2:
+            assert np.isnan(result.loc[row, 'p_value'])
+            continue
+        expected = stats.ttest_ind(first, second, equal_var=False)
+        assert result.loc[row, 't_statistic'] == pytest.approx(expected.statistic, rel=1e-9)
+        assert result.loc[row, 'p_value'] == pytest.approx(expected.pvalue, rel=1e-9)
+
+
+def test_one_way_anova_matches_scipy(dataframe):
+    result = statistics.one_way_anova(dataframe, groups=GROUPS)
+    for row in dataframe.index:
+        samples = [values for values in (_row_values(dataframe, row, group) for group in GROUPS) if len(values)]
+        expected = stats.f_oneway(*samples)
+        assert result.loc[row, 'f_statistic'] == pytest.approx(expected.statistic, rel=1e-9)
+        assert result.loc[row, 'p_value'] == pytest.approx(expected.pvalue, rel=1e-9)
+
+
+def test_benjamini_hochberg_matches_scipy():
+    p_values = np.random.default_rng(1).random(500) ** 3
+    np.testing.assert_allclose(statistics.benjamini_hochberg(p_values), stats.false_discovery_control(p_values),
+                               rtol=1e-12)
+
+
+def test_benjamini_hochberg_skips_missing_p_values():
+    p_values = np.array([0.01, np.nan, 0.04, 0.03])
+    adjusted = statistics.benjamini_hochberg(p_values)
+    assert np.isnan(adjusted[1])
+    np.testing.assert_allclose(adjusted[[0, 2, 3]], stats.false_discovery_control(p_values[[0, 2, 3]]), rtol=1e-12)
+
+
+def test_compare_groups_uses_the_same_tests(dataframe):
+    two_groups = statistics.compare_groups(dataframe, groups=GROUPS[:2])
+    welch = statistics.welch_t_test(dataframe, group_a=GROUPS[0], group_b=GROUPS[1])
+    np.testing.assert_array_equal(two_groups['p_value'].to_numpy(), welch['p_value'].to_numpy())
+    three_groups = statistics.compare_groups(dataframe, groups=GROUPS, group_names=['a', 'b', 'c'])
+    anova = statistics.one_way_anova(dataframe, groups=GROUPS)
+    np.testing.assert_array_equal(three_groups['p_value'].to_numpy(), anova['p_value'].to_numpy())
+    np.testing.assert_array_equal(three_groups['adjusted_p_value'].to_numpy(),
+                                  statistics.benjamini_hochberg(anova['p_value']))